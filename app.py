@@ -1,37 +1,162 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session
+from flask import Flask, Response, render_template, request, jsonify, redirect, url_for, flash, session, g
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.utils import secure_filename
 import pandas as pd
 import numpy as np
 import os
 import json
+import time
+import gzip
 from init_db import init_db
 from datetime import datetime
 from models.data_processor import DataProcessor
-from models.analyzer import DataAnalyzer
-from models.visualizer import DataVisualizer
+from models.dataset_registry import DatasetRegistry
+from models.dataset_cache import DatasetCache
+from models.result_cache import ResultCache
+from models.binning import BinningService
+from models.correlation import CorrelationEngine, parse_top_k
+from models.sketches import DatasetSketches
+from models.job_manager import JobManager, JobStore, JobQueueFullError
+from models.shared_store import SharedDatasetStore
 from models.user import User
 from models.ai_explainer import AIExplainer
+from models.explanation_cache import ExplanationCache
+from models.excel_reader import ExcelReader, EXCEL_EXTENSIONS
+from models import metrics
+from models.metrics import stage, observe_size
 from dotenv import load_dotenv
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 load_dotenv()
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max-limit
-app.secret_key = os.urandom(24)  # 为session设置密钥
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_UPLOAD_SIZE', 4 * 1024 * 1024 * 1024))  # 默认4GB上限
+app.config['STREAMING_INGEST_THRESHOLD'] = 16 * 1024 * 1024  # 超过该大小的CSV分块流式处理
+app.config['INGEST_CHUNK_SIZE'] = 100000  # 流式处理时每块的行数
+app.config['DATASET_MEMORY_BUDGET'] = int(os.getenv('DATASET_MEMORY_BUDGET', 512 * 1024 * 1024))  # 数据集内存预算
+app.config['DATASET_SPILL_FOLDER'] = 'data/spill'  # 超出预算的数据集写入此目录
+app.config['DATASET_CACHE_FOLDER'] = 'data/cache'  # 处理结果的列式缓存目录
+# 多进程共享的数据集目录，默认放在内存文件系统中
+app.config['DATASET_SHARED_FOLDER'] = os.getenv(
+    'DATASET_SHARED_FOLDER', '/dev/shm/data-analytics' if os.path.isdir('/dev/shm') else 'data/shared')
+# 共享目录中数据集的总大小上限，超出时最久未使用的数据集移到磁盘
+app.config['DATASET_SHARED_BUDGET'] = int(os.getenv('DATASET_SHARED_BUDGET', app.config['DATASET_MEMORY_BUDGET']))
+app.config['DATASET_SHARED_OVERFLOW_FOLDER'] = 'data/spill/shared'  # 超出共享预算的数据集写入此目录
+app.config['DATASET_SHARED_TTL'] = 7 * 24 * 3600  # 超过该时间（秒）未使用的共享数据集会被删除
+app.config['BUILD_SKETCHES_ON_INGEST'] = True  # 上传时构建近似统计草图
+app.config['ANALYSIS_CACHE_ENTRIES'] = 256  # 分析结果缓存条目上限
+app.config['ANALYSIS_CACHE_BYTES'] = 64 * 1024 * 1024  # 分析结果缓存大小上限
+app.config['BINNING_CACHE_ENTRIES'] = 512  # 分箱结果缓存条目上限
+app.config['BINNING_CACHE_BYTES'] = 64 * 1024 * 1024  # 分箱结果缓存大小上限
+app.config['CORRELATION_CACHE_ENTRIES'] = 64  # 相关系数矩阵缓存条目上限
+app.config['CORRELATION_CACHE_BYTES'] = 256 * 1024 * 1024  # 相关系数矩阵缓存大小上限
+app.config['COMPRESS_MIN_SIZE'] = 1024  # 超过该大小的JSON响应才压缩
+app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', 4))  # 后台分析任务的线程数
+app.config['JOB_MAX_PENDING'] = 64  # 排队和运行中的任务数上限
+app.config['JOB_TTL'] = 3600  # 已结束任务的保留时间（秒）
+app.config['JOB_EVENT_KEEPALIVE'] = 15  # 事件流心跳间隔（秒）
+app.config['JOB_EVENT_TIMEOUT'] = 1800  # 单个事件流连接的最长时间（秒），超时后客户端改为轮询
+app.config['JOB_STALE_AFTER'] = 60  # 执行进程超过该时间（秒）没有心跳的未结束任务标记为失败
+app.config['EXPLANATION_CACHE_TTL'] = 7 * 24 * 3600  # AI解释缓存的有效期（秒）
+app.config['EXPLANATION_CACHE_ENTRIES'] = 1000  # AI解释缓存条目上限
+app.config['EXPLANATION_UPDATE_INTERVAL'] = 0.2  # 流式解释写入任务状态的最小间隔（秒）
+app.config['METRICS_TRACE_MEMORY'] = os.getenv('METRICS_TRACE_MEMORY') == '1'  # 记录各阶段峰值内存（较慢）
+app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')  # 设置后 /metrics 需要携带该Bearer令牌
+app.config['PROFILE_HEADER'] = 'X-Profile'  # 请求带有该头时在Server-Timing中返回各阶段耗时
+
+# 多个工作进程共用同一份数据库，导入时即初始化（建表语句可重复执行）
+init_db()
+
+def load_secret_key(path='data/secret_key'):
+    """读取session密钥，多个工作进程必须使用相同的密钥，未配置时生成一次并保存到文件"""
+    key = os.getenv('SECRET_KEY')
+    if key:
+        return key
+    try:
+        # 并发启动的进程中只有一个能创建文件，其余进程读取它写入的密钥
+        with open(path, 'x') as f:
+            key = os.urandom(24).hex()
+            f.write(key)
+        return key
+    except FileExistsError:
+        for _ in range(50):
+            with open(path) as f:
+                key = f.read().strip()
+            if key:
+                return key
+            time.sleep(0.1)
+        raise RuntimeError("无法读取session密钥文件")
+
+app.secret_key = load_secret_key()  # 为session设置密钥
 
 # 确保上传目录存在
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# 初始化处理器
-data_processor = DataProcessor()
-data_analyzer = DataAnalyzer()
-data_visualizer = DataVisualizer()
-ai_explainer = AIExplainer(api_key=os.getenv('DASHSCOPE_API_KEY'))  # 从环境变量获取API密钥
+if app.config['METRICS_TRACE_MEMORY']:
+    metrics.enable_memory_tracing()
+
+# 相同提示词的AI解释缓存在数据库中
+explanation_cache = ExplanationCache(
+    db_path='data/database.db',
+    ttl=app.config['EXPLANATION_CACHE_TTL'],
+    max_entries=app.config['EXPLANATION_CACHE_ENTRIES']
+)
+
+# 初始化AI解释器
+ai_explainer = AIExplainer(api_key=os.getenv('DASHSCOPE_API_KEY'), cache=explanation_cache)  # 从环境变量获取API密钥
+
+# 所有数据集共享的分析结果缓存
+analysis_cache = ResultCache(
+    max_entries=app.config['ANALYSIS_CACHE_ENTRIES'],
+    max_bytes=app.config['ANALYSIS_CACHE_BYTES']
+)
+
+# 分布分析和直方图、柱状图、箱线图共用的分箱结果缓存
+binning_cache = BinningService(
+    max_entries=app.config['BINNING_CACHE_ENTRIES'],
+    max_bytes=app.config['BINNING_CACHE_BYTES']
+)
+
+# 相关性分析和热力图共用的相关系数矩阵缓存
+correlation_engine = CorrelationEngine(
+    max_entries=app.config['CORRELATION_CACHE_ENTRIES'],
+    max_bytes=app.config['CORRELATION_CACHE_BYTES']
+)
+
+# 按用户和数据集ID存储数据快照
+# 数据集发布到共享存储，各工作进程以内存映射方式读取同一份数据
+shared_store = SharedDatasetStore(
+    root=app.config['DATASET_SHARED_FOLDER'],
+    budget=app.config['DATASET_SHARED_BUDGET'],
+    overflow_dir=app.config['DATASET_SHARED_OVERFLOW_FOLDER'],
+    ttl=app.config['DATASET_SHARED_TTL']
+)
+
+dataset_registry = DatasetRegistry(
+    memory_budget=app.config['DATASET_MEMORY_BUDGET'],
+    spill_dir=app.config['DATASET_SPILL_FOLDER'],
+    analysis_cache=analysis_cache,
+    store=shared_store,
+    binning=binning_cache,
+    correlation=correlation_engine
+)
+
+# 按文件内容缓存处理后的数据集
+dataset_cache = DatasetCache(cache_dir=app.config['DATASET_CACHE_FOLDER'])
 
-# 存储当前数据
-current_data = None
+# 后台执行分析任务
+job_manager = JobManager(
+    max_workers=app.config['JOB_WORKERS'],
+    max_pending=app.config['JOB_MAX_PENDING'],
+    ttl=app.config['JOB_TTL'],
+    # 任务状态写入数据库，请求可以落到任意工作进程
+    store=JobStore(stale_after=app.config['JOB_STALE_AFTER'])
+)
 
 # 初始化Flask-Login
 login_manager = LoginManager()
@@ -86,7 +211,23 @@ def logout():
 def index():
     return render_template('index.html')
 
+def invalid_correlation_options(options):
+    """检查相关性分析的选项，top_k 不是正整数时返回错误信息"""
+    if not isinstance(options, dict) or options.get('top_k') is None:
+        return None
+    try:
+        parse_top_k(options['top_k'])
+    except ValueError as e:
+        return str(e)
+    return None
+
+def get_current_dataset(dataset_id=None):
+    """获取当前用户的数据快照，未指定ID时使用session中记录的数据集"""
+    dataset_id = dataset_id or session.get('dataset_id')
+    return dataset_registry.get(current_user.id, dataset_id)
+
 @app.route('/upload', methods=['POST'])
+@login_required
 def upload_file():
     if 'file' not in request.files:
         return jsonify({'error': '没有文件被上传'}), 400
@@ -98,33 +239,109 @@ def upload_file():
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        with stage('upload.save'):
+            file.save(filepath)
+        observe_size('upload', os.path.getsize(filepath))
         
         # 读取并处理数据
         try:
-            global current_data
-            # 根据文件扩展名选择读取方式
-            if filename.endswith('.csv'):
-                df = pd.read_csv(filepath, encoding='utf-8')
-            elif filename.endswith(('.xlsx', '.xls')):
-                df = pd.read_excel(filepath, engine='openpyxl')
-            # 保存处理后的数据
-            current_data = data_processor.process_data(df)
-            # 设置数据给分析器和可视化器
-            data_analyzer.data = current_data
-            data_visualizer.set_data(current_data)
+            # 每次上传使用独立的处理器，避免并发上传互相覆盖
+            processor = DataProcessor()
+            file_format = filename.rsplit('.', 1)[1].lower()
+            # Excel文件可以指定工作表和单元格范围（如 A1:G1000），未指定时读取第一个工作表的全部数据
+            sheet = request.form.get('sheet') or None
+            cell_range = request.form.get('range') or None
+            # 相同内容的文件直接读取缓存的处理结果
+            cache_key = dataset_cache.make_key(filepath, {
+                **processor.config_signature(),
+                'format': file_format,
+                'sheet': sheet,
+                'range': cell_range
+            })
+            with stage('upload.cache_load'):
+                processed = dataset_cache.load(cache_key)
+            if processed is None:
+                if filename.endswith('.csv') and \
+                        os.path.getsize(filepath) > app.config['STREAMING_INGEST_THRESHOLD']:
+                    # 大文件分块流式读取和清洗
+                    processed = processor.process_csv_stream(
+                        filepath, chunksize=app.config['INGEST_CHUNK_SIZE'], encoding='utf-8')
+                elif file_format in EXCEL_EXTENSIONS:
+                    # Excel逐行流式解析，不在内存中构建整个工作簿
+                    processed = processor.process_excel_stream(
+                        filepath, sheet=sheet, cell_range=cell_range, chunksize=app.config['INGEST_CHUNK_SIZE'])
+                else:
+                    with stage('upload.read'):
+                        raw = read_data_file(filepath, filename)
+                    processed = processor.process_data(raw)
+                with stage('upload.cache_save'):
+                    dataset_cache.save(cache_key, processed)
+            # 上传时一次性构建草图，近似统计查询无需再扫描数据
+            with stage('upload.sketches'):
+                sketches = DatasetSketches.from_frame(processed) \
+                    if app.config['BUILD_SKETCHES_ON_INGEST'] else None
+            # 保存为当前用户的数据快照
+            with stage('upload.publish'):
+                snapshot = dataset_registry.put(current_user.id, processed,
+                                                dataset_id=request.form.get('dataset_id'),
+                                                sketches=sketches)
+            session['dataset_id'] = snapshot.dataset_id
             
-            return jsonify({
+            response = {
                 'message': '文件上传成功',
-                'columns': list(current_data.columns),
-                'preview': current_data.head().to_dict()
-            })
+                'dataset_id': snapshot.dataset_id,
+                'columns': list(processed.columns),
+                # 日期列按ISO格式输出预览
+                'preview': json.loads(processed.head().to_json(date_format='iso', force_ascii=False))
+            }
+            if file_format in EXCEL_EXTENSIONS:
+                # 返回所有工作表名称，前端可以选择其他工作表重新上传
+                response['sheets'] = ExcelReader(filepath).sheet_names()
+            return jsonify(response)
         except Exception as e:
             return jsonify({'error': f'数据处理错误: {str(e)}'}), 500
     
     return jsonify({'error': '不支持的文件类型'}), 400
 
+@app.route('/append', methods=['POST'])
+@login_required
+def append_file():
+    if 'file' not in request.files:
+        return jsonify({'error': '没有文件被上传'}), 400
+    
+    file = request.files['file']
+    if file.filename == '' or not allowed_file(file.filename):
+        return jsonify({'error': '不支持的文件类型'}), 400
+    
+    dataset_id = request.form.get('dataset_id') or session.get('dataset_id')
+    snapshot = get_current_dataset(dataset_id)
+    if snapshot is None:
+        return jsonify({'error': '请先上传数据'}), 400
+    
+    filename = secure_filename(file.filename)
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    file.save(filepath)
+    
+    try:
+        raw = read_data_file(filepath, filename, sheet=request.form.get('sheet') or None,
+                             cell_range=request.form.get('range') or None)
+        # 新数据只与快照中保存的行哈希比较去重，不重新扫描已有数据
+        combined, new_rows, row_hashes = DataProcessor().append_data(snapshot.data, raw,
+                                                                     existing_hashes=snapshot.row_hashes)
+        # 新快照的统计量只用新增行增量更新
+        snapshot = dataset_registry.append(current_user.id, combined, new_rows,
+                                           dataset_id=snapshot.dataset_id, row_hashes=row_hashes)
+        return jsonify({
+            'message': '数据追加成功',
+            'dataset_id': snapshot.dataset_id,
+            'appended_rows': int(len(new_rows)),
+            'total_rows': int(len(combined))
+        })
+    except Exception as e:
+        return jsonify({'error': f'数据处理错误: {str(e)}'}), 500
+
 @app.route('/analyze', methods=['POST'])
+@login_required
 def analyze_data():
     try:
         params = request.get_json()
@@ -133,19 +350,203 @@ def analyze_data():
         
         if not analysis_type or not columns:
             return jsonify({'error': '缺少必要参数'}), 400
+        if analysis_type == 'correlation':
+            error = invalid_correlation_options(params.get('options', {}))
+            if error:
+                return jsonify({'error': error}), 400
         
-        # 执行分析
-        result = data_analyzer.analyze(analysis_type, columns)
+        snapshot = get_current_dataset(params.get('dataset_id'))
+        if snapshot is None:
+            return jsonify({'error': '请先上传数据'}), 400
         
-        # 生成AI解释
+        # 分析和AI解释在后台执行，立即返回任务ID
+        # 请求了性能明细时，任务各阶段的耗时记录在任务状态的 profile 字段中
+        profile = metrics.Profile() if metrics.current_profile() is not None else None
+        job = job_manager.submit(current_user.id, run_analysis_job, snapshot,
+                                 analysis_type, columns, params.get('options', {}), profile=profile)
+        return jsonify({
+            'job_id': job.id,
+            'status_url': url_for('job_status', job_id=job.id),
+            'events_url': url_for('job_events', job_id=job.id)
+        }), 202
+    except JobQueueFullError as e:
+        return jsonify({'error': str(e)}), 429
+    except Exception as e:
+        return jsonify({'error': f'分析错误: {str(e)}'}), 500
+
+def run_analysis_job(job, snapshot, analysis_type, columns, options, profile=None):
+    """后台执行分析，profile 不为None时收集各阶段耗时并写入任务"""
+    with metrics.profiling(profile):
         try:
-            explanation = ai_explainer.generate_explanation(analysis_type, result, columns)
-        except Exception as e:
-            explanation = f"生成解释时出错: {str(e)}"
+            analyze_and_explain(job, snapshot, analysis_type, columns, options)
+        finally:
+            if profile is not None:
+                job.update(profile=profile.to_list())
+
+def analyze_and_explain(job, snapshot, analysis_type, columns, options):
+    """分析结果先写入任务，再生成AI解释"""
+    job.update(stage='analyzing', progress=0.1)
+    try:
+        # options 中的参数传给具体的分析方法（如 approximate）
+        result = snapshot.analyzer.analyze(analysis_type, columns, **options)
+        # 结果在状态接口和事件流中返回，提前检查能否序列化
+        with stage('analyze.serialize'):
+            payload = json.dumps(result)
+        observe_size('analysis_result', len(payload))
+    except Exception as e:
+        raise RuntimeError(f'分析错误: {str(e)}')
+    job.update(stage='explaining', progress=0.5, result=result)
+    if job.cancelled:
+        return
+    
+    # 流式生成AI解释，已生成的部分按固定间隔写入任务，取消任务时停止生成
+    parts = []
+    last_update = time.monotonic()
+    stream = ai_explainer.stream_explanation(analysis_type, result, columns)
+    try:
+        for delta in stream:
+            parts.append(delta)
+            if job.cancelled:
+                return
+            if time.monotonic() - last_update >= app.config['EXPLANATION_UPDATE_INTERVAL']:
+                job.update(explanation=''.join(parts))
+                last_update = time.monotonic()
+    except Exception as e:
+        parts = [f"生成解释时出错: {str(e)}"]
+    finally:
+        stream.close()
+    job.update(explanation=''.join(parts))
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+@login_required
+def job_status(job_id):
+    job = job_manager.get(job_id, current_user.id)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_job(job_id):
+    job = job_manager.cancel(job_id, current_user.id)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+@login_required
+def job_events(job_id):
+    """以server-sent events推送任务进度，任务结束或超过 JOB_EVENT_TIMEOUT 后关闭连接"""
+    job = job_manager.get(job_id, current_user.id)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    
+    def generate():
+        current = job
+        seq = -1
+        result_sent = False
+        deadline = time.monotonic() + app.config['JOB_EVENT_TIMEOUT']
+        while time.monotonic() < deadline:
+            # 任务在其他工作进程中执行时从数据库轮询最新状态
+            current = job_manager.wait_for_update(current, seq, timeout=min(
+                app.config['JOB_EVENT_KEEPALIVE'], max(deadline - time.monotonic(), 0)))
+            if current.seq == seq:
+                # 定期发送注释行，避免代理断开空闲连接
+                yield ': keepalive\n\n'
+                continue
+            seq = current.seq
+            status = current.to_dict()
+            # 分析结果只推送一次，之后的事件只携带进度和解释
+            if result_sent:
+                status.pop('analysis_result')
+            result_sent = status.get('analysis_result') is not None or result_sent
+            payload = json.dumps(status, ensure_ascii=False)
+            yield f'id: {seq}\ndata: {payload}\n\n'
+            if current.finished:
+                break
+    
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/analyze/batch', methods=['POST'])
+@login_required
+def analyze_batch():
+    """对同一组列执行多种分析，共用数值矩阵并行计算，结果在一个响应中返回"""
+    try:
+        params = request.get_json()
+        analysis_types = params.get('types', [])
+        columns = params.get('columns', [])
+        
+        if not analysis_types or not columns:
+            return jsonify({'error': '缺少必要参数'}), 400
+        error = invalid_correlation_options(params.get('options', {}).get('correlation'))
+        if error:
+            return jsonify({'error': error}), 400
+        
+        snapshot = get_current_dataset(params.get('dataset_id'))
+        if snapshot is None:
+            return jsonify({'error': '请先上传数据'}), 400
+        
+        # options 按分析类型给出参数，例如 {"clustering": {"n_clusters": "auto"}}
+        results, errors = snapshot.analyzer.analyze_batch(analysis_types, columns, params.get('options', {}))
+        # 无法序列化的结果按单个分析失败处理，不影响其他结果
+        for analysis_type in list(results):
+            try:
+                with stage('analyze.serialize'):
+                    payload = json.dumps(results[analysis_type])
+                observe_size('analysis_result', len(payload))
+            except (TypeError, ValueError) as e:
+                del results[analysis_type]
+                errors[analysis_type] = str(e)
+        return jsonify({
+            'analysis_results': results,
+            'errors': {analysis_type: f'分析错误: {message}' for analysis_type, message in errors.items()}
+        })
+    except Exception as e:
+        return jsonify({'error': f'分析错误: {str(e)}'}), 500
+
+@app.route('/analyze/pca/projection', methods=['POST'])
+@login_required
+def pca_projection():
+    try:
+        params = request.get_json()
+        columns = params.get('columns', [])
+        if not columns:
+            return jsonify({'error': '缺少必要参数'}), 400
         
+        snapshot = get_current_dataset(params.get('dataset_id'))
+        if snapshot is None:
+            return jsonify({'error': '请先上传数据'}), 400
+        
+        # 分页返回投影结果，options 与 /analyze 的PCA参数一致
+        result = snapshot.analyzer.pca_projection(
+            columns,
+            offset=params.get('offset', 0),
+            limit=params.get('limit', 1000),
+            **params.get('options', {})
+        )
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': f'分析错误: {str(e)}'}), 500
+
+@app.route('/profile', methods=['GET'])
+@login_required
+def profile_dataset():
+    """一次计算数据集所有列的描述性统计，approximate=1 时从草图返回近似结果"""
+    try:
+        snapshot = get_current_dataset(request.args.get('dataset_id'))
+        if snapshot is None:
+            return jsonify({'error': '请先上传数据'}), 400
+
+        columns = list(snapshot.data.columns)
+        approximate = request.args.get('approximate', '').lower() in ('1', 'true')
+        # 与 summary_stats 分析共用结果缓存
+        options = {'approximate': True} if approximate else {}
+        profile = snapshot.analyzer.analyze('summary_stats', columns, **options)
         return jsonify({
-            'analysis_result': result,
-            'explanation': explanation
+            'rows': int(len(snapshot.data)),
+            'columns': columns,
+            'profile': profile
         })
     except Exception as e:
         return jsonify({'error': f'分析错误: {str(e)}'}), 500
@@ -153,20 +554,23 @@ def analyze_data():
 @app.route('/visualize', methods=['POST'])
 @login_required
 def visualize():
-    if current_data is None or current_data.empty:
-        return jsonify({'error': '请先上传数据'})
-    
     try:
         data = json.loads(request.data)
         viz_type = data.get('type')
         columns = data.get('columns', [])
         
+        snapshot = get_current_dataset(data.get('dataset_id'))
+        if snapshot is None or snapshot.data.empty:
+            return jsonify({'error': '请先上传数据'})
+        
         if not viz_type or not columns:
             return jsonify({'error': '请选择图表类型和数据列'})
         
         # 生成可视化
-        viz_result = data_visualizer.visualize(viz_type, columns)
-        return jsonify(viz_result)
+        # options 中可以传入视口宽度和缩放范围，用于控制返回的点数
+        viz_json = snapshot.visualizer.visualize(viz_type, columns, **data.get('options', {}))
+        # 图表已经是JSON字符串，直接作为响应体返回
+        return Response(viz_json, mimetype='application/json')
     except Exception as e:
         return jsonify({'error': str(e)})
 
@@ -193,9 +597,157 @@ def get_viz_explanation():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/get_viz_explanation/stream', methods=['POST'])
+@login_required
+def stream_viz_explanation():
+    """以server-sent events逐段返回图表解释"""
+    data = request.get_json()
+    viz_type = data.get('type')
+    viz_result = data.get('viz_result')
+    columns = data.get('columns', [])
+    
+    if not viz_type or not viz_result or not columns:
+        return jsonify({'error': '缺少必要参数'}), 400
+    
+    def generate():
+        stream = ai_explainer.stream_explanation(f"visualization_{viz_type}", viz_result, columns)
+        try:
+            for delta in stream:
+                yield f"data: {json.dumps({'delta': delta}, ensure_ascii=False)}\n\n"
+            yield 'event: done\ndata: {}\n\n'
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': f'生成解释时出错: {str(e)}'}, ensure_ascii=False)}\n\n"
+        finally:
+            # 客户端断开时服务器关闭本生成器，随之关闭上游的模型请求
+            stream.close()
+    
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/datasets', methods=['GET'])
+@login_required
+def list_datasets():
+    return jsonify({
+        'datasets': dataset_registry.list_datasets(current_user.id),
+        'current': session.get('dataset_id')
+    })
+
+@app.route('/datasets/<dataset_id>', methods=['DELETE'])
+@login_required
+def delete_dataset(dataset_id):
+    if dataset_id not in dataset_registry.list_datasets(current_user.id):
+        return jsonify({'error': '数据集不存在'}), 404
+    dataset_registry.remove(current_user.id, dataset_id)
+    if session.get('dataset_id') == dataset_id:
+        session.pop('dataset_id')
+    return jsonify({'message': '数据集已删除', 'dataset_id': dataset_id})
+
+@app.route('/cache/stats', methods=['GET'])
+@login_required
+def cache_stats():
+    return jsonify({
+        'analysis': analysis_cache.stats(),
+        'binning': binning_cache.stats(),
+        'correlation': correlation_engine.stats(),
+        'explanation': explanation_cache.stats()
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """以Prometheus文本格式输出当前进程的阶段耗时、数据大小、请求数和缓存统计"""
+    token = app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return jsonify({'error': '未授权'}), 401
+    
+    analysis = analysis_cache.stats()
+    binning = binning_cache.stats()
+    correlation = correlation_engine.stats()
+    explanation = explanation_cache.stats()
+    counters = {
+        'app_analysis_cache_hits_total': ('分析结果缓存命中数', analysis['hits']),
+        'app_analysis_cache_misses_total': ('分析结果缓存未命中数', analysis['misses']),
+        'app_binning_cache_hits_total': ('分箱结果缓存命中数', binning['hits']),
+        'app_binning_cache_misses_total': ('分箱结果缓存未命中数', binning['misses']),
+        'app_correlation_cache_hits_total': ('相关系数矩阵缓存命中数', correlation['hits']),
+        'app_correlation_cache_misses_total': ('相关系数矩阵缓存未命中数', correlation['misses']),
+        'app_explanation_cache_hits_total': ('AI解释缓存命中数', explanation['hits']),
+        'app_explanation_cache_misses_total': ('AI解释缓存未命中数', explanation['misses'])
+    }
+    gauges = {
+        'app_analysis_cache_entries': ('分析结果缓存条目数', analysis['entries']),
+        'app_analysis_cache_bytes': ('分析结果缓存大小', analysis['bytes']),
+        'app_binning_cache_entries': ('分箱结果缓存条目数', binning['entries']),
+        'app_binning_cache_bytes': ('分箱结果缓存大小', binning['bytes']),
+        'app_correlation_cache_entries': ('相关系数矩阵缓存条目数', correlation['entries']),
+        'app_correlation_cache_bytes': ('相关系数矩阵缓存大小', correlation['bytes']),
+        'app_explanation_cache_entries': ('AI解释缓存条目数', explanation['entries']),
+        'app_dataset_memory_bytes': ('本进程内存中的数据集大小', dataset_registry.memory_usage()),
+        'app_shared_dataset_bytes': ('共享目录中的数据集大小', shared_store.memory_usage())
+    }
+    body = metrics.registry.render(counters=counters, gauges=gauges)
+    return Response(body, mimetype='text/plain', content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.before_request
+def start_request_metrics():
+    """记录请求开始时间，请求头要求性能明细时开始收集各阶段耗时"""
+    g.request_started = time.perf_counter()
+    if request.headers.get(app.config['PROFILE_HEADER']):
+        g.profile_token = metrics.activate_profile(metrics.Profile())
+
+@app.after_request
+def record_request_metrics(response):
+    """记录请求耗时和状态码，并把各阶段耗时写入Server-Timing响应头"""
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.registry.observe('app_http_request_duration_seconds', elapsed,
+                             endpoint=endpoint, method=request.method)
+    metrics.registry.inc('app_http_requests_total', endpoint=endpoint, method=request.method,
+                         status=str(response.status_code))
+    profile = metrics.current_profile()
+    if profile is not None:
+        response.headers['Server-Timing'] = profile.server_timing(total=elapsed)
+    return response
+
+@app.teardown_request
+def stop_request_profile(exc=None):
+    token = g.pop('profile_token', None)
+    if token is not None:
+        metrics.deactivate_profile(token)
+
+@app.after_request
+def compress_response(response):
+    """按客户端支持的编码压缩较大的JSON响应"""
+    if response.direct_passthrough or response.is_streamed or \
+            'Content-Encoding' in response.headers or response.mimetype != 'application/json':
+        return response
+    
+    body = response.get_data()
+    if len(body) < app.config['COMPRESS_MIN_SIZE']:
+        return response
+    
+    accept_encoding = request.headers.get('Accept-Encoding', '')
+    if brotli is not None and 'br' in accept_encoding:
+        response.set_data(brotli.compress(body, quality=4))
+        response.headers['Content-Encoding'] = 'br'
+    elif 'gzip' in accept_encoding:
+        response.set_data(gzip.compress(body, compresslevel=5))
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        return response
+    response.headers.add('Vary', 'Accept-Encoding')
+    return response
+
+def read_data_file(filepath, filename, sheet=None, cell_range=None):
+    """根据文件扩展名读取为数据框，Excel文件可以指定工作表和单元格范围"""
+    if filename.endswith('.csv'):
+        return pd.read_csv(filepath, encoding='utf-8')
+    return ExcelReader(filepath, sheet=sheet, cell_range=cell_range).read_frame()
+
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'csv', 'xlsx', 'xls'}
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'csv'} | EXCEL_EXTENSIONS
 
 if __name__ == '__main__':
-    init_db() # 初始化数据库
     app.run(debug=True)
\ No newline at end of file
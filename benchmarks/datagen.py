@@ -0,0 +1,62 @@
+import argparse
+import numpy as np
+import pandas as pd
+
+# 与 sample_data.csv 相同的列和取值范围
+CATEGORIES = ['电子产品', '服装', '食品', '家居', '图书']
+REGIONS = ['北京', '上海', '广州', '深圳', '成都', '杭州']
+PRICES = [159, 199, 299, 399, 599, 899, 1299, 2999, 3999, 5999]
+START_DATE = '2023-01-01'
+DAYS = 730
+
+
+def generate_sales_data(rows, seed=42, missing_ratio=0.01, duplicate_ratio=0.01):
+    """生成与示例数据结构相同的销售数据
+
+    各列的类型与 pd.read_csv 读取示例文件的结果一致（日期和文本列为字符串），
+    按 missing_ratio 在数值列和文本列中置空，按 duplicate_ratio 混入重复行，
+    使处理流程中的去重和缺失值填充都有实际工作量。相同的 seed 生成相同的数据。
+    """
+    rows = int(rows)
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(START_DATE, periods=DAYS).strftime('%Y-%m-%d').to_numpy(dtype=object)
+    columns = {
+        '日期': dates[rng.integers(0, DAYS, rows)],
+        '产品类别': np.array(CATEGORIES, dtype=object)[rng.integers(0, len(CATEGORIES), rows)],
+        '销售额': np.array(PRICES)[rng.integers(0, len(PRICES), rows)],
+        '数量': rng.integers(1, 9, rows),
+        '客户年龄': rng.integers(18, 66, rows),
+        '满意度评分': np.round(rng.uniform(3.0, 5.0, rows), 1),
+        '地区': np.array(REGIONS, dtype=object)[rng.integers(0, len(REGIONS), rows)]
+    }
+
+    n_missing = int(rows * missing_ratio)
+    if n_missing:
+        for col in ('销售额', '满意度评分', '地区'):
+            values = columns[col]
+            if values.dtype.kind in 'iu':
+                # 含缺失值的整数列读入后为浮点型
+                values = columns[col] = values.astype(np.float64)
+            values[rng.choice(rows, n_missing, replace=False)] = np.nan
+
+    n_duplicates = int(rows * duplicate_ratio)
+    if n_duplicates and rows > 1:
+        # 用前面的行覆盖随机位置，保持总行数不变
+        targets = rng.choice(np.arange(1, rows), min(n_duplicates, rows - 1), replace=False)
+        sources = rng.integers(0, targets)
+        for values in columns.values():
+            values[targets] = values[sources]
+    return pd.DataFrame(columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成基准测试用的销售数据CSV文件')
+    parser.add_argument('--rows', type=float, default=100000, help='行数，支持 1e6 这样的写法')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', required=True, help='输出的CSV文件路径')
+    args = parser.parse_args()
+    generate_sales_data(int(args.rows), seed=args.seed).to_csv(args.output, index=False)
+
+
+if __name__ == '__main__':
+    main()
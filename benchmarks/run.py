@@ -0,0 +1,238 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import tracemalloc
+import numpy as np
+import pandas as pd
+import sklearn
+import plotly.io as pio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.data_processor import DataProcessor
+from models.analyzer import DataAnalyzer
+from models.visualizer import DataVisualizer, JSON_ENGINE
+from benchmarks.datagen import generate_sales_data
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, 'baseline.json')
+DEFAULT_OUTPUT = os.path.join(BENCHMARK_DIR, 'results', 'latest.json')
+DEFAULT_ROWS = [1000, 10000, 100000]
+# 基准文件中没有给出阈值时使用的默认值
+DEFAULT_THRESHOLDS = {
+    'time_ratio': 1.5,  # 耗时超过基准的倍数
+    'memory_ratio': 1.3,  # 峰值内存超过基准的倍数
+    'min_seconds': 0.01,  # 基准和本次耗时都低于该值时视为噪声，不比较耗时
+    'min_bytes': 1024 * 1024  # 基准和本次峰值内存都低于该值时不比较内存
+}
+
+NUMERIC_COLUMNS = ['销售额', '数量', '客户年龄', '满意度评分']
+ALL_COLUMNS = ['日期', '产品类别', '销售额', '数量', '客户年龄', '满意度评分', '地区']
+
+# 每个 _analyze_* 方法的参数，新增分析方法时需要在这里补充
+ANALYSIS_CASES = {
+    'summary_stats': (ALL_COLUMNS, {}),
+    'correlation': (NUMERIC_COLUMNS, {}),
+    'distribution': (['销售额', '满意度评分', '产品类别'], {}),
+    'pca': (NUMERIC_COLUMNS, {}),
+    'clustering': (NUMERIC_COLUMNS, {'n_clusters': 3})
+}
+
+# 每个 _viz_* 方法的参数，新增图表类型时需要在这里补充
+VIZ_CASES = {
+    'scatter': (['销售额', '客户年龄'], {}),
+    'histogram': (['销售额'], {}),
+    'box': (NUMERIC_COLUMNS, {}),
+    'correlation_heatmap': (NUMERIC_COLUMNS, {}),
+    'line': (['销售额'], {'x_column': '日期'}),
+    'bar': (['产品类别'], {}),
+    'pie': (['地区'], {})
+}
+
+
+def measure(func, setup=None, repeat=3, memory=True):
+    """执行 repeat 次并计时，另执行一次用tracemalloc记录峰值内存
+
+    setup 在每次执行前调用且不计入耗时，用于清空缓存使每次测量的都是冷启动路径。
+    返回 (结果字典, 最后一次的返回值)。
+    """
+    timings = []
+    value = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        value = func()
+        timings.append(time.perf_counter() - start)
+    result = {'seconds': min(timings), 'median_seconds': statistics.median(timings)}
+
+    if memory:
+        if setup is not None:
+            setup()
+        tracemalloc.start()
+        try:
+            tracemalloc.reset_peak()
+            func()
+            result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, value
+
+
+def run_case(results, name, func, setup=None, repeat=3, memory=True):
+    """执行单个测量，失败时记录错误信息而不中断其余测量"""
+    try:
+        results[name], value = measure(func, setup, repeat, memory)
+    except Exception as e:
+        results[name] = {'error': f'{type(e).__name__}: {e}'}
+        value = None
+    status = results[name].get('error') or f"{results[name]['seconds'] * 1000:.1f} ms"
+    print(f'  {name}: {status}', flush=True)
+    return value
+
+
+def check_cases(owner, prefix, cases):
+    """确认每个 _analyze_* 和 _viz_* 方法都有对应的测量参数"""
+    methods = sorted(name[len(prefix):] for name in dir(owner) if name.startswith(prefix))
+    missing = [name for name in methods if name not in cases]
+    if missing:
+        raise SystemExit(f"以下方法缺少基准测试参数: {', '.join(prefix + name for name in missing)}")
+    return methods
+
+
+def run_size(rows, repeat=3, memory=True, seed=42):
+    """对一个数据规模执行完整的处理、分析、可视化和序列化测量"""
+    results = {}
+    raw = generate_sales_data(rows, seed=seed)
+    print(f'{rows} 行', flush=True)
+
+    processor = DataProcessor()
+    data = run_case(results, 'process_data', lambda: processor.process_data(raw), repeat=repeat, memory=memory)
+    if data is None:
+        return results
+
+    analyzer = DataAnalyzer()
+    analyzer.set_data(data)
+    for analysis_type in check_cases(DataAnalyzer, '_analyze_', ANALYSIS_CASES):
+        columns, kwargs = ANALYSIS_CASES[analysis_type]
+        method = getattr(analyzer, f'_analyze_{analysis_type}')
+        # 每次执行前重新设置数据，清空矩阵缓存和统计量
+        result = run_case(results, f'analyze.{analysis_type}', lambda: method(columns, **kwargs),
+                          setup=lambda: analyzer.set_data(data), repeat=repeat, memory=memory)
+        if result is not None:
+            run_case(results, f'serialize.analyze.{analysis_type}',
+                     lambda: json.dumps(result, ensure_ascii=False), repeat=repeat, memory=memory)
+
+    visualizer = DataVisualizer()
+    run_case(results, 'viz.set_data', lambda: visualizer.set_data(data), repeat=repeat, memory=memory)
+    visualizer.set_data(data)
+    for viz_type in check_cases(DataVisualizer, '_viz_', VIZ_CASES):
+        columns, kwargs = VIZ_CASES[viz_type]
+        method = getattr(visualizer, f'_viz_{viz_type}')
+        # 每次执行前重新设置数据，清空分箱缓存
+        fig = run_case(results, f'viz.{viz_type}', lambda: method(columns, **kwargs),
+                       setup=lambda: visualizer.set_data(data), repeat=repeat, memory=memory)
+        if fig is not None:
+            run_case(results, f'serialize.viz.{viz_type}',
+                     lambda: pio.to_json(fig, validate=False, engine=JSON_ENGINE), repeat=repeat, memory=memory)
+    return results
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'sklearn': sklearn.__version__,
+        'json_engine': JSON_ENGINE
+    }
+
+
+def compare(results, baseline):
+    """与基准比较，返回超过阈值的项目列表"""
+    thresholds = dict(DEFAULT_THRESHOLDS, **baseline.get('thresholds', {}))
+    regressions = []
+    for rows, cases in results['results'].items():
+        base_cases = baseline.get('results', {}).get(rows, {})
+        for name, current in cases.items():
+            base = base_cases.get(name)
+            if base is None or 'error' in base:
+                continue
+            if 'error' in current:
+                regressions.append(f"{rows} 行 {name}: 基准中成功，本次出错 ({current['error']})")
+                continue
+            if max(current['seconds'], base['seconds']) >= thresholds['min_seconds'] and \
+                    current['seconds'] > base['seconds'] * thresholds['time_ratio']:
+                regressions.append(f"{rows} 行 {name}: 耗时 {current['seconds'] * 1000:.1f} ms，"
+                                   f"基准 {base['seconds'] * 1000:.1f} ms")
+            if 'peak_bytes' in current and 'peak_bytes' in base and \
+                    max(current['peak_bytes'], base['peak_bytes']) >= thresholds['min_bytes'] and \
+                    current['peak_bytes'] > base['peak_bytes'] * thresholds['memory_ratio']:
+                regressions.append(f"{rows} 行 {name}: 峰值内存 {current['peak_bytes'] / 2 ** 20:.1f} MB，"
+                                   f"基准 {base['peak_bytes'] / 2 ** 20:.1f} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='数据处理、分析、可视化和JSON序列化的性能基准测试')
+    parser.add_argument('--rows', type=float, nargs='+', default=DEFAULT_ROWS,
+                        help='数据行数，可指定多个，支持 1e7 这样的写法')
+    parser.add_argument('--repeat', type=int, default=3, help='每项测量的重复次数，取最短耗时')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--no-memory', action='store_true', help='不测量峰值内存（tracemalloc会拖慢执行）')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='结果JSON文件路径')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='用于比较的基准JSON文件路径')
+    parser.add_argument('--update-baseline', action='store_true', help='用本次结果覆盖基准文件，保留原有阈值')
+    args = parser.parse_args()
+
+    results = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': environment(),
+        'repeat': args.repeat,
+        'seed': args.seed,
+        'results': {}
+    }
+    for rows in args.rows:
+        rows = int(rows)
+        results['results'][str(rows)] = run_size(rows, repeat=args.repeat, memory=not args.no_memory,
+                                                 seed=args.seed)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f'结果已写入 {args.output}')
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    if args.update_baseline:
+        results = {'thresholds': (baseline or {}).get('thresholds', DEFAULT_THRESHOLDS), **results}
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f'基准已更新: {args.baseline}')
+        return 0
+
+    if baseline is None:
+        print('没有基准文件，跳过比较')
+        return 0
+    regressions = compare(results, baseline)
+    if regressions:
+        print('性能回退:')
+        for line in regressions:
+            print(f'  {line}')
+        return 1
+    print('没有超过阈值的性能回退')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,36 +1,102 @@
 from openai import OpenAI
-import json
-from typing import Dict, Any
+import os
+import time
+from typing import Dict, Any, Iterator
+from models.result_summarizer import summarize_result, DEFAULT_BUDGET
+from models.metrics import stage, record_stage, observe_size
+
+DEFAULT_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
 
 class AIExplainer:
-    def __init__(self, api_key: str):
-        """初始化AI解释器"""
+    def __init__(self, api_key: str, base_url: str = None, model: str = "qwen-plus", cache=None,
+                 result_budget: int = DEFAULT_BUDGET):
+        """初始化AI解释器，base_url 默认读取环境变量 DASHSCOPE_BASE_URL"""
         self.client = OpenAI(
             api_key=api_key,
-            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
+            base_url=base_url or os.getenv("DASHSCOPE_BASE_URL", DEFAULT_BASE_URL)
         )
+        self.model = model
+        self.cache = cache  # ExplanationCache，为None时不缓存
+        self.result_budget = result_budget  # 提示词中分析结果摘要的字符上限
     
     def generate_explanation(self, analysis_type: str, analysis_result: Dict[str, Any], columns: list) -> str:
         """生成对分析结果的通俗解释"""
-        prompt = self._create_prompt(analysis_type, analysis_result, columns)
+        messages, params = self._build_request(analysis_type, analysis_result, columns)
         
         try:
-            response = self.client.chat.completions.create(
-                model="qwen-plus",
-                messages=[
-                    {"role": "system", "content": "你是一个专业的数据分析师，擅长用通俗易懂的语言解释数据分析结果。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=500
-            )
-            return response.choices[0].message.content
+            if self.cache is None:
+                return self._complete(messages, params)
+            key = self.cache.make_key(messages, params)
+            return self.cache.get_or_compute(key, lambda: self._complete(messages, params))
         except Exception as e:
+            # 出错信息直接返回给用户，不写入缓存
             return f"生成解释时出错: {str(e)}"
     
+    def stream_explanation(self, analysis_type: str, analysis_result: Dict[str, Any], columns: list) -> Iterator[str]:
+        """逐段生成解释文本，命中缓存时一次返回完整内容
+
+        相同提示词的并发请求共享一次模型调用，后加入的请求先收到已生成的部分。
+        所有调用方都停止迭代或关闭生成器时才关闭与模型服务的连接，
+        完整生成的解释才会写入缓存，调用失败时抛出异常。
+        """
+        messages, params = self._build_request(analysis_type, analysis_result, columns)
+        if self.cache is None:
+            yield from self._stream(messages, params)
+            return
+        key = self.cache.make_key(messages, params)
+        yield from self.cache.stream(key, lambda: self._stream(messages, params))
+    
+    def _stream(self, messages: list, params: Dict[str, Any]) -> Iterator[str]:
+        """调用模型流式生成回复，逐段返回非空文本"""
+        start = time.perf_counter()
+        stream = self.client.chat.completions.create(messages=messages, stream=True, **params)
+        size = 0
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if not size:
+                        record_stage('explain.first_token', time.perf_counter() - start)
+                    size += len(delta.encode('utf-8'))
+                    yield delta
+        finally:
+            # 生成器被关闭时中止上游请求
+            stream.close()
+            # 流式调用的总时长包含调用方处理每段文本的时间
+            record_stage('explain.stream', time.perf_counter() - start)
+        if not size:
+            raise ValueError("模型没有返回内容")
+        observe_size('explanation', size)
+    
+    def _build_request(self, analysis_type: str, analysis_result: Dict[str, Any], columns: list):
+        """构造发送给模型的消息和参数"""
+        with stage('explain.prompt'):
+            prompt = self._create_prompt(analysis_type, analysis_result, columns)
+        observe_size('prompt', len(prompt.encode('utf-8')))
+        messages = [
+            {"role": "system", "content": "你是一个专业的数据分析师，擅长用通俗易懂的语言解释数据分析结果。"},
+            {"role": "user", "content": prompt}
+        ]
+        params = {"model": self.model, "temperature": 0.7, "max_tokens": 500}
+        return messages, params
+    
+    def _complete(self, messages: list, params: Dict[str, Any]) -> str:
+        """调用模型生成回复，失败或回复为空时抛出异常"""
+        with stage('explain.request'):
+            response = self.client.chat.completions.create(messages=messages, **params)
+        content = response.choices[0].message.content if response.choices else None
+        if not content:
+            # 空回复不能作为解释返回，也不写入缓存
+            raise ValueError("模型没有返回内容")
+        observe_size('explanation', len(content.encode('utf-8')))
+        return content
+    
     def _create_prompt(self, analysis_type: str, analysis_result: Dict[str, Any], columns: list) -> str:
         """创建用于生成解释的提示"""
-        result_str = json.dumps(analysis_result, ensure_ascii=False, indent=2)
+        # 只把与数据行数无关的摘要放进提示词，提示词长度保持在预算以内
+        result_str = summarize_result(analysis_type, analysis_result, budget=self.result_budget)
         
         # 从分析结果中获取列的描述信息
         column_info = ""
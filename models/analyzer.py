@@ -1,13 +1,54 @@
+import base64
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
 from scipy import stats
-from sklearn.decomposition import PCA
-from sklearn.cluster import KMeans
+from sklearn.decomposition import PCA, IncrementalPCA
+from sklearn.utils import gen_batches
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.preprocessing import StandardScaler
+from models.result_cache import next_dataset_version
+from models.running_stats import RunningMoments
+from models.sketches import DatasetSketches
+from models.metrics import stage
+from models.profiler import numeric_profile, categorical_profile
+from models.binning import BinningService
+from models.correlation import CorrelationEngine, strongest_pairs, parse_top_k
+from models.cluster_selection import score_candidates
 
 class DataAnalyzer:
-    def __init__(self):
+    # 行数超过该值时PCA改用IncrementalPCA分批拟合
+    INCREMENTAL_PCA_ROWS = 1000000
+    PCA_BATCH_ROWS = 50000
+    # 截断主成分且行数超过该值时使用随机SVD
+    RANDOMIZED_PCA_ROWS = 10000
+    # PCA结果中内联返回的投影预览行数，完整投影通过分页接口获取
+    PCA_PREVIEW_ROWS = 500
+    PROJECTION_MAX_PAGE = 10000
+    # 行数超过该值时聚类改用MiniBatchKMeans
+    MINIBATCH_KMEANS_ROWS = 100000
+    # 自动选择聚类数时的抽样行数和计算轮廓系数的行数
+    K_SELECTION_SAMPLE_ROWS = 20000
+    SILHOUETTE_SAMPLE_ROWS = 5000
+    # 缓存的数值矩阵及其标准化结果的总大小上限，PCA和聚类等分析共用
+    MATRIX_CACHE_BYTES = 256 * 1024 * 1024
+    # 批量分析时并行执行的分析数
+    BATCH_WORKERS = 4
+    
+    def __init__(self, cache=None, binning=None, correlation=None):
         self.data = None
+        self.version = None
+        self.moments = None  # 数值列的增量统计量，首次使用时计算
+        self.sketches = None  # 各列的近似统计草图，首次使用时计算
+        self._pca_models = {}  # 已拟合的PCA模型，分页获取投影时复用
+        self._matrices = OrderedDict()  # 列元组 -> 数值矩阵和标准化结果，按LRU淘汰
+        self._matrix_lock = threading.Lock()
+        self.cache = cache  # 可选的ResultCache，多个分析器可以共享
+        self.binning = binning or BinningService()  # 分箱结果缓存，与可视化器共享
+        self.correlation = correlation or CorrelationEngine()  # 相关系数矩阵缓存，与可视化器共享
     
     def analyze(self, analysis_type, columns, **kwargs):
         """执行指定类型的分析"""
@@ -15,63 +56,136 @@ class DataAnalyzer:
             raise ValueError(f"不支持的分析类型: {analysis_type}")
         
         method = getattr(self, f'_analyze_{analysis_type}')
-        return method(columns, **kwargs)
+        if self.cache is None:
+            with stage(f'analyze.{analysis_type}'):
+                return method(columns, **kwargs)
+        
+        # 相同数据版本、分析类型、列集合和参数直接返回缓存结果
+        key = self.cache.make_key(self.version, analysis_type, columns, kwargs)
+        hit, result = self.cache.get(key)
+        if not hit:
+            with stage(f'analyze.{analysis_type}'):
+                result = method(columns, **kwargs)
+            self.cache.put(key, result)
+        return result
+    
+    def analyze_batch(self, analysis_types, columns, options=None):
+        """对同一组列执行多种分析
+        
+        数值矩阵和标准化矩阵只构建一次，由各分析共用，各分析在线程池中并行执行。
+        options 按分析类型给出各自的参数。返回 (结果, 错误信息)，单个分析失败不影响其他分析。
+        """
+        options = options or {}
+        for analysis_type in analysis_types:
+            if not hasattr(self, f'_analyze_{analysis_type}'):
+                raise ValueError(f"不支持的分析类型: {analysis_type}")
+        
+        # 先构建共用的标准化矩阵，避免并行的分析各自重复计算
+        numeric_cols = [col for col in columns if pd.api.types.is_numeric_dtype(self.data[col])]
+        if numeric_cols and ('clustering' in analysis_types or
+                             ('pca' in analysis_types and len(self.data) <= self.INCREMENTAL_PCA_ROWS)):
+            with stage('analyze.standardize'):
+                self._standardized(numeric_cols)
+        
+        with ThreadPoolExecutor(max_workers=max(min(self.BATCH_WORKERS, len(analysis_types)), 1)) as pool:
+            # 在调用方的上下文中执行，各分析的耗时计入当前请求的明细
+            futures = {analysis_type: pool.submit(contextvars.copy_context().run, self.analyze, analysis_type,
+                                                  columns, **options.get(analysis_type, {}))
+                       for analysis_type in analysis_types}
+        
+        results, errors = {}, {}
+        for analysis_type, future in futures.items():
+            try:
+                results[analysis_type] = future.result()
+            except Exception as e:
+                errors[analysis_type] = str(e)
+        return results, errors
     
-    def _analyze_correlation(self, columns):
-        """计算相关性分析"""
+    def _analyze_correlation(self, columns, method='pearson', top_k=None, threshold=None):
+        """计算相关性分析
+        
+        method 为 pearson 或 spearman。默认返回完整的相关系数矩阵；指定 top_k 或 threshold 时
+        只返回绝对值最大的 top_k 个变量对或绝对值不低于 threshold 的变量对，列数很多时结果不随列数平方增长。
+        """
         if len(columns) < 2:
             raise ValueError("相关性分析需要至少两个列")
+        if top_k is not None:
+            top_k = parse_top_k(top_k)
         
         # 只选择数值型列进行相关性分析
         numeric_cols = [col for col in columns if pd.api.types.is_numeric_dtype(self.data[col])]
         if len(numeric_cols) < 2:
             raise ValueError("需要至少两个数值型列进行相关性分析")
         
-        corr_matrix = self.data[numeric_cols].corr()
-        return corr_matrix.to_dict()
+        # 皮尔逊系数优先由增量维护的协方差矩阵得到，追加数据后只需用新增行更新
+        moments = self._get_moments(numeric_cols) if method == 'pearson' else None
+        corr_matrix = self.correlation.matrix(self.version, self.data, numeric_cols, method, moments=moments)
+        if top_k is None and threshold is None:
+            return corr_matrix.to_dict()
+        
+        pairs = strongest_pairs(corr_matrix, top_k=top_k, threshold=threshold)
+        return {
+            '方法': method,
+            '变量数量': len(corr_matrix.columns),
+            '变量': list(corr_matrix.columns),
+            '变量对': [{'变量1': a, '变量2': b, '相关系数': value} for a, b, value in pairs]
+        }
     
-    def _analyze_summary_stats(self, columns):
-        """计算描述性统计"""
+    def _analyze_summary_stats(self, columns, approximate=False):
+        """计算描述性统计，approximate 为True时直接从草图返回带误差范围的近似结果
+        
+        数值列逐列排序一次得到四分位数和唯一值数量，均值、标准差和极值优先取增量统计量；
+        其他列各做一次分组计数。
+        """
+        if approximate:
+            sketches = self._get_sketches()
+            return {col: sketches.summary(col) for col in columns}
+        
         results = {}
+        moments = self._get_moments([col for col in columns if pd.api.types.is_numeric_dtype(self.data[col])])
         
         for col in columns:
-            col_stats = {}
             series = self.data[col]
             
             if pd.api.types.is_numeric_dtype(series):
-                # 数值型数据的统计
-                col_stats.update({
-                    '平均值': float(series.mean()),
-                    '中位数': float(series.median()),
-                    '标准差': float(series.std()),
-                    '最小值': float(series.min()),
-                    '最大值': float(series.max()),
+                profile = numeric_profile(series.to_numpy(dtype=np.float64, na_value=np.nan))
+                # 均值、标准差和极值优先取增量统计量
+                running = moments.column_stats(col) if moments.covers([col]) else profile
+                results[col] = {
+                    '平均值': float(running['mean']),
+                    '中位数': profile['q2'],
+                    '标准差': float(running['std']),
+                    '最小值': float(running['min']),
+                    '最大值': float(running['max']),
                     '四分位数': {
-                        'Q1': float(series.quantile(0.25)),
-                        'Q2': float(series.quantile(0.50)),
-                        'Q3': float(series.quantile(0.75))
-                    }
-                })
+                        'Q1': profile['q1'],
+                        'Q2': profile['q2'],
+                        'Q3': profile['q3']
+                    },
+                    '非空值数量': profile['count'],
+                    '空值数量': profile['null_count'],
+                    '唯一值数量': profile['distinct'],
+                    '数据类型': str(series.dtype)
+                }
+                continue
             
-            # 所有类型通用的统计
-            col_stats.update({
-                '非空值数量': int(series.count()),
-                '空值数量': int(series.isnull().sum()),
-                '唯一值数量': int(series.nunique()),
+            profile = categorical_profile(series)
+            col_stats = {
+                '非空值数量': profile['count'],
+                '空值数量': profile['null_count'],
+                '唯一值数量': profile['distinct'],
                 '数据类型': str(series.dtype)
-            })
-            
-            if pd.api.types.is_object_dtype(series) or pd.api.types.is_categorical_dtype(series):
+            }
+            if (pd.api.types.is_object_dtype(series) or isinstance(series.dtype, pd.CategoricalDtype)) \
+                    and profile['top']:
                 # 分类数据的统计
-                value_counts = series.value_counts()
                 col_stats.update({
                     '最常见值': {
-                        '值': str(value_counts.index[0]),
-                        '计数': int(value_counts.iloc[0])
+                        '值': str(profile['top'][0][0]),
+                        '计数': profile['top'][0][1]
                     },
-                    '类别分布': value_counts.head().to_dict()
+                    '类别分布': dict(profile['top'])
                 })
-            
             results[col] = col_stats
         
         return results
@@ -82,10 +196,11 @@ class DataAnalyzer:
         for col in columns:
             if not pd.api.types.is_numeric_dtype(self.data[col]):
                 # 对于非数值型数据，返回类别分布
-                value_counts = self.data[col].value_counts()
+                value_counts = self.binning.value_counts(self.version, self.data[col])
                 results[col] = {
                     'type': 'categorical',
-                    'distribution': value_counts.to_dict(),
+                    # 日期等类型的取值转换为字符串，保证可以JSON序列化
+                    'distribution': {str(k): int(v) for k, v in value_counts.items()},
                     'total_count': int(len(self.data[col])),
                     'unique_count': int(value_counts.count())
                 }
@@ -96,16 +211,18 @@ class DataAnalyzer:
                     skewness = float(stats.skew(clean_data))
                     kurtosis = float(stats.kurtosis(clean_data))
                     _, p_value = stats.normaltest(clean_data)
+                    # 与直方图共用分箱结果
+                    histogram = self.binning.histogram(self.version, self.data[col])
                     
                     results[col] = {
                         'type': 'numerical',
                         'skewness': skewness,
                         'kurtosis': kurtosis,
-                        'is_normal': p_value > 0.05,
+                        'is_normal': bool(p_value > 0.05),
                         'p_value': float(p_value),
                         'histogram_data': {
-                            'bins': np.histogram(clean_data, bins='auto')[0].tolist(),
-                            'bin_edges': np.histogram(clean_data, bins='auto')[1].tolist()
+                            'bins': histogram['counts'].tolist(),
+                            'bin_edges': histogram['edges'].tolist()
                         }
                     }
                 except:
@@ -116,61 +233,260 @@ class DataAnalyzer:
         
         return results
     
-    def _analyze_pca(self, columns):
-        """主成分分析"""
+    def _analyze_pca(self, columns, n_components=None, variance_threshold=None):
+        """主成分分析
+        
+        n_components 限制保留的主成分数，variance_threshold 保留累计解释方差达到该比例的最少主成分。
+        结果只内联少量投影预览，完整投影通过 pca_projection 分页获取。
+        """
         # 只选择数值型列
         numeric_cols = [col for col in columns if pd.api.types.is_numeric_dtype(self.data[col])]
         if len(numeric_cols) < 2:
             raise ValueError("PCA分析需要至少两个数值型列")
         
-        # 标准化数据
-        scaler = StandardScaler()
-        scaled_data = scaler.fit_transform(self.data[numeric_cols])
+        model = self._fit_pca(numeric_cols, n_components, variance_threshold)
+        pca, k = model['pca'], model['n_components']
+        explained = pca.explained_variance_ratio_[:k]
         
-        # 执行PCA
-        pca = PCA()
-        transformed_data = pca.fit_transform(scaled_data)
+        # 在全部行中均匀抽取预览行
+        n_rows = len(self.data)
+        positions = np.unique(np.linspace(0, n_rows - 1, min(self.PCA_PREVIEW_ROWS, n_rows)).astype(np.int64))
+        preview = self._project_rows(model, positions)
         
         return {
-            'explained_variance_ratio': pca.explained_variance_ratio_.tolist(),
-            'components': pca.components_.tolist(),
+            'explained_variance_ratio': explained.tolist(),
+            'cumulative_variance_ratio': np.cumsum(explained).tolist(),
+            'components': pca.components_[:k].tolist(),
             'feature_names': numeric_cols,
-            'transformed_data': transformed_data.tolist()
+            'n_components': int(k),
+            'n_samples': int(n_rows),
+            'solver': model['solver'],
+            'transformed_preview': {
+                'index': [int(i) for i in positions],
+                'rows': preview.tolist(),
+                'sampled': bool(len(positions) < n_rows)
+            }
+        }
+    
+    def pca_projection(self, columns, offset=0, limit=1000, n_components=None, variance_threshold=None):
+        """分页返回PCA投影结果"""
+        numeric_cols = [col for col in columns if pd.api.types.is_numeric_dtype(self.data[col])]
+        if len(numeric_cols) < 2:
+            raise ValueError("PCA分析需要至少两个数值型列")
+        
+        offset = max(int(offset), 0)
+        limit = min(max(int(limit), 1), self.PROJECTION_MAX_PAGE)
+        model = self._fit_pca(numeric_cols, n_components, variance_threshold)
+        positions = np.arange(offset, min(offset + limit, len(self.data)))
+        return {
+            'offset': offset,
+            'limit': limit,
+            'total_rows': int(len(self.data)),
+            'n_components': int(model['n_components']),
+            'index': [int(i) for i in positions],
+            'rows': self._project_rows(model, positions).tolist()
         }
     
-    def _analyze_clustering(self, columns, n_clusters=3):
-        """K-means聚类分析"""
+    def _fit_pca(self, numeric_cols, n_components=None, variance_threshold=None):
+        """拟合（或复用已拟合的）标准化和PCA模型"""
+        key = (tuple(numeric_cols), n_components, variance_threshold)
+        model = self._pca_models.get(key)
+        if model is not None:
+            return model
+        
+        n_rows, n_features = len(self.data), len(numeric_cols)
+        k = min(int(n_components), n_features, n_rows) if n_components else min(n_features, n_rows)
+        
+        if n_rows > self.INCREMENTAL_PCA_ROWS:
+            scaler = StandardScaler()
+            # 数据很高时分批标准化和拟合，避免一次性生成完整的标准化矩阵
+            batches = list(gen_batches(n_rows, self.PCA_BATCH_ROWS, min_batch_size=k))
+            for batch in batches:
+                scaler.partial_fit(self._rows_block(numeric_cols, batch))
+            pca = IncrementalPCA(n_components=k)
+            for batch in batches:
+                pca.partial_fit(scaler.transform(self._rows_block(numeric_cols, batch)))
+            solver = 'incremental'
+        else:
+            scaler, scaled_data = self._standardized(numeric_cols)
+            solver = 'randomized' if k < n_features and n_rows > self.RANDOMIZED_PCA_ROWS else 'auto'
+            pca = PCA(n_components=k, svd_solver=solver, random_state=42 if solver == 'randomized' else None)
+            pca.fit(scaled_data)
+        
+        if variance_threshold:
+            # 保留累计解释方差达到阈值的最少主成分
+            cumulative = np.cumsum(pca.explained_variance_ratio_)
+            k = min(int(np.searchsorted(cumulative, float(variance_threshold) - 1e-12)) + 1, len(cumulative))
+        
+        model = {'scaler': scaler, 'pca': pca, 'n_components': k, 'columns': list(numeric_cols),
+                 'solver': solver}
+        self._pca_models[key] = model
+        return model
+    
+    def _project_rows(self, model, positions):
+        """把指定位置的行投影到主成分空间"""
+        if len(positions) == 0:
+            return np.empty((0, model['n_components']))
+        rows = self._rows_block(model['columns'], positions)
+        return model['pca'].transform(model['scaler'].transform(rows))[:, :model['n_components']]
+    
+    def _analyze_clustering(self, columns, n_clusters=3, k_range=(2, 8)):
+        """K-means聚类分析
+        
+        n_clusters 为 'auto' 时在 k_range 范围内并行比较抽样数据的轮廓系数选择聚类数。
+        大数据量使用MiniBatchKMeans，簇标签以base64编码的整数数组返回。
+        """
         # 只选择数值型列
         numeric_cols = [col for col in columns if pd.api.types.is_numeric_dtype(self.data[col])]
         if len(numeric_cols) < 1:
             raise ValueError("聚类分析需要至少一个数值型列")
         
-        # 标准化数据
-        scaler = StandardScaler()
-        scaled_data = scaler.fit_transform(self.data[numeric_cols])
+        # 标准化数据（与PCA等分析共用）
+        _, scaled_data = self._standardized(numeric_cols)
+        
+        k_selection = None
+        if n_clusters == 'auto':
+            n_clusters, k_selection = self._select_n_clusters(scaled_data, k_range)
+        n_clusters = int(n_clusters)
         
         # 执行聚类
-        kmeans = KMeans(n_clusters=n_clusters, random_state=42)
+        if len(scaled_data) > self.MINIBATCH_KMEANS_ROWS:
+            kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=42, batch_size=4096, n_init='auto')
+            algorithm = 'minibatch_kmeans'
+        else:
+            kmeans = KMeans(n_clusters=n_clusters, random_state=42)
+            algorithm = 'kmeans'
         clusters = kmeans.fit_predict(scaled_data)
         
-        # 计算每个簇的基本统计信息
+        # 在共用的数值矩阵上一次计算每个簇的样本数和中心点
+        sizes = np.bincount(clusters, minlength=n_clusters)
+        block = self._numeric_block(numeric_cols)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.stack([np.bincount(clusters, weights=block[:, j], minlength=n_clusters)
+                              for j in range(len(numeric_cols))], axis=1) / sizes[:, None]
         cluster_stats = {}
         for i in range(n_clusters):
-            cluster_data = self.data[numeric_cols][clusters == i]
             cluster_stats[f'簇_{i}'] = {
-                '样本数量': int(len(cluster_data)),
-                '中心点': {col: float(cluster_data[col].mean()) for col in numeric_cols}
+                '样本数量': int(sizes[i]),
+                '中心点': {col: float(means[i, j]) for j, col in enumerate(numeric_cols)}
             }
         
-        return {
-            'clusters': clusters.tolist(),
+        result = {
+            'clusters': self._encode_labels(clusters, n_clusters),
+            'cluster_sizes': sizes.tolist(),
             'cluster_stats': cluster_stats,
             'feature_names': numeric_cols,
             'centroids': kmeans.cluster_centers_.tolist(),
-            'inertia': float(kmeans.inertia_)
+            'inertia': float(kmeans.inertia_),
+            'n_clusters': n_clusters,
+            'algorithm': algorithm
         }
+        if k_selection is not None:
+            result['k_selection'] = k_selection
+        return result
     
-    def set_data(self, data):
-        """设置要分析的数据"""
+    def _select_n_clusters(self, scaled_data, k_range):
+        """在抽样数据上并行评估多个聚类数，选出轮廓系数最高的"""
+        k_min, k_max = int(k_range[0]), int(k_range[1])
+        n_rows = len(scaled_data)
+        candidates = [k for k in range(max(k_min, 2), k_max + 1) if k < n_rows]
+        if not candidates:
+            raise ValueError("数据行数不足以自动选择聚类数")
+        
+        if n_rows > self.K_SELECTION_SAMPLE_ROWS:
+            rng = np.random.default_rng(42)
+            sample = scaled_data[rng.choice(n_rows, self.K_SELECTION_SAMPLE_ROWS, replace=False)]
+        else:
+            sample = scaled_data
+        
+        scores = score_candidates(sample, candidates, self.SILHOUETTE_SAMPLE_ROWS)
+        
+        best = max(scores, key=lambda k: scores[k]['silhouette'])
+        return best, {
+            'method': 'silhouette',
+            'sample_rows': int(len(sample)),
+            'scores': {str(k): score for k, score in scores.items()}
+        }
+    
+    def _numeric_block(self, numeric_cols):
+        """数值列组成的float64矩阵（行为样本），同一组列只提取一次"""
+        return self._matrix_entry(numeric_cols)['block']
+    
+    def _standardized(self, numeric_cols):
+        """返回 (已拟合的StandardScaler, 标准化矩阵)，同一组列只计算一次"""
+        entry = self._matrix_entry(numeric_cols, standardize=True)
+        return entry['scaler'], entry['scaled']
+    
+    def _matrix_entry(self, numeric_cols, standardize=False):
+        """获取或构建某组列的矩阵缓存项，超出 MATRIX_CACHE_BYTES 时淘汰最久未用的项"""
+        key = tuple(numeric_cols)
+        with self._matrix_lock:
+            entry = self._matrices.get(key)
+            if entry is None:
+                entry = {'block': self.data[list(numeric_cols)].to_numpy(dtype=np.float64)}
+            if standardize and 'scaled' not in entry:
+                entry['scaler'] = StandardScaler()
+                entry['scaled'] = entry['scaler'].fit_transform(entry['block'])
+            self._matrices[key] = entry
+            self._matrices.move_to_end(key)
+            
+            used = sum(sum(v.nbytes for v in e.values() if isinstance(v, np.ndarray))
+                       for e in self._matrices.values())
+            while used > self.MATRIX_CACHE_BYTES and self._matrices:
+                _, evicted = self._matrices.popitem(last=False)
+                used -= sum(v.nbytes for v in evicted.values() if isinstance(v, np.ndarray))
+        return entry
+    
+    def _rows_block(self, numeric_cols, rows):
+        """按位置（切片或下标数组）取部分行的float64矩阵"""
+        return self.data[list(numeric_cols)].iloc[rows].to_numpy(dtype=np.float64)
+    
+    @staticmethod
+    def _encode_labels(labels, n_clusters):
+        """把簇标签编码为紧凑的typed array格式（与plotly的bdata格式一致）"""
+        dtype = np.int8 if n_clusters <= np.iinfo(np.int8).max else np.int16
+        array = labels.astype(dtype)
+        return {
+            'dtype': array.dtype.str.lstrip('<|'),
+            'bdata': base64.b64encode(array.astype(array.dtype.newbyteorder('<')).tobytes()).decode('ascii'),
+            'shape': str(len(array))
+        }
+    
+    def set_data(self, data, version=None, moments=None, sketches=None):
+        """设置要分析的数据，旧数据的缓存结果随之失效
+        
+        moments 和 sketches 为已经按这份数据构建好的 RunningMoments 和 DatasetSketches，
+        上传或追加数据时由调用方传入。
+        """
+        if self.cache is not None and self.version is not None:
+            self.cache.invalidate(self.version)
+        if self.version is not None:
+            self.binning.invalidate(self.version)
+            self.correlation.invalidate(self.version)
         self.data = data
-        return self 
\ No newline at end of file
+        self.version = version if version is not None else next_dataset_version()
+        with self._matrix_lock:
+            self._matrices.clear()
+        self._pca_models = {}
+        self.moments = moments
+        self.sketches = sketches
+        return self
+    
+    def _get_moments(self, columns):
+        """获取包含这些数值列的增量统计量
+
+        已有的统计量缺少其中某些列时，只对已有列和请求的列扫描一次数据重新构建，
+        不为未用到的数值列计算协方差。
+        """
+        moments = self.moments
+        if moments is not None and all(col in moments.columns for col in columns):
+            return moments
+        wanted = list(dict.fromkeys((moments.columns if moments is not None else []) + list(columns)))
+        self.moments = RunningMoments.from_frame(self.data, columns=wanted)
+        return self.moments
+    
+    def _get_sketches(self):
+        """获取各列的统计草图，没有时扫描一次全量数据"""
+        if self.sketches is None:
+            self.sketches = DatasetSketches.from_frame(self.data)
+        return self.sketches 
\ No newline at end of file
@@ -0,0 +1,136 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+
+class BinningService:
+    """分箱和频数统计的共享缓存
+
+    键为 (数据集版本, 列名, 列类型, 规则)，规则为 'auto' 等numpy分箱规则、箱数、'box'（箱线图统计量）
+    或 'values'（取值频数）。分布分析、直方图、柱状图和箱线图对同一列同一规则只计算一次，
+    图表直接使用聚合后的结果，不再把原始行交给plotly。
+    超出条目数或总大小上限时按LRU顺序淘汰，缓存的结果会被多个请求共享，调用方不能修改。
+    """
+    # 按规则自动分箱时的最大箱数，避免极端分布产生过多的柱子
+    MAX_BINS = 1000
+    # 箱线图中保留的离群点数上限
+    MAX_OUTLIERS = 1000
+
+    def __init__(self, max_entries=512, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (result, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def histogram(self, version, series, bins='auto'):
+        """数值列的等宽分箱，返回 {'counts', 'edges', 'missing'}
+
+        bins 为箱数或numpy的分箱规则名，区间左闭右开，最后一个区间为闭区间。
+        NaN和无穷值不参与分箱，计入 missing。
+        """
+        return self._get_or_compute(_make_key(version, series, bins), lambda: self._compute_histogram(series, bins))
+
+    def box_stats(self, version, series):
+        """数值列的箱线图统计量，四分位数按线性插值，须线为1.5倍四分位距内的最远值"""
+        return self._get_or_compute(_make_key(version, series, 'box'), lambda: self._compute_box(series))
+
+    def value_counts(self, version, series):
+        """各取值的频数，按频数降序，与 Series.value_counts 相同"""
+        return self._get_or_compute(_make_key(version, series, 'values'), series.value_counts)
+
+    def invalidate(self, version):
+        """删除某个数据集版本的所有缓存结果"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == version]:
+                _, size = self._entries.pop(key)
+                self._bytes -= size
+
+    def stats(self):
+        """返回缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'entries': len(self._entries),
+                'bytes': self._bytes
+            }
+
+    def _get_or_compute(self, key, compute):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # 在锁外计算，同一个键并发未命中时可能重复计算，结果相同
+        result = compute()
+        size = _result_size(result)
+        if size <= self.max_bytes:
+            with self._lock:
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    self._bytes -= old[1]
+                self._entries[key] = (result, size)
+                self._bytes += size
+                while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                    _, (_, evicted_size) = self._entries.popitem(last=False)
+                    self._bytes -= evicted_size
+        return result
+
+    def _compute_histogram(self, series, bins):
+        values = _finite_values(series)
+        edges = np.histogram_bin_edges(values, bins=bins)
+        if isinstance(bins, str) and len(edges) - 1 > self.MAX_BINS:
+            edges = np.histogram_bin_edges(values, bins=self.MAX_BINS)
+        # 等宽分箱按箱数计算，numpy不需要对每个值做二分查找
+        counts, edges = np.histogram(values, bins=len(edges) - 1, range=(edges[0], edges[-1]))
+        return {'counts': counts, 'edges': edges, 'missing': int(len(series) - len(values))}
+
+    def _compute_box(self, series):
+        values = _finite_values(series)
+        if not len(values):
+            raise ValueError(f"列 {series.name} 没有有效的数值")
+        q1, median, q3 = np.percentile(values, [25, 50, 75])
+        iqr = q3 - q1
+        lower = values[values >= q1 - 1.5 * iqr].min()
+        upper = values[values <= q3 + 1.5 * iqr].max()
+        outliers = np.unique(values[(values < lower) | (values > upper)])
+        if len(outliers) > self.MAX_OUTLIERS:
+            # 均匀保留部分离群点，两端的极值总会保留
+            outliers = outliers[np.linspace(0, len(outliers) - 1, self.MAX_OUTLIERS).astype(np.int64)]
+        return {
+            'q1': float(q1),
+            'median': float(median),
+            'q3': float(q3),
+            'lowerfence': float(lower),
+            'upperfence': float(upper),
+            'mean': float(values.mean()),
+            'count': int(len(values)),
+            'outliers': outliers
+        }
+
+
+def _make_key(version, series, rule):
+    # 可视化器会把日期列转换为datetime，同名列的类型不同时分别缓存
+    return version, str(series.name), str(series.dtype), rule
+
+
+def _finite_values(series):
+    """数值列中的有限值，转换为float64数组"""
+    values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+    return values[np.isfinite(values)]
+
+
+def _result_size(result):
+    """估算缓存结果占用的字节数"""
+    if isinstance(result, pd.Series):
+        return int(result.memory_usage(index=True, deep=True))
+    return sum(value.nbytes for value in result.values() if isinstance(value, np.ndarray)) + 256
@@ -0,0 +1,113 @@
+import io
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threadpoolctl import threadpool_limits
+from sklearn.cluster import KMeans
+from sklearn.metrics import silhouette_score
+
+try:
+    from multiprocessing import context, popen_spawn_posix, reduction, spawn, util
+except ImportError:
+    # Windows没有 popen_spawn_posix，使用标准的spawn方式
+    popen_spawn_posix = None
+
+# 并行选择聚类数的进程池，首次使用时创建
+# 子进程只导入本模块和sklearn，不导入app或分析器
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def score_k(sample, k, silhouette_rows):
+    """在抽样数据上用k个簇聚类，返回轮廓系数和惯性（在子进程中执行）"""
+    # 每个进程只用一个线程，避免多进程下BLAS/OpenMP线程过多
+    with threadpool_limits(limits=1):
+        kmeans = KMeans(n_clusters=k, random_state=42, n_init='auto').fit(sample)
+        score = silhouette_score(sample, kmeans.labels_, sample_size=min(silhouette_rows, len(sample)),
+                                 random_state=42)
+    return {'silhouette': float(score), 'inertia': float(kmeans.inertia_)}
+
+
+def score_candidates(sample, candidates, silhouette_rows):
+    """在进程池中并行为各候选聚类数评分，返回 {k: 评分}
+
+    无法创建子进程时在当前进程中依次计算。子进程异常退出后进程池不能再使用，
+    此时丢弃进程池，本次在当前进程中计算，下次调用时重新创建。
+    """
+    global _pool
+    pool = None
+    try:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=min(4, os.cpu_count() or 1), mp_context=_worker_context())
+            pool = _pool
+        futures = {k: pool.submit(score_k, sample, k, silhouette_rows) for k in candidates}
+        return {k: future.result() for k, future in futures.items()}
+    except BrokenProcessPool:
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+    except (OSError, RuntimeError):
+        pass
+    return {k: score_k(sample, k, silhouette_rows) for k in candidates}
+
+
+def _worker_context():
+    """子进程不导入父进程主模块的spawn上下文
+
+    标准的spawn方式会在子进程中以 __mp_main__ 的名义重新执行父进程的主脚本，
+    以 python app.py 运行时每个子进程都会重复初始化数据库、任务管理器和各种缓存。
+    评分函数只依赖本模块，这里启动子进程时不传递主模块信息，也不修改父进程的任何全局状态。
+    """
+    if popen_spawn_posix is None:
+        return multiprocessing.get_context('spawn')
+    return _WorkerContext()
+
+
+if popen_spawn_posix is not None:
+    class _WorkerPopen(popen_spawn_posix.Popen):
+        """与 popen_spawn_posix.Popen 相同，只是准备数据中去掉了主模块"""
+
+        def _launch(self, process_obj):
+            from multiprocessing import resource_tracker
+            tracker_fd = resource_tracker.getfd()
+            self._fds.append(tracker_fd)
+            prep_data = spawn.get_preparation_data(process_obj._name)
+            prep_data.pop('init_main_from_name', None)
+            prep_data.pop('init_main_from_path', None)
+            fp = io.BytesIO()
+            context.set_spawning_popen(self)
+            try:
+                reduction.dump(prep_data, fp)
+                reduction.dump(process_obj, fp)
+            finally:
+                context.set_spawning_popen(None)
+
+            parent_r = child_w = child_r = parent_w = None
+            try:
+                parent_r, child_w = os.pipe()
+                child_r, parent_w = os.pipe()
+                cmd = spawn.get_command_line(tracker_fd=tracker_fd, pipe_handle=child_r)
+                self._fds.extend([child_r, child_w])
+                self.pid = util.spawnv_passfds(spawn.get_executable(), cmd, self._fds)
+                self.sentinel = parent_r
+                with open(parent_w, 'wb', closefd=False) as f:
+                    f.write(fp.getbuffer())
+            finally:
+                fds_to_close = [fd for fd in (parent_r, parent_w) if fd is not None]
+                self.finalizer = util.Finalize(self, util.close_fds, fds_to_close)
+                for fd in (child_r, child_w):
+                    if fd is not None:
+                        os.close(fd)
+
+    class _WorkerProcess(context.SpawnProcess):
+        @staticmethod
+        def _Popen(process_obj):
+            return _WorkerPopen(process_obj)
+
+    class _WorkerContext(context.SpawnContext):
+        Process = _WorkerProcess
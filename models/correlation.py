@@ -0,0 +1,202 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+METHODS = ('pearson', 'spearman')
+
+
+class CorrelationEngine:
+    """按列分块计算相关系数矩阵，并按数据集版本缓存
+
+    数值列中心化后按 TILE_COLUMNS 列分块，每对块的相关系数由几次矩阵乘法得到，矩阵乘法由BLAS多线程执行。
+    不另开线程池，也不修改进程级的BLAS线程数，以免影响同时执行的其他请求和后台任务。
+    含缺失值时按每对列共同非空的行计算，与 DataFrame.corr 一致。
+    Spearman 先把各列转换为平均秩再计算皮尔逊相关系数；含缺失值时各列的秩在该列全部非空值上计算，
+    而 DataFrame.corr 在每对列共同非空的行上重新排秩，两者只在有缺失值时略有差异。
+    分析和相关性热力图共用缓存的矩阵，键为 (数据集版本, 方法, 排序后的列集合)，
+    已缓存的矩阵包含所请求的全部列时直接从中取子矩阵。超出条目数或总大小上限时按LRU顺序淘汰。
+    """
+    # 每个分块的列数
+    TILE_COLUMNS = 128
+
+    def __init__(self, max_entries=64, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> 相关系数矩阵（ndarray）
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def matrix(self, version, data, columns, method='pearson', moments=None):
+        """返回相关系数矩阵，行列顺序与 columns 一致
+
+        moments 为已有的 RunningMoments，覆盖这些列时皮尔逊系数直接由协方差矩阵得到，不扫描数据。
+        """
+        if method not in METHODS:
+            raise ValueError(f"不支持的相关系数类型: {method}")
+        columns = list(dict.fromkeys(columns))
+        # 列的顺序不影响缓存，按排序后的列计算，返回时再按请求的顺序排列
+        ordered = sorted(columns, key=str)
+        names = tuple(str(col) for col in ordered)
+        key = (version, method, names)
+        with self._lock:
+            key, values = self._lookup(key)
+            if values is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if values is None:
+            if method == 'pearson' and moments is not None and moments.covers(ordered):
+                values = moments.correlation(ordered).to_numpy()
+            else:
+                values = self._compute(data, ordered, method)
+            self._put(key, values)
+
+        position = {name: i for i, name in enumerate(key[2])}
+        idx = [position[str(col)] for col in columns]
+        return pd.DataFrame(values[np.ix_(idx, idx)], index=columns, columns=columns)
+
+    def invalidate(self, version):
+        """删除某个数据集版本的所有缓存矩阵"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == version]:
+                self._bytes -= self._entries.pop(key).nbytes
+
+    def stats(self):
+        """返回缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'entries': len(self._entries),
+                'bytes': self._bytes
+            }
+
+    def _lookup(self, key):
+        """查找缓存的矩阵，没有完全相同的列集合时使用包含这些列的更大矩阵，返回 (命中的键, 矩阵)"""
+        values = self._entries.get(key)
+        if values is not None:
+            return key, values
+        wanted = set(key[2])
+        for cached_key, cached in self._entries.items():
+            if cached_key[:2] == key[:2] and wanted.issubset(cached_key[2]):
+                return cached_key, cached
+        return key, None
+
+    def _put(self, key, values):
+        if values.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._entries[key] = values
+            self._bytes += values.nbytes
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+    def _compute(self, data, columns, method):
+        """分块计算相关系数矩阵
+
+        所有列写入同一个按列存储的float64矩阵，中心化和标准化都在原矩阵上进行，
+        除该矩阵外只有逐块计算时的临时数组。
+        """
+        values = np.empty((len(data), len(columns)), order='F')
+        for j, col in enumerate(columns):
+            series = data[col].rank() if method == 'spearman' else data[col]
+            values[:, j] = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        missing = np.isnan(values)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if missing.any():
+                # 成对完整的行需要逐块统计有效行数和部分和，先按列均值中心化以减小舍入误差
+                values -= np.nanmean(values, axis=0)
+                values[missing] = 0.0
+                prepared = (values, ~missing)
+                tile = _pairwise_tile
+            else:
+                # 没有缺失值时标准化为单位长度，每块的相关系数就是一次矩阵乘法
+                del missing
+                values -= values.mean(axis=0)
+                values /= np.sqrt(np.einsum('ij,ij->j', values, values))
+                prepared = (values,)
+                tile = _complete_tile
+
+        n_cols = len(columns)
+        tiles = [slice(start, min(start + self.TILE_COLUMNS, n_cols))
+                 for start in range(0, n_cols, self.TILE_COLUMNS)]
+        result = np.empty((n_cols, n_cols))
+        for i, a in enumerate(tiles):
+            for b in tiles[i:]:
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    block = tile(prepared, a, b)
+                result[a, b] = block
+                result[b, a] = block.T
+
+        result = np.clip(result, -1.0, 1.0)
+        # 与 DataFrame.corr 一致，常数列的对角线为NaN
+        np.fill_diagonal(result, np.where(np.isnan(np.diag(result)), np.nan, 1.0))
+        return result
+
+
+def parse_top_k(value):
+    """把 top_k 参数转换为正整数，不是不小于1的整数时抛出 ValueError"""
+    if isinstance(value, bool):
+        raise ValueError("top_k 必须是不小于1的整数")
+    try:
+        top_k = int(value)
+        valid = float(value) == top_k and top_k >= 1
+    except (TypeError, ValueError):
+        valid = False
+    if not valid:
+        raise ValueError("top_k 必须是不小于1的整数")
+    return top_k
+
+
+def strongest_pairs(matrix, top_k=None, threshold=None):
+    """按相关系数绝对值从大到小返回变量对 [(列1, 列2, 相关系数)]
+
+    threshold 只保留绝对值不低于该值的变量对，top_k 最多返回的变量对数（不小于1），NaN不参与排序。
+    """
+    if top_k is not None:
+        top_k = parse_top_k(top_k)
+    columns = list(matrix.columns)
+    rows, cols = np.triu_indices(len(columns), k=1)
+    values = matrix.to_numpy()[rows, cols]
+    strength = np.abs(values)
+    keep = ~np.isnan(values)
+    if threshold is not None:
+        keep &= strength >= float(threshold)
+    rows, cols, values, strength = rows[keep], cols[keep], values[keep], strength[keep]
+    if top_k is not None and top_k < len(values):
+        # 先选出前 top_k 个再排序，不需要对全部变量对排序
+        selected = np.argpartition(-strength, top_k - 1)[:top_k]
+        rows, cols, values, strength = rows[selected], cols[selected], values[selected], strength[selected]
+    order = np.argsort(-strength, kind='stable')
+    return [(columns[rows[i]], columns[cols[i]], float(values[i])) for i in order]
+
+
+def _complete_tile(prepared, a, b):
+    """没有缺失值时一对分块的相关系数"""
+    values, = prepared
+    return values[:, a].T @ values[:, b]
+
+
+def _pairwise_tile(prepared, a, b):
+    """按成对完整的行计算一对分块的相关系数，有效行标记和平方值只为当前分块生成"""
+    values, valid = prepared
+    x, y = values[:, a], values[:, b]
+    valid_x, valid_y = valid[:, a].astype(np.float64), valid[:, b].astype(np.float64)
+    count = valid_x.T @ valid_y
+    sum_x = x.T @ valid_y
+    sum_y = valid_x.T @ y
+    var_x = (x * x).T @ valid_y - sum_x * sum_x / count
+    var_y = valid_x.T @ (y * y) - sum_y * sum_y / count
+    cov = x.T @ y - sum_x * sum_y / count
+    return np.where((count > 1) & (var_x > 0) & (var_y > 0), cov / np.sqrt(var_x * var_y), np.nan)
@@ -1,24 +1,213 @@
 import pandas as pd
 import numpy as np
 from sklearn.preprocessing import StandardScaler
+from models.metrics import stage
+from models.excel_reader import ExcelReader
 
 class DataProcessor:
+    # 清洗流程版本，修改处理逻辑时递增，使已缓存的处理结果失效
+    PIPELINE_VERSION = 2
+    # 类型推断时的抽样行数
+    SAMPLE_SIZE = 1000
+    # 唯一值数量不超过该上限且占比不超过该比例的文本列转换为category
+    CATEGORY_MAX_UNIQUE = 1000
+    CATEGORY_MAX_RATIO = 0.5
+    
     def __init__(self):
         self.data = None
         self.scaler = StandardScaler()
     
     def process_data(self, df):
         """处理输入的数据框"""
-        # 创建深拷贝以避免修改原始数据
-        self.data = df.copy(deep=True)
+        # 各清洗步骤只整列替换而不修改原有数组，浅拷贝即可保证原始数据不被修改，
+        # 未被替换的列与输入共享内存
+        self.data = df.copy(deep=False)
         
         # 基础清洗
-        self._remove_duplicates()
-        self._handle_missing_values()
-        self._convert_datatypes()
+        with stage('process.remove_duplicates'):
+            self._remove_duplicates()
+        with stage('process.handle_missing_values'):
+            self._handle_missing_values()
+        with stage('process.convert_datatypes'):
+            self._convert_datatypes()
+        
+        return self.data
+    
+    def config_signature(self):
+        """返回影响处理结果的配置，用于生成缓存键"""
+        return {
+            'pipeline_version': self.PIPELINE_VERSION,
+            'sample_size': self.SAMPLE_SIZE,
+            'category_max_unique': self.CATEGORY_MAX_UNIQUE,
+            'category_max_ratio': self.CATEGORY_MAX_RATIO
+        }
+    
+    def process_csv_stream(self, filepath, chunksize=100000, encoding='utf-8'):
+        """分块流式读取并处理CSV文件，峰值内存只与分块大小相关"""
+        def read_chunks():
+            # 先按字符串读取，保证各分块的行哈希和类型判断一致
+            return pd.read_csv(filepath, encoding=encoding, dtype=str, chunksize=chunksize)
+        return self.process_chunks(read_chunks)
+    
+    def process_excel_stream(self, filepath, sheet=None, cell_range=None, chunksize=100000):
+        """逐行流式读取Excel工作表并分块处理，sheet 和 cell_range 选择工作表和单元格范围
+        
+        工作表只解析一次，分块暂存在临时目录中供第二遍处理读取，峰值内存只与分块大小相关。
+        """
+        reader = ExcelReader(filepath, sheet=sheet, cell_range=cell_range)
+        with reader.spooled_chunks(chunksize) as read_chunks:
+            return self.process_chunks(read_chunks)
+    
+    def process_chunks(self, read_chunks):
+        """两遍处理分块数据
+        
+        read_chunks 每次调用返回一个新的分块迭代器（各列均为字符串）。
+        第一遍跨分块去重并统计缺失值填充所需的均值和众数，
+        第二遍按去重结果和填充值逐块清洗后拼接。
+        """
+        seen_hashes = np.empty(0, dtype=np.uint64)
+        keep_masks = []
+        sums, counts = {}, {}
+        value_counts = {}
+        non_numeric = {}  # 列名 -> 首次出现非数值的分块序号
+        
+        # 第一遍：去重并收集填充统计量
+        with stage('process.scan_chunks'):
+            for i, chunk in enumerate(read_chunks()):
+                keep, seen_hashes = self._dedup_chunk(chunk, seen_hashes)
+                keep_masks.append(keep)
+                chunk = chunk[keep]
+            
+                for col in chunk.columns:
+                    values = chunk[col]
+                    if col not in non_numeric:
+                        numeric = pd.to_numeric(values, errors='coerce')
+                        if (numeric.isna() & values.notna()).any():
+                            non_numeric[col] = i
+                        else:
+                            sums[col] = sums.get(col, 0.0) + float(numeric.sum())
+                            counts[col] = counts.get(col, 0) + int(numeric.count())
+                            continue
+                    value_counts[col] = values.value_counts().add(
+                        value_counts.get(col, pd.Series(dtype='int64')), fill_value=0)
+        
+            # 在后续分块才出现非数值的列，补齐之前分块的频数
+            late_start = max(non_numeric.values(), default=0)
+            if late_start > 0:
+                for i, chunk in enumerate(read_chunks()):
+                    if i >= late_start:
+                        break
+                    chunk = chunk[keep_masks[i]]
+                    for col, first in non_numeric.items():
+                        if i < first:
+                            value_counts[col] = chunk[col].value_counts().add(value_counts[col], fill_value=0)
+        
+        means = {col: sums[col] / counts[col] if counts.get(col) else np.nan
+                 for col in sums if col not in non_numeric}
+        modes = {col: self._mode_from_counts(value_counts[col]) for col in non_numeric}
+        
+        # 第二遍：按去重结果清洗每个分块
+        with stage('process.clean_chunks'):
+            parts = []
+            for chunk, keep in zip(read_chunks(), keep_masks):
+                chunk = chunk[keep].copy()
+                for col in chunk.columns:
+                    if col in means:
+                        chunk[col] = pd.to_numeric(chunk[col]).fillna(means[col])
+                    elif modes.get(col) is not None:
+                        chunk[col] = chunk[col].fillna(modes[col])
+                parts.append(chunk)
         
+            self.data = pd.concat(parts)
+            del parts
+        with stage('process.convert_datatypes'):
+            self._convert_datatypes()
         return self.data
     
+    @staticmethod
+    def _dedup_chunk(chunk, seen_hashes):
+        """根据行哈希计算分块中需要保留的行，并返回更新后的已见哈希（有序）"""
+        hashes = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+        return DataProcessor._dedup_hashes(hashes, seen_hashes)
+    
+    @staticmethod
+    def _dedup_hashes(hashes, seen_hashes):
+        """去掉自身重复或已在有序数组 seen_hashes 中出现的哈希，返回 (保留标记, 合并后的有序哈希)"""
+        keep = ~pd.Series(hashes).duplicated().to_numpy()
+        if len(seen_hashes):
+            pos = np.searchsorted(seen_hashes, hashes)
+            pos[pos == len(seen_hashes)] = 0
+            keep &= seen_hashes[pos] != hashes
+        new_hashes = np.sort(hashes[keep])
+        # 两段有序数组拼接后用稳定排序合并，复杂度接近线性
+        merged = np.concatenate([seen_hashes, new_hashes])
+        merged.sort(kind='stable')
+        return keep, merged
+    
+    @staticmethod
+    def row_hashes(data):
+        """按行计算哈希，结果不随数值列的存储类型变化
+        
+        数值列统一按float64计算（int8和int64的相同取值哈希不同，追加数据后整数列可能被提升为更宽的类型），
+        category列与其取值的哈希相同。
+        """
+        columns = {}
+        for col in data.columns:
+            series = data[col]
+            if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+                series = pd.Series(series.to_numpy(dtype=np.float64, na_value=np.nan), copy=False)
+            columns[col] = series.reset_index(drop=True)
+        return pd.util.hash_pandas_object(pd.DataFrame(columns), index=False).to_numpy()
+    
+    @staticmethod
+    def _mode_from_counts(value_counts):
+        """从频数统计中取众数，并列时与 Series.mode 一致取最小值"""
+        if value_counts.empty:
+            return None
+        top = value_counts[value_counts == value_counts.max()]
+        return sorted(top.index)[0]
+    
+    def append_data(self, existing, df, existing_hashes=None):
+        """清洗新数据并追加到已有数据之后，返回 (合并后的数据, 实际新增的行, 合并后数据的有序行哈希)
+        
+        existing_hashes 为已有数据的有序行哈希（上一次追加时返回），新数据只与它比较去重，
+        不需要重新扫描已有数据；为None时由已有数据计算一次。
+        """
+        new = self.process_data(df)
+        if set(new.columns) != set(existing.columns):
+            raise ValueError("追加数据的列与现有数据不一致")
+        new = new[list(existing.columns)]
+        start = int(existing.index.max()) + 1 if len(existing) else 0
+        new.index = pd.RangeIndex(start, start + len(new))
+        
+        if existing_hashes is None:
+            existing_hashes = np.sort(self.row_hashes(existing))
+        # 与已有数据重复的行不再追加
+        is_new, hashes = self._dedup_hashes(self.row_hashes(new), existing_hashes)
+        if not is_new.all():
+            new = new[is_new]
+        combined = self._concat_aligned(existing, new)
+        return combined, combined.iloc[len(existing):], hashes
+    
+    @staticmethod
+    def _concat_aligned(existing, new):
+        """按列拼接两份数据，分类列合并类别而不是退化为object"""
+        columns = {}
+        for col in existing.columns:
+            old_values, new_values = existing[col], new[col]
+            if isinstance(old_values.dtype, pd.CategoricalDtype) and not \
+                    pd.api.types.is_numeric_dtype(new_values):
+                merged = pd.api.types.union_categoricals(
+                    [old_values.array, new_values.astype('category').array])
+                columns[col] = pd.Series(merged, index=existing.index.append(new.index))
+            else:
+                if isinstance(old_values.dtype, pd.CategoricalDtype):
+                    old_values = old_values.astype(object)
+                if isinstance(new_values.dtype, pd.CategoricalDtype):
+                    new_values = new_values.astype(object)
+                columns[col] = pd.concat([old_values, new_values])
+        return pd.DataFrame(columns)
+    
     def _remove_duplicates(self):
         """删除重复行，保留第一次出现的记录"""
         self.data.drop_duplicates(keep='first', inplace=True)
@@ -38,18 +227,67 @@ class DataProcessor:
             self.data[col] = self.data[col].fillna(self.data[col].mode()[0])
     
     def _convert_datatypes(self):
-        """转换数据类型，保持分类列不变"""
-        # 保持这些列为分类数据
-        category_columns = ['产品类别', '地区']
+        """根据抽样推断的列类型转换数据，并压缩数值列和低基数文本列"""
+        for col, kind in self._infer_schema().items():
+            series = self.data[col]
+            if kind == 'numeric':
+                converted = pd.to_numeric(series, errors='coerce')
+                # 抽样之外存在无法转换的值时保持原样
+                if (converted.isna() & series.notna()).any():
+                    continue
+                self.data[col] = self._downcast_numeric(converted)
+            elif kind == 'integer':
+                self.data[col] = self._downcast_numeric(series)
+            elif kind == 'datetime':
+                converted = pd.to_datetime(series, format='ISO8601', errors='coerce')
+                if (converted.isna() & series.notna()).any():
+                    continue
+                self.data[col] = converted
+            elif kind == 'category':
+                self.data[col] = series.astype('category')
+    
+    def _infer_schema(self):
+        """抽样推断每列的目标类型，只有抽样全部通过的列才会做整列转换"""
+        schema = {}
+        n_rows = len(self.data)
+        if n_rows == 0:
+            return schema
         
+        # 在整列上均匀抽样，避免只看到文件开头的数据
+        positions = np.unique(np.linspace(0, n_rows - 1, min(self.SAMPLE_SIZE, n_rows)).astype(np.int64))
         for col in self.data.columns:
-            if col not in category_columns:
-                try:
-                    # 尝试转换为数值类型
-                    numeric_values = pd.to_numeric(self.data[col])
-                    self.data[col] = numeric_values
-                except:
-                    continue
+            series = self.data[col]
+            if pd.api.types.is_bool_dtype(series):
+                continue
+            if pd.api.types.is_integer_dtype(series):
+                schema[col] = 'integer'
+                continue
+            if not pd.api.types.is_object_dtype(series):
+                continue
+            
+            sample = series.iloc[positions].dropna()
+            if sample.empty:
+                continue
+            if pd.to_numeric(sample, errors='coerce').notna().all():
+                schema[col] = 'numeric'
+            elif (sample.map(type) == str).all() and \
+                    pd.to_datetime(sample, format='ISO8601', errors='coerce').notna().all():
+                schema[col] = 'datetime'
+            elif self._is_low_cardinality(series):
+                schema[col] = 'category'
+        return schema
+    
+    def _is_low_cardinality(self, series):
+        """判断文本列是否适合转换为category类型"""
+        n_unique = series.nunique()
+        return n_unique <= self.CATEGORY_MAX_UNIQUE and n_unique <= len(series) * self.CATEGORY_MAX_RATIO
+    
+    @staticmethod
+    def _downcast_numeric(series):
+        """整数列压缩为能容纳全部取值的最小有符号整数类型，浮点列保持float64以免影响统计精度"""
+        if pd.api.types.is_integer_dtype(series):
+            return pd.to_numeric(series, downcast='integer')
+        return series
     
     def normalize_data(self, columns):
         """标准化选定的数值列"""
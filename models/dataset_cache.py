@@ -0,0 +1,159 @@
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+
+
+class DatasetCache:
+    """以文件内容哈希为键的列式数据集缓存
+
+    每个处理后的数据集保存为一个目录，每列一个 .npy 文件，
+    读取时通过内存映射直接使用，无需重新解析和清洗原始文件。
+    """
+
+    def __init__(self, cache_dir='data/cache', max_entries=32):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def make_key(self, filepath, config):
+        """根据文件内容和处理配置生成缓存键"""
+        digest = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        digest.update(json.dumps(config, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+        return digest.hexdigest()
+
+    def load(self, key):
+        """读取缓存的数据集，未命中时返回None"""
+        path = os.path.join(self.cache_dir, key)
+        if not os.path.isdir(path):
+            return None
+        try:
+            data = load_frame(path)
+        except (OSError, ValueError, KeyError):
+            # 缓存损坏时当作未命中处理
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+        os.utime(path)
+        return data
+
+    def save(self, key, data):
+        """保存数据集到缓存，数据无法列式存储时返回False"""
+        path = os.path.join(self.cache_dir, key)
+        if os.path.isdir(path):
+            return True
+
+        # 先写入临时目录再重命名，避免并发读取到不完整的缓存
+        tmp_path = os.path.join(self.cache_dir, f'.{key}.{uuid.uuid4().hex}')
+        try:
+            if not save_frame(data, tmp_path):
+                return False
+            try:
+                os.rename(tmp_path, path)
+            except OSError:
+                # 其他请求已经写入了相同的缓存
+                pass
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+        self._prune()
+        return True
+
+    def _prune(self):
+        """只保留最近使用的 max_entries 个缓存"""
+        entries = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                   if not name.startswith('.')]
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=os.path.getmtime)
+        for path in entries[:len(entries) - self.max_entries]:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def save_frame(data, path):
+    """把数据框按列保存到目录中，包含不支持的类型时返回False"""
+    os.makedirs(path, exist_ok=True)
+    meta = {'columns': [], 'index': None}
+
+    if isinstance(data.index, pd.RangeIndex):
+        meta['index'] = {'kind': 'range', 'start': data.index.start,
+                         'stop': data.index.stop, 'step': data.index.step}
+    elif pd.api.types.is_integer_dtype(data.index):
+        np.save(os.path.join(path, 'index.npy'), data.index.to_numpy())
+        meta['index'] = {'kind': 'array'}
+    else:
+        return False
+
+    for i, col in enumerate(data.columns):
+        series = data[col]
+        filename = f'col_{i}.npy'
+        column_meta = {'name': col, 'file': filename, 'dtype': str(series.dtype)}
+
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            categories = _encode_values(series.cat.categories)
+            if categories is None:
+                return False
+            np.save(os.path.join(path, filename), series.cat.codes.to_numpy())
+            column_meta.update(kind='category', categories=categories,
+                               ordered=bool(series.cat.ordered))
+        elif pd.api.types.is_object_dtype(series):
+            # 字符串列按字典编码保存
+            codes, uniques = pd.factorize(series)
+            uniques = _encode_values(uniques)
+            if uniques is None:
+                return False
+            np.save(os.path.join(path, filename), codes.astype(np.int32))
+            column_meta.update(kind='object', uniques=uniques)
+        elif isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biufcmM':
+            np.save(os.path.join(path, filename), series.to_numpy())
+            column_meta.update(kind='array')
+        else:
+            return False
+
+        meta['columns'].append(column_meta)
+
+    with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    return True
+
+
+def load_frame(path, mmap_mode='r'):
+    """从目录中读取按列保存的数据框，数值列以内存映射方式加载"""
+    with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+        meta = json.load(f)
+
+    columns = {}
+    for column_meta in meta['columns']:
+        values = np.load(os.path.join(path, column_meta['file']), mmap_mode=mmap_mode)
+        if column_meta['kind'] == 'category':
+            values = pd.Categorical.from_codes(values, categories=column_meta['categories'],
+                                               ordered=column_meta['ordered'])
+        elif column_meta['kind'] == 'object':
+            uniques = np.array(column_meta['uniques'] + [np.nan], dtype=object)
+            values = uniques[values]  # 编码-1对应末尾的缺失值
+        columns[column_meta['name']] = values
+
+    index_meta = meta['index']
+    if index_meta['kind'] == 'range':
+        index = pd.RangeIndex(index_meta['start'], index_meta['stop'], index_meta['step'])
+    else:
+        index = pd.Index(np.load(os.path.join(path, 'index.npy'), mmap_mode=mmap_mode))
+
+    return pd.DataFrame(columns, index=index, columns=[c['name'] for c in meta['columns']], copy=False)
+
+
+def _encode_values(values):
+    """把类别值转换为可JSON保存的列表，包含其他类型时返回None"""
+    result = []
+    for value in values:
+        if isinstance(value, (np.integer, np.floating, np.bool_)):
+            value = value.item()
+        if not isinstance(value, (str, int, float, bool)):
+            return None
+        result.append(value)
+    return result
@@ -0,0 +1,264 @@
+import os
+import uuid
+import threading
+from collections import OrderedDict
+import pandas as pd
+from models.analyzer import DataAnalyzer
+from models.visualizer import DataVisualizer
+from models.result_cache import next_dataset_version
+
+DEFAULT_DATASET_ID = 'default'
+
+
+class DatasetSnapshot:
+    """某个用户某个数据集的只读快照
+
+    快照创建后不再修改，新的上传会生成新的快照替换旧快照，
+    因此并发的分析和可视化请求总能读到一致的数据而无需加锁。
+    """
+
+    def __init__(self, user_id, dataset_id, data, version=None, analysis_cache=None,
+                 moments=None, sketches=None, path=None, binning=None, correlation=None, row_hashes=None):
+        self.user_id = user_id
+        self.dataset_id = dataset_id
+        self.data = data
+        self.version = version if version is not None else next_dataset_version()
+        self.analysis_cache = analysis_cache
+        self.binning = binning  # 分析器和可视化器共用的分箱缓存
+        self.correlation = correlation  # 分析器和可视化器共用的相关系数矩阵缓存
+        self.nbytes = int(data.memory_usage(index=True, deep=True).sum())
+        self.row_hashes = row_hashes  # 有序的行哈希，追加数据时用于去重，为None时在需要时计算
+        self.path = path  # 共享存储中映射的目录，为None时只保存在本进程中
+        self.shared = path is not None  # 已发布到共享存储，可以从存储重新加载
+        self._moments = moments
+        self._sketches = sketches
+        self._analyzer = None
+        self._visualizer = None
+
+    @property
+    def analyzer(self):
+        """绑定到当前快照的分析器"""
+        if self._analyzer is None:
+            self._analyzer = DataAnalyzer(cache=self.analysis_cache, binning=self.binning,
+                                          correlation=self.correlation).set_data(
+                self.data, version=self.version, moments=self._moments, sketches=self._sketches)
+        return self._analyzer
+
+    @property
+    def moments(self):
+        """数值列的增量统计量，尚未计算时为None"""
+        if self._analyzer is not None:
+            return self._analyzer.moments
+        return self._moments
+
+    @property
+    def sketches(self):
+        """各列的统计草图，尚未构建时为None"""
+        if self._analyzer is not None:
+            return self._analyzer.sketches
+        return self._sketches
+
+    @property
+    def visualizer(self):
+        """绑定到当前快照的可视化器"""
+        if self._visualizer is None:
+            self._visualizer = DataVisualizer(binning=self.binning, correlation=self.correlation).set_data(
+                self.data, version=self.version)
+        return self._visualizer
+
+
+class DatasetRegistry:
+    """按用户和数据集ID管理数据快照
+
+    内存中的快照总大小受 memory_budget 限制，超出时按LRU顺序
+    把最久未使用的快照写到 spill_dir，下次访问时再从磁盘加载。
+    指定共享存储 store 时，新快照会发布到存储中，其他工作进程按存储的索引加载同一份数据，
+    本进程中的快照版本落后于索引时自动换成最新版本。
+    """
+
+    def __init__(self, memory_budget=512 * 1024 * 1024, spill_dir='data/spill', analysis_cache=None,
+                 store=None, binning=None, correlation=None):
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.analysis_cache = analysis_cache  # 快照被替换或删除时清理其分析结果缓存
+        self.store = store  # 可选的SharedDatasetStore
+        self.binning = binning  # 可选的BinningService，快照被替换或删除时清理其分箱结果
+        self.correlation = correlation  # 可选的CorrelationEngine，同样按版本清理
+        self._entries = OrderedDict()  # (user_id, dataset_id) -> DatasetSnapshot
+        self._spilled = {}  # (user_id, dataset_id) -> (path, version)
+        self._used = 0
+        self._lock = threading.RLock()
+        os.makedirs(self.spill_dir, exist_ok=True)
+
+    def put(self, user_id, data, dataset_id=None, moments=None, sketches=None, row_hashes=None):
+        """注册新的数据快照，返回该快照"""
+        dataset_id = dataset_id or DEFAULT_DATASET_ID
+        key = (str(user_id), dataset_id)
+        version = next_dataset_version()
+        path = None
+        if self.store is not None:
+            path = self.store.publish(key[0], dataset_id, data, version, moments=moments, sketches=sketches,
+                                      row_hashes=row_hashes)
+            if path is not None:
+                # 本进程也改用共享存储中的映射，不再单独持有一份数据
+                data = self.store.load(path)[0]
+            else:
+                # 无法共享的数据只保存在本进程中，删除索引中的旧版本以免其他进程读到过期数据
+                self.store.remove(key[0], dataset_id)
+        snapshot = DatasetSnapshot(key[0], dataset_id, data, version=version, analysis_cache=self.analysis_cache,
+                                   moments=moments, sketches=sketches, path=path, binning=self.binning,
+                                   correlation=self.correlation, row_hashes=row_hashes)
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = snapshot
+            self._used += snapshot.nbytes
+            self._evict(keep=key)
+        return snapshot
+
+    def get(self, user_id, dataset_id=None):
+        """获取数据快照，不存在时返回None"""
+        key = (str(user_id), dataset_id or DEFAULT_DATASET_ID)
+        if self.store is not None:
+            shared = self._get_shared(key)
+            if shared is not None:
+                return shared
+        with self._lock:
+            snapshot = self._entries.get(key)
+            if snapshot is not None:
+                self._entries.move_to_end(key)
+                return snapshot
+
+            if key not in self._spilled:
+                return None
+
+            path, version = self._spilled.pop(key)
+            data = pd.read_pickle(path)
+            os.remove(path)
+            snapshot = DatasetSnapshot(key[0], key[1], data, version=version,
+                                       analysis_cache=self.analysis_cache, binning=self.binning,
+                                       correlation=self.correlation)
+            self._entries[key] = snapshot
+            self._used += snapshot.nbytes
+            self._evict(keep=key)
+            return snapshot
+
+    def _get_shared(self, key):
+        """按共享存储的索引返回最新版本的快照，索引中没有该数据集时返回None
+
+        数据集被共享存储移到磁盘后版本不变，只换成映射新目录中的文件，原有的分析缓存仍然有效。
+        """
+        entry = self.store.lookup(*key)
+        with self._lock:
+            snapshot = self._entries.get(key)
+            if entry is None:
+                if snapshot is not None and snapshot.shared:
+                    # 已被其他进程删除
+                    self._discard(key)
+                return None
+            
+            version, path = entry
+            if snapshot is None or snapshot.version != version or snapshot.path != path:
+                try:
+                    data, moments, sketches, row_hashes = self.store.load(path)
+                except FileNotFoundError:
+                    # 加载期间被新版本替换或被移到磁盘，按最新的索引重试一次
+                    latest = self.store.lookup(*key)
+                    if latest is None or latest == entry:
+                        self.store.remove(key[0], key[1], version=version)
+                        return None
+                    version, path = latest
+                    data, moments, sketches, row_hashes = self.store.load(path)
+                if snapshot is not None and snapshot.version == version:
+                    # 同一版本换了存放位置，保留已计算的统计量，不清理该版本的缓存
+                    moments = snapshot.moments if snapshot.moments is not None else moments
+                    sketches = snapshot.sketches if snapshot.sketches is not None else sketches
+                    row_hashes = snapshot.row_hashes if snapshot.row_hashes is not None else row_hashes
+                    self._entries.pop(key)
+                    self._used -= snapshot.nbytes
+                else:
+                    self._discard(key)
+                snapshot = DatasetSnapshot(key[0], key[1], data, version=version,
+                                           analysis_cache=self.analysis_cache,
+                                           moments=moments, sketches=sketches, path=path, binning=self.binning,
+                                           correlation=self.correlation, row_hashes=row_hashes)
+                self._entries[key] = snapshot
+                self._used += snapshot.nbytes
+                self._evict(keep=key)
+            self._entries.move_to_end(key)
+            return snapshot
+    
+    def append(self, user_id, data, new_rows, dataset_id=None, row_hashes=None):
+        """用追加后的完整数据替换快照，已有的增量统计量和草图只用新增行更新
+
+        row_hashes 为追加后数据的有序行哈希，保存在新快照中供下一次追加去重。
+        """
+        previous = self.get(user_id, dataset_id)
+        moments = sketches = None
+        if previous is not None and previous.moments is not None:
+            # 统计量只包含用到过的数值列，追加后其中某列不再是数值列时无法增量更新，交给分析器重新计算
+            if all(col in data.columns and pd.api.types.is_numeric_dtype(data[col])
+                   for col in previous.moments.columns):
+                moments = previous.moments.copy().update_frame(new_rows)
+        if previous is not None and previous.sketches is not None and previous.sketches.compatible(data):
+            sketches = previous.sketches.copy().update_frame(new_rows)
+        return self.put(user_id, data, dataset_id=dataset_id, moments=moments, sketches=sketches,
+                        row_hashes=row_hashes)
+
+    def remove(self, user_id, dataset_id=None):
+        """删除数据快照（包括已写入磁盘的）"""
+        key = (str(user_id), dataset_id or DEFAULT_DATASET_ID)
+        with self._lock:
+            self._discard(key)
+        if self.store is not None:
+            self.store.remove(*key)
+
+    def list_datasets(self, user_id):
+        """列出某个用户的所有数据集ID"""
+        user_id = str(user_id)
+        with self._lock:
+            keys = list(self._entries) + list(self._spilled)
+        dataset_ids = {dataset_id for uid, dataset_id in keys if uid == user_id}
+        if self.store is not None:
+            dataset_ids.update(self.store.list_datasets(user_id))
+        return sorted(dataset_ids)
+
+    def memory_usage(self):
+        """当前驻留内存中的快照总大小（字节）"""
+        return self._used
+
+    def _discard(self, key):
+        """移除某个键对应的内存快照和磁盘文件"""
+        snapshot = self._entries.pop(key, None)
+        if snapshot is not None:
+            self._used -= snapshot.nbytes
+            self._invalidate(snapshot.version)
+        spilled = self._spilled.pop(key, None)
+        if spilled is not None:
+            if os.path.exists(spilled[0]):
+                os.remove(spilled[0])
+            self._invalidate(spilled[1])
+
+    def _invalidate(self, version):
+        """清理某个版本的分析结果、分箱和相关系数矩阵缓存"""
+        if self.analysis_cache is not None:
+            self.analysis_cache.invalidate(version)
+        if self.binning is not None:
+            self.binning.invalidate(version)
+        if self.correlation is not None:
+            self.correlation.invalidate(version)
+
+    def _evict(self, keep=None):
+        """超出内存预算时按LRU顺序把快照写到磁盘"""
+        while self._used > self.memory_budget and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            if key == keep:
+                self._entries.move_to_end(key)
+                key = next(iter(self._entries))
+            snapshot = self._entries.pop(key)
+            self._used -= snapshot.nbytes
+            if snapshot.shared:
+                # 共享存储中已有该数据，下次访问时重新映射即可
+                continue
+            path = os.path.join(self.spill_dir, f'{uuid.uuid4().hex}.pkl')
+            snapshot.data.to_pickle(path)
+            self._spilled[key] = (path, snapshot.version)
@@ -0,0 +1,91 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DB_PATH = 'data/database.db'
+
+
+class ConnectionPool:
+    """SQLite连接池
+
+    连接以WAL模式打开，读操作不会被写操作阻塞。连接在线程之间复用，
+    每个连接缓存最近使用的已编译语句，使用固定的参数化SQL时不必重复解析。
+    """
+
+    def __init__(self, db_path=DB_PATH, max_connections=8, timeout=10, cached_statements=128):
+        self.db_path = db_path
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        """借出一个连接，正常结束时提交，出错时回滚"""
+        conn = self._acquire()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self._idle.put(conn)
+
+    def close_all(self):
+        """关闭所有空闲连接"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+    def _acquire(self):
+        """优先复用空闲连接，未达上限时新建，否则等待其他线程归还"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.max_connections
+            if create:
+                self._created += 1
+        if not create:
+            try:
+                return self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise RuntimeError("数据库连接繁忙，请稍后再试")
+        try:
+            return self._connect()
+        except BaseException:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')  # WAL模式下足以保证一致性，减少fsync
+        return conn
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path=DB_PATH):
+    """获取某个数据库文件的共享连接池，fork出的子进程会创建自己的连接池"""
+    key = (os.path.abspath(db_path), os.getpid())
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(db_path)
+        return pool
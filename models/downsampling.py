@@ -0,0 +1,49 @@
+import numpy as np
+
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets 降采样，返回保留点的下标
+
+    x 需要单调递增且不含缺失值，保留首尾两点，中间每个桶选出与前一个选中点、
+    下一个桶均值构成三角形面积最大的点，能较好地保留折线的形状。
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # 中间 n-2 个点平均分到 n_out-2 个桶
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # 下一个桶的均值点，最后一个桶用末尾点
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+            next_x = x[next_start:next_end].mean()
+            next_y = y[next_start:next_end].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+
+        bucket_x = x[start:end]
+        bucket_y = y[start:end]
+        area = np.abs((x[previous] - next_x) * (bucket_y - y[previous]) -
+                      (x[previous] - bucket_x) * (next_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        selected[i + 1] = previous
+
+    return selected
+
+
+def density_grid(x, y, n_cells):
+    """把散点聚合为约 n_cells 个网格的计数，返回 (计数矩阵[y, x], x中心, y中心)"""
+    bins = max(int(np.sqrt(n_cells)), 1)
+    counts, x_edges, y_edges = np.histogram2d(x, y, bins=bins)
+    x_centers = (x_edges[:-1] + x_edges[1:]) / 2
+    y_centers = (y_edges[:-1] + y_edges[1:]) / 2
+    return counts.T, x_centers, y_centers
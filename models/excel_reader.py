@@ -0,0 +1,232 @@
+import os
+import re
+import datetime
+import tempfile
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+EXCEL_EXTENSIONS = {'xlsx', 'xlsm', 'xls'}
+# 单元格范围，如 A1:G1000、B3:F（行不限）、A3（从A3开始到末尾）、B:F、3:100
+RANGE_PATTERN = re.compile(r'^([A-Z]{0,3})(\d*)(?::([A-Z]{0,3})(\d*))?$')
+
+
+class ExcelReader:
+    """按行流式读取Excel工作表
+
+    xlsx文件以openpyxl的只读模式逐行解析，不构建完整的工作簿对象，内存占用只与分块大小相关；
+    xls（旧版二进制格式）需要xlrd，该格式最多65536行，整表读取。
+    sheet 为工作表名称或从0开始的序号，cell_range 为 "A1:G1000"、"B:F" 这样的单元格范围，
+    范围内的第一行作为表头。
+    """
+
+    def __init__(self, filepath, sheet=None, cell_range=None):
+        self.filepath = filepath
+        self.sheet = sheet
+        self.cell_range = cell_range
+        self.is_xls = filepath.lower().endswith('.xls')
+        self.bounds = self._parse_range(cell_range)
+
+    def sheet_names(self):
+        """返回工作簿中的工作表名称"""
+        if self.is_xls:
+            with pd.ExcelFile(self.filepath, engine=self._xls_engine()) as book:
+                return list(book.sheet_names)
+        workbook = self._open_workbook()
+        try:
+            return list(workbook.sheetnames)
+        finally:
+            workbook.close()
+
+    def read_chunks(self, chunksize=100000):
+        """逐块返回数据框，各列均为字符串（缺失为NaN），可直接交给 DataProcessor.process_chunks
+
+        日期按ISO格式输出，与CSV文件读入的文本一致，由后续的类型推断统一转换。
+        """
+        rows = self._iter_rows()
+        try:
+            header = self._make_header(next(rows, None))
+            width = len(header)
+            buffer = []
+            emitted = False
+            for row in rows:
+                values = [_to_text(value) for value in row[:width]]
+                if all(value is np.nan for value in values):
+                    continue
+                values.extend([np.nan] * (width - len(values)))
+                buffer.append(values)
+                if len(buffer) >= chunksize:
+                    yield pd.DataFrame(buffer, columns=header, dtype=object)
+                    buffer = []
+                    emitted = True
+            if buffer or not emitted:
+                yield pd.DataFrame(buffer, columns=header, dtype=object)
+        finally:
+            rows.close()
+
+    @contextmanager
+    def spooled_chunks(self, chunksize=100000, spill_dir=None):
+        """只解析一次工作表的分块读取
+
+        返回的函数每次调用返回一个新的分块迭代器。第一次迭代时解析工作表并把分块写入临时目录，
+        之后的迭代直接读取临时文件，process_chunks 多遍处理时不必重复解析XML。
+        退出上下文时删除临时文件。
+        """
+        with tempfile.TemporaryDirectory(prefix='excel-', dir=spill_dir) as tmp_dir:
+            paths = []
+            complete = False
+
+            def read_chunks():
+                nonlocal complete
+                if complete:
+                    return (pd.read_pickle(path) for path in paths)
+                return spool()
+
+            def spool():
+                nonlocal complete
+                # 上一次解析没有读完时重新解析
+                paths.clear()
+                for i, chunk in enumerate(self.read_chunks(chunksize)):
+                    path = os.path.join(tmp_dir, f'{i}.pkl')
+                    chunk.to_pickle(path)
+                    paths.append(path)
+                    yield chunk
+                complete = True
+
+            yield read_chunks
+
+    def read_frame(self):
+        """读取整个范围为数据框，保留单元格的原始类型"""
+        rows = self._iter_rows()
+        try:
+            header = self._make_header(next(rows, None))
+            width = len(header)
+            data = []
+            for row in rows:
+                values = [None if _is_missing(value) else value for value in row[:width]]
+                if all(value is None for value in values):
+                    continue
+                values.extend([None] * (width - len(values)))
+                data.append(values)
+        finally:
+            rows.close()
+        return pd.DataFrame(data, columns=header).infer_objects()
+
+    def _iter_rows(self):
+        """逐行返回范围内单元格的值"""
+        min_col, min_row, max_col, max_row = self.bounds
+        if self.is_xls:
+            frame = pd.read_excel(self.filepath, engine=self._xls_engine(), header=None, dtype=object,
+                                  sheet_name=self._resolve_sheet(self.sheet_names()))
+            frame = frame.iloc[min_row - 1:max_row, min_col - 1:max_col]
+            yield from frame.itertuples(index=False, name=None)
+            return
+
+        workbook = self._open_workbook()
+        try:
+            worksheet = workbook[self._resolve_sheet(workbook.sheetnames)]
+            yield from worksheet.iter_rows(min_row=min_row, max_row=max_row, min_col=min_col,
+                                           max_col=max_col, values_only=True)
+        finally:
+            # 只读模式下工作簿一直持有文件句柄，读完后关闭
+            workbook.close()
+
+    def _open_workbook(self):
+        if openpyxl is None:
+            raise ValueError("读取xlsx文件需要安装openpyxl")
+        return openpyxl.load_workbook(self.filepath, read_only=True, data_only=True)
+
+    @staticmethod
+    def _xls_engine():
+        try:
+            import xlrd  # noqa: F401
+        except ImportError:
+            raise ValueError("读取xls文件需要安装xlrd")
+        return 'xlrd'
+
+    def _resolve_sheet(self, names):
+        """按名称或序号选择工作表，未指定时使用第一个"""
+        if not names:
+            raise ValueError("工作簿中没有工作表")
+        if self.sheet is None or self.sheet == '':
+            return names[0]
+        if self.sheet in names:
+            return self.sheet
+        if str(self.sheet).isdigit() and int(self.sheet) < len(names):
+            return names[int(self.sheet)]
+        raise ValueError(f"工作表不存在: {self.sheet}")
+
+    @staticmethod
+    def _parse_range(cell_range):
+        """把单元格范围转换为 (起始列, 起始行, 结束列, 结束行)，未限制的结束位置为None"""
+        if not cell_range:
+            return 1, 1, None, None
+        match = RANGE_PATTERN.match(str(cell_range).strip().upper().replace('$', ''))
+        if match is None or not any(match.groups()):
+            raise ValueError(f"无效的单元格范围: {cell_range}")
+        start_col, start_row, end_col, end_row = match.groups()
+        bounds = (_column_index(start_col) or 1, int(start_row) if start_row else 1,
+                  _column_index(end_col), int(end_row) if end_row else None)
+        if bounds[1] < 1 or (bounds[2] is not None and bounds[2] < bounds[0]) or \
+                (bounds[3] is not None and bounds[3] < bounds[1]):
+            raise ValueError(f"无效的单元格范围: {cell_range}")
+        return bounds
+
+    @staticmethod
+    def _make_header(row):
+        """用范围内的第一行作为列名，去掉末尾的空列，空列名和重复列名按pandas的规则命名"""
+        if row is None:
+            raise ValueError("工作表为空")
+        names = [None if _is_missing(value) else str(value).strip() for value in row]
+        while names and not names[-1]:
+            names.pop()
+        if not names:
+            raise ValueError("工作表的第一行没有列名")
+
+        header, seen = [], {}
+        for i, name in enumerate(names):
+            name = name or f'Unnamed: {i}'
+            if name in seen:
+                seen[name] += 1
+                name = f'{name}.{seen[name]}'
+            else:
+                seen[name] = 0
+            header.append(name)
+        return header
+
+
+def _column_index(letters):
+    """列字母转换为从1开始的列号，空字符串返回None"""
+    if not letters:
+        return None
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and np.isnan(value)) or value is pd.NaT
+
+
+def _to_text(value):
+    """把单元格的值转换为与CSV读入一致的文本"""
+    if _is_missing(value) or value == '':
+        return np.nan
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (datetime.datetime, pd.Timestamp)):
+        if value.time() == datetime.time(0):
+            return value.strftime('%Y-%m-%d')
+        return value.isoformat(sep=' ')
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        # Excel中的数值均为浮点数，整数值按整数输出
+        return str(int(value))
+    return str(value)
@@ -0,0 +1,225 @@
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import Future
+from models.db import get_pool
+
+
+class ExplanationCache:
+    """AI解释的持久化缓存
+
+    以提示词和模型参数的哈希为键保存在SQLite数据库中，超过 ttl 秒的条目视为过期，
+    条目数超过 max_entries 时删除最久未使用的条目。相同键的并发请求只调用一次模型，
+    其余请求等待同一结果；流式请求共享同一个上游流，后加入的请求先重放已生成的文本再继续接收。
+    调用失败或中途断开时不写入缓存。
+    """
+
+    def __init__(self, db_path='data/database.db', ttl=7 * 24 * 3600, max_entries=1000):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._inflight = {}  # 键 -> 正在计算的 Future
+        self._streams = {}  # 键 -> 正在生成的 _SharedStream
+        self._lock = threading.Lock()
+        self._table_ready = False
+
+    @staticmethod
+    def make_key(messages, params):
+        """根据消息和模型参数生成缓存键"""
+        payload = json.dumps({'messages': messages, 'params': params},
+                             ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """返回未过期的缓存内容，不存在时返回None"""
+        now = time.time()
+        with self._connection() as conn:
+            row = conn.execute('SELECT explanation FROM explanation_cache WHERE key = ? AND created_at >= ?',
+                               (key, now - self.ttl)).fetchone()
+            if row is not None:
+                conn.execute('UPDATE explanation_cache SET last_used = ? WHERE key = ?', (now, key))
+        return row[0] if row is not None else None
+
+    def lookup(self, key):
+        """与 get 相同，同时记录命中统计"""
+        explanation = self.get(key)
+        if explanation is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return explanation
+
+    def put(self, key, explanation):
+        """写入缓存并清理过期和超出数量的条目，没有内容的解释不写入"""
+        if not explanation:
+            return
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute('INSERT OR REPLACE INTO explanation_cache (key, explanation, created_at, last_used) '
+                         'VALUES (?, ?, ?, ?)', (key, explanation, now, now))
+            conn.execute('DELETE FROM explanation_cache WHERE created_at < ?', (now - self.ttl,))
+            conn.execute('DELETE FROM explanation_cache WHERE key IN (SELECT key FROM explanation_cache '
+                         'ORDER BY last_used DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+
+    def get_or_compute(self, key, compute):
+        """命中缓存时直接返回，否则调用 compute，相同键的并发调用共享一次计算"""
+        explanation = self.get(key)
+        if explanation is not None:
+            self.hits += 1
+            return explanation
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            self.hits += 1
+            return future.result()
+
+        try:
+            # 可能在上面的查询之后刚被其他请求写入
+            explanation = self.get(key)
+            if explanation is None:
+                self.misses += 1
+                explanation = compute()
+                self.put(key, explanation)
+            else:
+                self.hits += 1
+            future.set_result(explanation)
+            return explanation
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def stream(self, key, open_stream):
+        """逐段返回解释文本，命中缓存时一次返回完整内容
+
+        open_stream 返回逐段产生文本的生成器。相同键的并发请求共享一次上游调用，
+        所有请求都断开时关闭上游生成器，完整生成后写入缓存。
+        """
+        explanation = self.get(key)
+        if explanation is not None:
+            self.hits += 1
+            yield explanation
+            return
+
+        with self._lock:
+            shared = self._streams.get(key)
+            if shared is None:
+                shared = self._streams[key] = _SharedStream(open_stream)
+                self.misses += 1
+            else:
+                self.hits += 1
+            # 在同一把锁内加入和退出，最后一个请求退出后不会再有请求加入这个流
+            shared.subscribers += 1
+        try:
+            yield from shared.replay(lambda text: self.put(key, text))
+        finally:
+            with self._lock:
+                shared.subscribers -= 1
+                abandoned = not shared.subscribers
+                if abandoned and self._streams.get(key) is shared:
+                    del self._streams[key]
+            if abandoned:
+                shared.close()
+
+    def stats(self):
+        """返回缓存的命中统计和条目数"""
+        with self._connection() as conn:
+            entries = conn.execute('SELECT COUNT(*) FROM explanation_cache').fetchone()[0]
+        return {
+            'entries': entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'inflight': len(self._inflight) + len(self._streams)
+        }
+
+    def _connection(self):
+        """从连接池借出连接，首次使用时创建缓存表"""
+        pool = get_pool(self.db_path)
+        if not self._table_ready:
+            with pool.connection() as conn:
+                conn.execute('''
+                CREATE TABLE IF NOT EXISTS explanation_cache (
+                    key TEXT PRIMARY KEY,
+                    explanation TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                ''')
+            self._table_ready = True
+        return pool.connection()
+
+
+class _SharedStream:
+    """多个请求共享的一次上游流式调用
+
+    已生成的文本片段保存在 parts 中，每个订阅者从头重放。没有新片段时由其中一个订阅者
+    从上游读取下一段，其余订阅者等待，因此发起请求的客户端断开后其他订阅者仍能继续接收。
+    """
+
+    def __init__(self, open_stream):
+        self.subscribers = 0
+        self.parts = []
+        self._open_stream = open_stream
+        self._upstream = None
+        self._reading = False
+        self._done = False
+        self._error = None
+        self._condition = threading.Condition()
+
+    def replay(self, on_complete):
+        """从第一段开始逐段返回文本，上游结束时由读到结尾的订阅者调用 on_complete(完整文本)"""
+        index = 0
+        while True:
+            with self._condition:
+                while index >= len(self.parts) and self._reading:
+                    self._condition.wait()
+                if index < len(self.parts):
+                    part = self.parts[index]
+                elif self._error is not None:
+                    raise self._error
+                elif self._done:
+                    return
+                else:
+                    part = None
+                    self._reading = True
+            if part is None:
+                self._read_next(on_complete)
+                continue
+            index += 1
+            yield part
+
+    def close(self):
+        """关闭上游生成器，中止与模型服务的连接"""
+        if self._upstream is not None:
+            self._upstream.close()
+
+    def _read_next(self, on_complete):
+        """从上游读取下一段文本，读到结尾时写入缓存"""
+        try:
+            if self._upstream is None:
+                self._upstream = self._open_stream()
+            part = next(self._upstream, None)
+            if part is None:
+                on_complete(''.join(self.parts))
+        except BaseException as e:
+            with self._condition:
+                self._error = e
+                self._reading = False
+                self._condition.notify_all()
+            raise
+        with self._condition:
+            if part is None:
+                self._done = True
+            else:
+                self.parts.append(part)
+            self._reading = False
+            self._condition.notify_all()
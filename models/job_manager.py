@@ -0,0 +1,333 @@
+import json
+import sqlite3
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from models.db import get_pool, DB_PATH
+
+# 任务结束后的状态
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+
+
+class JobQueueFullError(RuntimeError):
+    """排队的任务数已达上限"""
+
+
+class Job:
+    """后台任务的状态
+
+    工作函数通过 update 写入阶段、进度和部分结果，每次更新递增 seq，
+    轮询接口读取 to_dict，事件流接口用 wait_for_update 等待下一次更新。
+    有 store 时每次更新同时写入数据库，其他工作进程也能查询和取消该任务。
+    """
+
+    # 检查其他进程发出的取消请求的最小间隔（秒）
+    CANCEL_CHECK_INTERVAL = 0.5
+
+    def __init__(self, owner, store=None):
+        self.id = uuid.uuid4().hex
+        self.owner = str(owner)
+        self.status = 'pending'
+        self.stage = 'queued'
+        self.progress = 0.0
+        self.result = None
+        self.explanation = None
+        self.error = None
+        self.profile = None  # 请求了性能明细时记录各阶段耗时
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.seq = 0
+        self.store = store
+        self._cancel_event = threading.Event()
+        self._condition = threading.Condition()
+        self._cancel_checked_at = 0.0
+
+    @classmethod
+    def from_row(cls, row):
+        """用数据库中的记录构建只读的任务状态（任务在其他进程中执行）"""
+        job = cls(row['owner'])
+        for name in ('id', 'status', 'stage', 'progress', 'explanation', 'error',
+                     'created_at', 'updated_at', 'seq'):
+            setattr(job, name, row[name])
+        job.result = json.loads(row['result']) if row['result'] is not None else None
+        job.profile = json.loads(row['profile']) if row['profile'] is not None else None
+        if row['cancel_requested']:
+            job._cancel_event.set()
+        return job
+
+    @property
+    def cancelled(self):
+        """是否已请求取消，工作函数应在各阶段之间检查"""
+        if self._cancel_event.is_set():
+            return True
+        now = time.monotonic()
+        if self.store is not None and now - self._cancel_checked_at >= self.CANCEL_CHECK_INTERVAL:
+            self._cancel_checked_at = now
+            if self.store.cancel_requested(self.id):
+                self._cancel_event.set()
+                return True
+        return False
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATUSES
+
+    def update(self, **fields):
+        """更新任务字段并通知等待者"""
+        with self._condition:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.updated_at = time.time()
+            self.seq += 1
+            self._condition.notify_all()
+        if self.store is not None:
+            self.store.save(self, fields)
+
+    def wait_for_update(self, seq, timeout):
+        """等待 seq 之后的更新，返回最新的 seq（超时则不变）"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.seq > seq, timeout=timeout)
+            return self.seq
+
+    def to_dict(self):
+        """返回任务状态和已有的部分结果"""
+        data = {
+            'job_id': self.id,
+            'status': self.status,
+            'stage': self.stage,
+            'progress': self.progress,
+            'analysis_result': self.result,
+            'explanation': self.explanation,
+            'error': self.error
+        }
+        if self.profile is not None:
+            data['profile'] = self.profile
+        return data
+
+
+class JobStore:
+    """任务状态的SQLite存储，供多个工作进程共享
+
+    执行任务的进程定期刷新未结束任务的心跳时间，超过 stale_after 秒没有心跳的未结束任务
+    视为执行进程已退出，读取时标记为失败，订阅和轮询该任务的客户端不会一直等待。
+    """
+
+    def __init__(self, db_path=DB_PATH, stale_after=60):
+        self.db_path = db_path
+        self.stale_after = stale_after
+        self._table_ready = False
+
+    def save(self, job, fields=None):
+        """写入任务状态，fields 为本次更新的字段，分析结果只在变化时写入"""
+        with self._connection() as conn:
+            conn.execute('INSERT OR IGNORE INTO jobs (id, owner, status, stage, progress, seq, '
+                         'cancel_requested, created_at, updated_at, heartbeat_at) '
+                         'VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?, ?)',
+                         (job.id, job.owner, job.status, job.stage, job.progress, job.seq,
+                          job.created_at, job.updated_at, job.updated_at))
+            conn.execute('UPDATE jobs SET status = ?, stage = ?, progress = ?, seq = ?, updated_at = ?, '
+                         'heartbeat_at = ? WHERE id = ?',
+                         (job.status, job.stage, job.progress, job.seq, job.updated_at, job.updated_at, job.id))
+            if fields and 'result' in fields:
+                conn.execute('UPDATE jobs SET result = ? WHERE id = ?',
+                             (json.dumps(job.result, ensure_ascii=False), job.id))
+            if fields and 'explanation' in fields:
+                conn.execute('UPDATE jobs SET explanation = ? WHERE id = ?', (job.explanation, job.id))
+            if fields and 'error' in fields:
+                conn.execute('UPDATE jobs SET error = ? WHERE id = ?', (job.error, job.id))
+            if fields and 'profile' in fields:
+                conn.execute('UPDATE jobs SET profile = ? WHERE id = ?', (json.dumps(job.profile), job.id))
+
+    def load(self, job_id):
+        """读取任务记录，不存在时返回None，执行进程已失去心跳的未结束任务先标记为失败"""
+        with self._connection() as conn:
+            row = self._select(conn, job_id)
+            if row is None:
+                return None
+            now = time.time()
+            if row['status'] not in FINISHED_STATUSES and row['heartbeat_at'] < now - self.stale_after:
+                conn.execute('UPDATE jobs SET status = ?, stage = ?, error = ?, seq = seq + 1, updated_at = ? '
+                             'WHERE id = ? AND heartbeat_at < ? AND status NOT IN (?, ?, ?)',
+                             ('failed', 'failed', '执行任务的进程已退出', now, job_id, now - self.stale_after,
+                              *FINISHED_STATUSES))
+                row = self._select(conn, job_id)
+            return row
+
+    def heartbeat(self, job_ids):
+        """刷新本进程中未结束任务的心跳时间"""
+        if not job_ids:
+            return
+        with self._connection() as conn:
+            conn.executemany('UPDATE jobs SET heartbeat_at = ? WHERE id = ?',
+                             [(time.time(), job_id) for job_id in job_ids])
+
+    def request_cancel(self, job_id, owner):
+        """标记取消请求，由执行该任务的进程在下一次检查时停止"""
+        with self._connection() as conn:
+            conn.execute('UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND owner = ?',
+                         (job_id, str(owner)))
+
+    def cancel_requested(self, job_id):
+        with self._connection() as conn:
+            row = conn.execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def cleanup(self, expire_before):
+        """删除结束时间早于 expire_before 的任务"""
+        with self._connection() as conn:
+            conn.execute('DELETE FROM jobs WHERE status IN (?, ?, ?) AND updated_at < ?',
+                         (*FINISHED_STATUSES, expire_before))
+
+    @staticmethod
+    def _select(conn, job_id):
+        cursor = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip([column[0] for column in cursor.description], row))
+
+    def _connection(self):
+        """从连接池借出连接，首次使用时创建任务表"""
+        pool = get_pool(self.db_path)
+        if not self._table_ready:
+            with pool.connection() as conn:
+                conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    progress REAL NOT NULL,
+                    result TEXT,
+                    explanation TEXT,
+                    error TEXT,
+                    profile TEXT,
+                    seq INTEGER NOT NULL,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    heartbeat_at REAL NOT NULL
+                )
+                ''')
+            self._table_ready = True
+        return pool.connection()
+
+
+class JobManager:
+    """有界线程池上的后台任务管理
+
+    同时运行的任务数由 max_workers 限制，排队加运行的任务数超过 max_pending 时拒绝提交，
+    已结束的任务保留 ttl 秒供客户端取回结果。指定 store 时任务状态写入数据库，
+    请求落到其他工作进程时也能查询、订阅和取消任务；后台线程定期为本进程中未结束的任务刷新心跳。
+    """
+
+    # 订阅其他进程中的任务时轮询数据库的间隔（秒）
+    POLL_INTERVAL = 0.5
+    # 刷新任务心跳的间隔（秒），应明显小于 JobStore.stale_after
+    HEARTBEAT_INTERVAL = 10
+
+    def __init__(self, max_workers=4, max_pending=64, ttl=3600, store=None):
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+        if self.store is not None:
+            threading.Thread(target=self._heartbeat_loop, name='job-heartbeat', daemon=True).start()
+
+    def submit(self, owner, func, *args, **kwargs):
+        """提交任务，func 的第一个参数为 Job 对象"""
+        job = Job(owner, store=self.store)
+        with self._lock:
+            self._cleanup()
+            active = sum(1 for j in self._jobs.values() if not j.finished)
+            if active >= self.max_pending:
+                raise JobQueueFullError("任务过多，请稍后再试")
+            self._jobs[job.id] = job
+        if self.store is not None:
+            self.store.save(job)
+        job.future = self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def get(self, job_id, owner):
+        """获取属于某个用户的任务，不存在时返回None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            row = self.store.load(job_id)
+            job = Job.from_row(row) if row is not None else None
+        if job is None or job.owner != str(owner):
+            return None
+        return job
+
+    def cancel(self, job_id, owner):
+        """取消任务，排队中的任务直接取消，运行中的任务在下一阶段前停止"""
+        job = self.get(job_id, owner)
+        if job is None:
+            return None
+        if job.finished:
+            return job
+        with self._lock:
+            local = job_id in self._jobs
+        if not local:
+            # 任务在其他进程中执行，由该进程检查取消标记
+            self.store.request_cancel(job_id, owner)
+            return self.get(job_id, owner)
+        job._cancel_event.set()
+        if job.future.cancel():
+            job.update(status='cancelled', stage='cancelled')
+        return job
+
+    def wait_for_update(self, job, seq, timeout):
+        """等待任务在 seq 之后的更新，返回任务的最新状态"""
+        with self._lock:
+            local = self._jobs.get(job.id) is job
+        if local:
+            job.wait_for_update(seq, timeout)
+            return job
+
+        deadline = time.monotonic() + timeout
+        while True:
+            latest = self.get(job.id, job.owner) or job
+            if latest.seq > seq or latest.finished or time.monotonic() >= deadline:
+                return latest
+            time.sleep(min(self.POLL_INTERVAL, max(deadline - time.monotonic(), 0)))
+
+    def _run(self, job, func, args, kwargs):
+        """在工作线程中执行任务并记录最终状态"""
+        if job.cancelled:
+            job.update(status='cancelled', stage='cancelled')
+            return
+        job.update(status='running', stage='running')
+        try:
+            func(job, *args, **kwargs)
+        except Exception as e:
+            job.update(status='failed', stage='failed', error=str(e))
+            return
+        if job.cancelled:
+            job.update(status='cancelled', stage='cancelled')
+        else:
+            job.update(status='completed', stage='done', progress=1.0)
+
+    def _heartbeat_loop(self):
+        """定期刷新本进程中排队和运行中任务的心跳"""
+        while True:
+            time.sleep(self.HEARTBEAT_INTERVAL)
+            with self._lock:
+                job_ids = [job_id for job_id, job in self._jobs.items() if not job.finished]
+            try:
+                self.store.heartbeat(job_ids)
+            except sqlite3.Error:
+                # 数据库暂时不可用时等下一次刷新，超时前仍有机会恢复
+                continue
+
+    def _cleanup(self):
+        """删除结束时间超过ttl的任务"""
+        expire_before = time.time() - self.ttl
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished and job.updated_at < expire_before]:
+            del self._jobs[job_id]
+        if self.store is not None:
+            self.store.cleanup(expire_before)
@@ -0,0 +1,260 @@
+import time
+import bisect
+import threading
+import tracemalloc
+import contextvars
+from contextlib import contextmanager
+
+# 耗时直方图的桶上界（秒）
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 内存和数据大小直方图的桶上界（字节）
+SIZE_BUCKETS = tuple(2 ** power for power in range(10, 33, 2))
+
+METRIC_HELP = {
+    'app_stage_duration_seconds': '各处理阶段的耗时',
+    'app_stage_peak_bytes': '各处理阶段的峰值内存分配（开启内存跟踪时记录）',
+    'app_payload_bytes': '上传文件、分析结果、图表和提示词等数据的大小',
+    'app_http_request_duration_seconds': '请求处理耗时',
+    'app_http_requests_total': '请求数'
+}
+
+
+class Histogram:
+    """累计分桶的直方图，与Prometheus的histogram类型对应"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """返回 (桶上界, 累计计数) 列表，最后一项为 +Inf"""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class MetricsRegistry:
+    """进程内的指标集合
+
+    直方图和计数器按指标名和标签区分，render 输出Prometheus文本格式。
+    指标只统计当前进程，多进程部署时由Prometheus分别抓取各进程或按实例汇总。
+    """
+
+    def __init__(self):
+        self._histograms = {}  # (指标名, 标签元组) -> Histogram
+        self._counters = {}  # (指标名, 标签元组) -> 计数
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, buckets=DURATION_BUCKETS, **labels):
+        """向直方图记录一个观测值"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        """计数器加 value"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self, counters=None, gauges=None):
+        """输出Prometheus文本格式
+
+        counters 和 gauges 为抓取时由调用方提供的额外指标（如各缓存的命中数），
+        格式为 {指标名: (说明, 数值)}。
+        """
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            own_counters = sorted(self._counters.items())
+
+        lines = []
+        described = set()
+
+        def describe(name, metric_type, help_text=None):
+            if name not in described:
+                described.add(name)
+                lines.append(f'# HELP {name} {help_text or METRIC_HELP.get(name, name)}')
+                lines.append(f'# TYPE {name} {metric_type}')
+
+        for (name, labels), histogram in histograms:
+            describe(name, 'histogram')
+            for bound, count in histogram.cumulative():
+                le = '+Inf' if bound == float('inf') else _format_value(bound)
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", le),))} {count}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}')
+            lines.append(f'{name}_count{_format_labels(labels)} {histogram.count}')
+        for (name, labels), value in own_counters:
+            describe(name, 'counter')
+            lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        for metric_type, extra in (('counter', counters), ('gauge', gauges)):
+            for name, (help_text, value) in (extra or {}).items():
+                describe(name, metric_type, help_text)
+                lines.append(f'{name} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+class Profile:
+    """单个请求或任务中各阶段的耗时明细"""
+
+    def __init__(self):
+        self.stages = []
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, peak_bytes=None):
+        with self._lock:
+            self.stages.append((name, seconds, peak_bytes))
+
+    def to_list(self):
+        """返回各阶段的名称、耗时（毫秒）和峰值内存"""
+        with self._lock:
+            stages = list(self.stages)
+        return [{'stage': name, 'duration_ms': round(seconds * 1000, 3), 'peak_bytes': peak_bytes}
+                for name, seconds, peak_bytes in stages]
+
+    def server_timing(self, total=None):
+        """生成Server-Timing响应头，浏览器开发者工具可直接显示"""
+        with self._lock:
+            stages = list(self.stages)
+        entries = []
+        for name, seconds, peak_bytes in stages:
+            entry = f'{name};dur={seconds * 1000:.3f}'
+            if peak_bytes is not None:
+                entry += f';desc="peak {peak_bytes / 2 ** 20:.1f}MB"'
+            entries.append(entry)
+        if total is not None:
+            entries.append(f'total;dur={total * 1000:.3f}')
+        return ', '.join(entries)
+
+
+registry = MetricsRegistry()
+
+_profile = contextvars.ContextVar('metrics_profile', default=None)
+_memory_frames = threading.local()
+_trace_memory = False
+
+
+def enable_memory_tracing(enabled=True):
+    """开启后各阶段记录tracemalloc峰值内存，会明显拖慢执行，适合排查问题时临时开启"""
+    global _trace_memory
+    if enabled and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _trace_memory = enabled
+
+
+def current_profile():
+    return _profile.get()
+
+
+def activate_profile(profile):
+    """在当前上下文中开始收集各阶段明细，返回交给 deactivate_profile 的令牌"""
+    return _profile.set(profile)
+
+
+def deactivate_profile(token):
+    _profile.reset(token)
+
+
+@contextmanager
+def profiling(profile):
+    """在代码块中收集各阶段明细，profile 为None时不收集"""
+    token = activate_profile(profile)
+    try:
+        yield profile
+    finally:
+        deactivate_profile(token)
+
+
+@contextmanager
+def stage(name):
+    """记录一个处理阶段的耗时（以及开启内存跟踪时的峰值内存）
+
+    嵌套的阶段各自记录，外层阶段的耗时包含内层阶段。峰值内存由tracemalloc统计整个进程的分配，
+    多个线程同时执行时为近似值。
+    """
+    frame = _enter_memory_frame() if _trace_memory else None
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        peak = _exit_memory_frame(frame) if frame is not None else None
+        record_stage(name, elapsed, peak)
+
+
+def record_stage(name, seconds, peak_bytes=None):
+    """记录已测得的阶段耗时，用于无法包裹在 stage 中的区间（如首个token的等待时间）"""
+    registry.observe('app_stage_duration_seconds', seconds, stage=name)
+    if peak_bytes is not None:
+        registry.observe('app_stage_peak_bytes', peak_bytes, SIZE_BUCKETS, stage=name)
+    profile = _profile.get()
+    if profile is not None:
+        profile.add(name, seconds, peak_bytes)
+
+
+def observe_size(kind, nbytes):
+    """记录数据大小（字节）"""
+    registry.observe('app_payload_bytes', nbytes, SIZE_BUCKETS, kind=kind)
+
+
+def _enter_memory_frame():
+    """重置峰值前把当前峰值计入外层阶段，使嵌套阶段互不影响"""
+    stack = getattr(_memory_frames, 'stack', None)
+    if stack is None:
+        stack = _memory_frames.stack = []
+    current, peak = tracemalloc.get_traced_memory()
+    for outer in stack:
+        outer[1] = max(outer[1], peak)
+    tracemalloc.reset_peak()
+    frame = [current, current]  # [进入时的已分配量, 期间观测到的峰值]
+    stack.append(frame)
+    return frame
+
+
+def _exit_memory_frame(frame):
+    peak = max(frame[1], tracemalloc.get_traced_memory()[1])
+    stack = _memory_frames.stack
+    for i in range(len(stack) - 1, -1, -1):
+        if stack[i] is frame:
+            del stack[i]
+            break
+    for outer in stack:
+        outer[1] = max(outer[1], peak)
+    return max(peak - frame[0], 0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if value != value:
+            return 'NaN'
+        if value in (float('inf'), float('-inf')):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+QUARTILES = (0.25, 0.5, 0.75)
+
+
+def numeric_profile(values):
+    """计算一列数值的描述性统计
+
+    只对这一列的副本排序一次（NaN排在末尾），极值、四分位数和唯一值数量都从排序结果中按下标读取，
+    不需要为整个数据集另建排序矩阵。四分位数按线性插值，与 Series.quantile 一致。
+    """
+    ordered = np.sort(values)
+    count = int(len(ordered) - np.count_nonzero(np.isnan(ordered)))
+    profile = {'count': count, 'null_count': int(len(ordered) - count)}
+    if not count:
+        profile.update({name: np.nan for name in ('mean', 'std', 'min', 'max', 'q1', 'q2', 'q3')})
+        profile['distinct'] = 0
+        return profile
+
+    ordered = ordered[:count]
+    profile['mean'] = float(ordered.mean())
+    profile['std'] = float(ordered.std(ddof=1)) if count > 1 else np.nan
+    profile['min'] = float(ordered[0])
+    profile['max'] = float(ordered[-1])
+    for i, q in enumerate(QUARTILES):
+        position = q * (count - 1)
+        lower = int(np.floor(position))
+        upper = min(lower + 1, count - 1)
+        low, high = ordered[lower], ordered[upper]
+        profile[f'q{i + 1}'] = float(low + (high - low) * (position - lower))
+    # 排序后相邻值不同的位置数加一即为唯一值数量
+    profile['distinct'] = int(np.count_nonzero(ordered[1:] != ordered[:-1]) + 1)
+    return profile
+
+
+def categorical_profile(series, top=5):
+    """一次分组计数得到非数值列的空值数、唯一值数量和频数最高的取值
+
+    category列直接使用类别编码，其他列先做一次哈希编码，再用 bincount 统计所有取值的频数，
+    只对不同取值的计数排序。
+    与 value_counts 一致，category列中未出现的类别计数为0。
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        labels = series.cat.categories
+    else:
+        codes, labels = pd.factorize(series, use_na_sentinel=True)
+    counts = np.bincount(codes.astype(np.int64) + 1, minlength=len(labels) + 1)
+    null_count = int(counts[0])
+    counts = counts[1:]
+    # 计数按首次出现的顺序排列，排序方式与 value_counts 相同，使并列的取值顺序一致
+    ranked = pd.Series(counts, index=labels, copy=False).sort_values(ascending=False).head(top)
+    return {
+        'count': int(len(series) - null_count),
+        'null_count': null_count,
+        'distinct': int((counts > 0).sum()),
+        'top': list(zip(ranked.index.tolist(), ranked.tolist()))
+    }
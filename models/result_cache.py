@@ -0,0 +1,82 @@
+import json
+import uuid
+import threading
+from collections import OrderedDict
+
+
+def next_dataset_version():
+    """分配一个新的数据集版本号，多个工作进程之间也不会重复，缓存键中用它区分不同的数据"""
+    return uuid.uuid4().hex
+
+
+class ResultCache:
+    """分析结果缓存
+
+    键由数据集版本、分析类型、排序后的列集合和参数组成，
+    超出条目数或总大小上限时按LRU顺序淘汰。
+    缓存的结果会被多个请求共享，调用方不能修改返回的对象。
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (result, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(version, analysis_type, columns, kwargs=None):
+        """生成缓存键，列的顺序不影响结果"""
+        return (
+            version,
+            analysis_type,
+            tuple(sorted({str(col) for col in columns})),
+            json.dumps(kwargs or {}, sort_keys=True, default=str)
+        )
+
+    def get(self, key):
+        """查询缓存，返回 (是否命中, 结果)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+
+    def put(self, key, result):
+        """写入缓存，单个结果超过大小上限时不缓存"""
+        size = len(json.dumps(result, ensure_ascii=False, default=str).encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (result, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def invalidate(self, version):
+        """删除某个数据集版本的所有缓存结果"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == version]:
+                _, size = self._entries.pop(key)
+                self._bytes -= size
+
+    def stats(self):
+        """返回缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'entries': len(self._entries),
+                'bytes': self._bytes
+            }
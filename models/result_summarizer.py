@@ -0,0 +1,245 @@
+import json
+import base64
+import numpy as np
+
+# 提示词中分析结果的默认字符预算，中文约一字一个token
+DEFAULT_BUDGET = 3000
+TOP_CORRELATIONS = 10
+TOP_LOADINGS = 5
+MAX_COMPONENTS = 5
+MAX_CATEGORIES = 10
+MAX_TRACES = 5
+
+
+def summarize_result(analysis_type, result, budget=DEFAULT_BUDGET):
+    """把分析结果或图表压缩为不超过 budget 个字符的摘要
+
+    各分析类型只保留对解释有用的统计量（相关性最强的变量对、主成分载荷、簇中心、
+    分位数等），不包含逐行数据，因此摘要大小与数据行数无关。返回紧凑的JSON字符串。
+    """
+    summarizer = _SUMMARIZERS.get(analysis_type)
+    if summarizer is None and str(analysis_type).startswith('visualization_'):
+        summarizer = _summarize_figure
+    try:
+        summary = summarizer(result) if summarizer is not None else result
+    except (KeyError, TypeError, ValueError, AttributeError):
+        # 结构与预期不符时退回通用压缩
+        summary = result
+    return _fit_budget(summary, budget)
+
+
+def _summarize_summary_stats(result):
+    """描述性统计：保留各列统计量，类别分布只保留最常见的类别"""
+    summary = {}
+    for col, stats in result.items():
+        stats = dict(stats)
+        if '类别分布' in stats:
+            stats['类别分布'] = _top_counts(stats['类别分布'])
+        summary[col] = stats
+    return summary
+
+
+def _summarize_correlation(result):
+    """相关性：按绝对值列出相关性最强的变量对"""
+    if '变量对' in result:
+        # 只返回了变量对的结果已按绝对值排序
+        return {
+            '变量数量': result['变量数量'],
+            '变量': result['变量'],
+            '相关性最强的变量对': result['变量对'][:TOP_CORRELATIONS]
+        }
+    columns = list(result)
+    pairs = []
+    for i, a in enumerate(columns):
+        for b in columns[i + 1:]:
+            value = result[a].get(b)
+            if value is not None and not _is_nan(value):
+                pairs.append((a, b, value))
+    pairs.sort(key=lambda pair: -abs(pair[2]))
+    return {
+        '变量数量': len(columns),
+        '变量': columns,
+        '相关性最强的变量对': [{'变量1': a, '变量2': b, '相关系数': value}
+                        for a, b, value in pairs[:TOP_CORRELATIONS]]
+    }
+
+
+def _summarize_distribution(result):
+    """分布：数值列保留形态指标和分位数，分类列保留最常见的类别"""
+    summary = {}
+    for col, info in result.items():
+        if info.get('type') == 'categorical':
+            summary[col] = {
+                'type': 'categorical',
+                'total_count': info.get('total_count'),
+                'unique_count': info.get('unique_count'),
+                'distribution': _top_counts(info.get('distribution', {}))
+            }
+            continue
+        col_summary = {key: info[key] for key in ('type', 'skewness', 'kurtosis', 'p_value', 'is_normal')
+                       if key in info}
+        histogram = info.get('histogram_data')
+        if histogram:
+            col_summary['分位数'] = _histogram_quantiles(histogram['bins'], histogram['bin_edges'])
+        summary[col] = col_summary
+    return summary
+
+
+def _summarize_pca(result):
+    """主成分分析：方差解释率和每个主成分载荷绝对值最大的变量"""
+    features = result['feature_names']
+    components = []
+    for i, loadings in enumerate(result['components'][:MAX_COMPONENTS]):
+        order = np.argsort(-np.abs(np.asarray(loadings)))[:TOP_LOADINGS]
+        components.append({
+            '主成分': f'PC{i + 1}',
+            '方差解释率': result['explained_variance_ratio'][i],
+            '主要载荷': {features[j]: loadings[j] for j in order}
+        })
+    return {
+        'n_samples': result.get('n_samples'),
+        'n_components': result.get('n_components'),
+        'cumulative_variance_ratio': result['cumulative_variance_ratio'][:MAX_COMPONENTS],
+        'components': components
+    }
+
+
+def _summarize_clustering(result):
+    """聚类：簇数量、各簇样本数和原始尺度的簇中心，不包含逐行标签"""
+    summary = {key: result[key] for key in ('algorithm', 'n_clusters', 'inertia', 'cluster_stats')
+               if key in result}
+    selection = result.get('k_selection')
+    if selection:
+        summary['k_selection'] = selection
+    return summary
+
+
+def _summarize_figure(figure):
+    """图表：每条轨迹的类型、名称、点数和坐标取值概况"""
+    layout = figure.get('layout', {})
+    summary = {
+        '标题': _title_text(layout.get('title')),
+        'x轴': _title_text(layout.get('xaxis', {}).get('title')),
+        'y轴': _title_text(layout.get('yaxis', {}).get('title')),
+        '轨迹数量': len(figure.get('data', [])),
+        '轨迹': []
+    }
+    for trace in figure.get('data', [])[:MAX_TRACES]:
+        trace_summary = {'类型': trace.get('type'), '名称': trace.get('name')}
+        for axis in ('x', 'y', 'z', 'values', 'labels'):
+            if axis in trace:
+                trace_summary[axis] = _describe_values(_decode_values(trace[axis]))
+        summary['轨迹'].append(trace_summary)
+    meta = layout.get('meta')
+    if meta:
+        summary['降采样'] = meta
+    return summary
+
+
+_SUMMARIZERS = {
+    'summary_stats': _summarize_summary_stats,
+    'correlation': _summarize_correlation,
+    'distribution': _summarize_distribution,
+    'pca': _summarize_pca,
+    'clustering': _summarize_clustering
+}
+
+
+def _top_counts(counts, limit=MAX_CATEGORIES):
+    """保留计数最多的若干类别，其余合并为“其他”"""
+    ordered = sorted(counts.items(), key=lambda item: -item[1])
+    top = dict(ordered[:limit])
+    rest = sum(count for _, count in ordered[limit:])
+    if rest:
+        top['其他'] = rest
+    return top
+
+
+def _histogram_quantiles(bins, edges):
+    """由直方图估计最小值、四分位数和最大值"""
+    counts = np.asarray(bins, dtype=np.float64)
+    edges = np.asarray(edges, dtype=np.float64)
+    cumulative = np.concatenate([[0.0], np.cumsum(counts)])
+    if cumulative[-1] == 0:
+        return {}
+    quantiles = np.interp(np.array([0.25, 0.5, 0.75]) * cumulative[-1], cumulative, edges)
+    return {'最小值': edges[0], 'Q1': quantiles[0], '中位数': quantiles[1], 'Q3': quantiles[2], '最大值': edges[-1]}
+
+
+def _decode_values(values):
+    """还原plotly的二进制数组编码"""
+    if isinstance(values, dict) and 'bdata' in values:
+        array = np.frombuffer(base64.b64decode(values['bdata']), dtype=np.dtype(values['dtype']))
+        return array.ravel()
+    return values
+
+
+def _describe_values(values):
+    """数值序列给出范围和均值，其他序列给出前几个取值"""
+    if not isinstance(values, (list, tuple, np.ndarray)):
+        return values
+    try:
+        # 热力图的z为二维数组，展开后统计
+        array = np.asarray(values).ravel()
+    except ValueError:
+        array = np.asarray(values, dtype=object).ravel()
+    try:
+        numeric = array.astype(np.float64)
+    except (TypeError, ValueError):
+        numeric = None
+    if numeric is not None and len(numeric):
+        finite = numeric[np.isfinite(numeric)]
+        if len(finite):
+            return {'点数': int(len(numeric)), '最小值': float(finite.min()),
+                    '最大值': float(finite.max()), '平均值': float(finite.mean())}
+    return {'点数': int(len(array)), '取值': [str(v) for v in array[:MAX_CATEGORIES]]}
+
+
+def _title_text(title):
+    if isinstance(title, dict):
+        return title.get('text')
+    return title
+
+
+def _is_nan(value):
+    return isinstance(value, float) and np.isnan(value)
+
+
+def _fit_budget(summary, budget):
+    """逐步缩短列表和字典直到序列化结果不超过预算"""
+    limit = 50
+    while True:
+        text = json.dumps(_compact(summary, limit), ensure_ascii=False, separators=(',', ':'),
+                          default=_json_default)
+        if len(text) <= budget or limit <= 2:
+            break
+        limit //= 2
+    if len(text) > budget:
+        text = text[:budget] + '...'
+    return text
+
+
+def _compact(value, limit):
+    """浮点数保留4位有效数字，列表和字典最多保留 limit 项"""
+    if isinstance(value, dict):
+        items = list(value.items())
+        compacted = {str(k): _compact(v, limit) for k, v in items[:limit]}
+        if len(items) > limit:
+            compacted['...'] = f'共{len(items)}项'
+        return compacted
+    if isinstance(value, (list, tuple, np.ndarray)):
+        compacted = [_compact(v, limit) for v in value[:limit]]
+        if len(value) > limit:
+            compacted.append(f'...共{len(value)}项')
+        return compacted
+    if isinstance(value, (float, np.floating)):
+        return float(f'{float(value):.4g}') if np.isfinite(value) else None
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.bool_):
+        return bool(value)
+    return value
+
+
+def _json_default(value):
+    return str(value)
@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+
+
+class RunningMoments:
+    """可增量更新的数值列统计量
+
+    维护样本数、均值、协方差矩阵对应的二阶混合矩（co-moment）以及最小/最大值，
+    新数据按 Welford/Chan 的合并公式更新，复杂度只与新增行数有关。
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        size = len(self.columns)
+        self.count = 0
+        self.mean = np.zeros(size)
+        self.comoment = np.zeros((size, size))
+        self.min = np.full(size, np.inf)
+        self.max = np.full(size, -np.inf)
+        self.has_missing = False  # 存在缺失值时结果与逐列统计不一致，调用方应回退到全量计算
+
+    @classmethod
+    def from_frame(cls, data, columns=None):
+        """从数据框的数值列构建统计量"""
+        if columns is None:
+            columns = [col for col in data.columns if pd.api.types.is_numeric_dtype(data[col])]
+        return cls(columns).update_frame(data)
+
+    def update_frame(self, data):
+        """用数据框中的新行更新统计量"""
+        if not self.columns:
+            self.count += len(data)
+            return self
+        return self.update(data[self.columns].to_numpy(dtype=np.float64))
+
+    def update(self, block):
+        """用二维数组（行为样本，列与columns对应）更新统计量"""
+        n_new = len(block)
+        if n_new == 0:
+            return self
+        if np.isnan(block).any():
+            self.has_missing = True
+
+        block_mean = block.mean(axis=0)
+        centered = block - block_mean
+        block_comoment = centered.T @ centered
+        self._merge(n_new, block_mean, block_comoment, block.min(axis=0), block.max(axis=0))
+        return self
+
+    def merge(self, other):
+        """合并另一个相同列的统计量"""
+        if other.columns != self.columns:
+            raise ValueError("只能合并相同列的统计量")
+        self.has_missing = self.has_missing or other.has_missing
+        if other.count:
+            self._merge(other.count, other.mean, other.comoment, other.min, other.max)
+        return self
+
+    def copy(self):
+        """复制统计量，避免修改旧快照持有的对象"""
+        result = RunningMoments(self.columns)
+        result.count = self.count
+        result.mean = self.mean.copy()
+        result.comoment = self.comoment.copy()
+        result.min = self.min.copy()
+        result.max = self.max.copy()
+        result.has_missing = self.has_missing
+        return result
+
+    def covers(self, columns):
+        """判断这些列能否直接用增量统计量回答"""
+        return not self.has_missing and self.count > 1 and all(col in self.columns for col in columns)
+
+    def column_stats(self, column):
+        """单列的样本数、均值、标准差、最小值和最大值"""
+        i = self.columns.index(column)
+        return {
+            'count': self.count,
+            'mean': float(self.mean[i]),
+            'std': float(np.sqrt(self.comoment[i, i] / (self.count - 1))),
+            'min': float(self.min[i]),
+            'max': float(self.max[i])
+        }
+
+    def covariance(self, columns):
+        """指定列的样本协方差矩阵"""
+        idx = [self.columns.index(col) for col in columns]
+        return pd.DataFrame(self.comoment[np.ix_(idx, idx)] / (self.count - 1),
+                            index=columns, columns=columns)
+
+    def correlation(self, columns):
+        """指定列的皮尔逊相关系数矩阵，常数列对应NaN，与 DataFrame.corr 一致"""
+        cov = self.covariance(columns).to_numpy()
+        std = np.sqrt(np.diag(cov))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = cov / np.outer(std, std)
+        corr = np.clip(corr, -1.0, 1.0)
+        np.fill_diagonal(corr, np.where(std > 0, 1.0, np.nan))
+        return pd.DataFrame(corr, index=columns, columns=columns)
+
+    def _merge(self, n_new, new_mean, new_comoment, new_min, new_max):
+        """Chan 等人的并行合并公式"""
+        total = self.count + n_new
+        delta = new_mean - self.mean
+        self.comoment += new_comoment + np.outer(delta, delta) * (self.count * n_new / total)
+        self.mean += delta * (n_new / total)
+        self.count = total
+        self.min = np.minimum(self.min, new_min)
+        self.max = np.maximum(self.max, new_max)
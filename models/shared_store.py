@@ -0,0 +1,213 @@
+import os
+import time
+import uuid
+import pickle
+import shutil
+import numpy as np
+from models.db import get_pool, DB_PATH
+from models.dataset_cache import save_frame, load_frame
+
+
+class SharedDatasetStore:
+    """多个工作进程共享的数据集存储
+
+    数据集按列保存在共享目录中（默认位于 /dev/shm 内存文件系统），各进程以内存映射方式读取，
+    物理内存中只有一份数据。SQLite中的索引记录每个用户和数据集ID的当前版本、目录、大小和最近使用时间，
+    任意进程发布的数据集其他进程都能立即读取。
+    共享目录中的数据集总大小受 budget 限制，超出时把最久未使用的数据集移到磁盘上的 overflow_dir
+    （未指定时直接删除），移走后仍可按索引加载；超过 ttl 秒未使用的数据集、
+    索引中没有记录的目录和异常退出的写入进程遗留的临时目录会被定期清理。
+    """
+    # 两次更新同一数据集最近使用时间的最小间隔（秒），避免每次读取都写数据库
+    TOUCH_INTERVAL = 60
+    # 两次清理之间的最小间隔（秒）
+    CLEANUP_INTERVAL = 600
+    # 索引中没有记录的目录超过该时间（秒）未修改才视为遗留目录，正在写入或刚发布的目录不会被删除
+    ORPHAN_GRACE = 3600
+
+    def __init__(self, root, db_path=DB_PATH, budget=None, overflow_dir=None, ttl=None):
+        self.root = root
+        self.db_path = db_path
+        self.budget = budget
+        self.overflow_dir = overflow_dir
+        self.ttl = ttl
+        self._table_ready = False
+        self._last_cleanup = 0.0
+        os.makedirs(self.root, exist_ok=True)
+        if self.overflow_dir is not None:
+            os.makedirs(self.overflow_dir, exist_ok=True)
+
+    def publish(self, user_id, dataset_id, data, version, moments=None, sketches=None, row_hashes=None):
+        """发布某个版本的数据集，返回数据集目录，数据无法按列保存时返回None"""
+        path = os.path.join(self.root, str(version))
+        tmp_path = os.path.join(self.root, f'.{version}.{uuid.uuid4().hex}')
+        try:
+            if not save_frame(data, tmp_path):
+                return None
+            # 统计量和草图一并保存，其他进程加载后无需重新扫描数据
+            with open(os.path.join(tmp_path, 'extras.pkl'), 'wb') as f:
+                pickle.dump({'moments': moments, 'sketches': sketches}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            if row_hashes is not None:
+                # 追加数据时去重用的行哈希，与数据列一样以内存映射方式读取
+                np.save(os.path.join(tmp_path, 'row_hashes.npy'), row_hashes)
+            os.rename(tmp_path, path)
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+        nbytes = int(data.memory_usage(index=True, deep=True).sum())
+        with self._connection() as conn:
+            row = conn.execute('SELECT path FROM shared_datasets WHERE user_id = ? AND dataset_id = ?',
+                               (str(user_id), dataset_id)).fetchone()
+            now = time.time()
+            conn.execute('INSERT OR REPLACE INTO shared_datasets (user_id, dataset_id, version, path, nbytes, '
+                         'updated_at, last_used) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                         (str(user_id), dataset_id, str(version), path, nbytes, now, now))
+        # 已经映射旧版本的进程不受删除影响，映射在关闭前仍然有效
+        if row is not None and row[0] != path:
+            shutil.rmtree(row[0], ignore_errors=True)
+        self._enforce_budget(keep=path)
+        if time.time() - self._last_cleanup >= self.CLEANUP_INTERVAL:
+            self.cleanup()
+        return path
+
+    def lookup(self, user_id, dataset_id):
+        """返回 (版本, 目录)，不存在时返回None，同时更新最近使用时间"""
+        now = time.time()
+        with self._connection() as conn:
+            row = conn.execute('SELECT version, path, last_used FROM shared_datasets '
+                               'WHERE user_id = ? AND dataset_id = ?', (str(user_id), dataset_id)).fetchone()
+            if row is not None and now - row[2] >= self.TOUCH_INTERVAL:
+                conn.execute('UPDATE shared_datasets SET last_used = ? WHERE user_id = ? AND dataset_id = ?',
+                             (now, str(user_id), dataset_id))
+        return (row[0], row[1]) if row is not None else None
+
+    def load(self, path):
+        """以内存映射方式加载数据集，返回 (数据, 增量统计量, 草图, 有序行哈希)"""
+        data = load_frame(path)
+        extras = {}
+        extras_path = os.path.join(path, 'extras.pkl')
+        if os.path.exists(extras_path):
+            with open(extras_path, 'rb') as f:
+                extras = pickle.load(f)
+        hashes_path = os.path.join(path, 'row_hashes.npy')
+        row_hashes = np.load(hashes_path, mmap_mode='r') if os.path.exists(hashes_path) else None
+        return data, extras.get('moments'), extras.get('sketches'), row_hashes
+
+    def remove(self, user_id, dataset_id, version=None):
+        """删除数据集的索引和文件，指定版本时只在索引仍指向该版本时删除"""
+        with self._connection() as conn:
+            row = conn.execute('SELECT version, path FROM shared_datasets WHERE user_id = ? AND dataset_id = ?',
+                               (str(user_id), dataset_id)).fetchone()
+            if row is None or (version is not None and row[0] != str(version)):
+                return
+            conn.execute('DELETE FROM shared_datasets WHERE user_id = ? AND dataset_id = ?',
+                         (str(user_id), dataset_id))
+        shutil.rmtree(row[1], ignore_errors=True)
+
+    def memory_usage(self):
+        """共享目录中（内存文件系统上）的数据集总大小（字节）"""
+        with self._connection() as conn:
+            rows = conn.execute('SELECT path, nbytes FROM shared_datasets').fetchall()
+        return sum(nbytes for path, nbytes in rows if self._in_memory(path))
+
+    def cleanup(self):
+        """删除超过 ttl 未使用的数据集，以及两个目录中索引没有记录的遗留目录"""
+        self._last_cleanup = now = time.time()
+        with self._connection() as conn:
+            if self.ttl is not None:
+                expired = conn.execute('SELECT user_id, dataset_id, version FROM shared_datasets '
+                                       'WHERE last_used < ?', (now - self.ttl,)).fetchall()
+            else:
+                expired = []
+            known = {row[0] for row in conn.execute('SELECT path FROM shared_datasets')}
+        for user_id, dataset_id, version in expired:
+            self.remove(user_id, dataset_id, version=version)
+
+        for folder in (self.root, self.overflow_dir):
+            if folder is None:
+                continue
+            for name in os.listdir(folder):
+                path = os.path.join(folder, name)
+                if path in known:
+                    continue
+                try:
+                    stale = now - os.path.getmtime(path) >= self.ORPHAN_GRACE
+                except FileNotFoundError:
+                    continue
+                if stale:
+                    # 包括写入进程异常退出后留下的临时目录（以 . 开头）
+                    shutil.rmtree(path, ignore_errors=True)
+
+    def list_datasets(self, user_id):
+        """列出某个用户已发布的数据集ID"""
+        with self._connection() as conn:
+            rows = conn.execute('SELECT dataset_id FROM shared_datasets WHERE user_id = ?',
+                                (str(user_id),)).fetchall()
+        return [row[0] for row in rows]
+
+    def _connection(self):
+        """从连接池借出连接，首次使用时创建索引表"""
+        pool = get_pool(self.db_path)
+        if not self._table_ready:
+            with pool.connection() as conn:
+                conn.execute('''
+                CREATE TABLE IF NOT EXISTS shared_datasets (
+                    user_id TEXT NOT NULL,
+                    dataset_id TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    nbytes INTEGER NOT NULL,
+                    updated_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (user_id, dataset_id)
+                )
+                ''')
+            self._table_ready = True
+        return pool.connection()
+
+    def _in_memory(self, path):
+        return os.path.dirname(path) == os.path.normpath(self.root)
+
+    def _enforce_budget(self, keep=None):
+        """共享目录中的数据集超出预算时，按最近使用时间把最旧的数据集移到磁盘或删除"""
+        if self.budget is None:
+            return
+        with self._connection() as conn:
+            rows = conn.execute('SELECT user_id, dataset_id, version, path, nbytes FROM shared_datasets '
+                                'ORDER BY last_used').fetchall()
+        rows = [row for row in rows if self._in_memory(row[3])]
+        used = sum(row[4] for row in rows)
+        for user_id, dataset_id, version, path, nbytes in rows:
+            if used <= self.budget:
+                break
+            if path == keep:
+                continue
+            if self.overflow_dir is None:
+                self.remove(user_id, dataset_id, version=version)
+            else:
+                self._move_to_disk(user_id, dataset_id, path)
+            used -= nbytes
+
+    def _move_to_disk(self, user_id, dataset_id, path):
+        """把数据集目录复制到磁盘并改写索引，再删除内存中的目录
+
+        已映射内存中文件的进程不受影响，下次查询索引时会改为映射磁盘上的文件。
+        """
+        target = os.path.join(self.overflow_dir, os.path.basename(path))
+        tmp_path = os.path.join(self.overflow_dir, f'.{os.path.basename(path)}.{uuid.uuid4().hex}')
+        try:
+            shutil.copytree(path, tmp_path)
+            os.rename(tmp_path, target)
+        except FileNotFoundError:
+            # 已被其他进程移走或替换
+            return
+        except OSError:
+            # 目标目录已存在：其他进程同时在移动同一个数据集
+            pass
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        with self._connection() as conn:
+            moved = conn.execute('UPDATE shared_datasets SET path = ? WHERE user_id = ? AND dataset_id = ? '
+                                 'AND path = ?', (target, str(user_id), dataset_id, path)).rowcount
+        if moved:
+            shutil.rmtree(path, ignore_errors=True)
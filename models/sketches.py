@@ -0,0 +1,311 @@
+import copy
+import numpy as np
+import pandas as pd
+
+
+class KLLSketch:
+    """KLL分位数草图
+
+    每层保存最多 k 个样本，第 h 层样本的权重为 2^h。层满时排序后随机保留奇数位或偶数位
+    的样本并提升到上一层，每次压缩对任意秩查询引入的误差不超过该层权重且期望为0，
+    据此可以给出秩误差的概率上界。草图可以合并。
+    """
+
+    def __init__(self, k=512, seed=0):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self.compactions = [0]
+        self._rng = np.random.default_rng(seed)
+        self._sorted = None
+
+    def update(self, values):
+        """加入一批数值，缺失值会被忽略"""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """合并另一个草图"""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+            self.compactions.append(0)
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+            self.compactions[h] += other.compactions[h]
+        self.n += other.n
+        self._compress()
+        return self
+
+    def quantile(self, q):
+        """返回近似分位数，q 可以是标量或数组"""
+        if self.n == 0:
+            return np.nan
+        if self._sorted is None:
+            items = np.concatenate(self.levels)
+            weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+            order = np.argsort(items, kind='stable')
+            self._sorted = (items[order], np.cumsum(weights[order]))
+        items, cumulative = self._sorted
+        target = np.asarray(q) * cumulative[-1]
+        idx = np.minimum(np.searchsorted(cumulative, target, side='left'), len(items) - 1)
+        return items[idx]
+
+    def rank_error(self, delta=0.01):
+        """以 1-delta 的概率成立的归一化秩误差上界（Hoeffding不等式）"""
+        if self.n == 0:
+            return 0.0
+        variance = sum(count * 4.0 ** h for h, count in enumerate(self.compactions))
+        return float(np.sqrt(2 * variance * np.log(2 / delta)) / self.n)
+
+    def _compress(self):
+        """逐层压缩超出容量的缓冲区"""
+        self._sorted = None
+        h = 0
+        while h < len(self.levels):
+            items = self.levels[h]
+            if len(items) > self.k:
+                items = np.sort(items)
+                # 奇数个样本时留下一个，其余两两合并
+                leftover = len(items) % 2
+                offset = int(self._rng.integers(2))
+                promoted = items[leftover:][offset::2]
+                self.levels[h] = items[:leftover]
+                self.compactions[h] += 1
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                    self.compactions.append(0)
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+            h += 1
+
+
+class HyperLogLog:
+    """HyperLogLog唯一值计数草图，相对标准误差约为 1.04/sqrt(2^p)"""
+
+    def __init__(self, p=14):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def update_hashes(self, hashes):
+        """加入一批64位哈希值"""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if len(hashes) == 0:
+            return self
+        tail_bits = 64 - self.p
+        idx = (hashes >> np.uint64(tail_bits)).astype(np.intp)
+        tail = hashes & np.uint64((1 << tail_bits) - 1)
+        # tail 不超过50位，转换为浮点数是精确的，frexp 的指数即为二进制位数
+        bit_length = np.frexp(tail.astype(np.float64))[1]
+        rank = (tail_bits - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, idx, rank)
+        return self
+
+    def update(self, values):
+        """加入一批取值（需已去除缺失值）"""
+        return self.update_hashes(pd.util.hash_array(np.asarray(values)))
+
+    def merge(self, other):
+        """合并另一个草图"""
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        """估计唯一值数量"""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros > 0:
+            # 小基数时使用线性计数修正
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+    def relative_error(self):
+        """估计值的相对标准误差"""
+        return 1.04 / np.sqrt(len(self.registers))
+
+
+class MisraGries:
+    """Misra-Gries高频项草图
+
+    每个计数的估计值不大于真实值，且低估量不超过 error。
+    """
+
+    def __init__(self, k=64):
+        self.k = k
+        self.n = 0
+        self.error = 0
+        self.counters = {}
+
+    def update_counts(self, counts):
+        """加入一批频数统计（取值 -> 次数）"""
+        for value, count in counts.items():
+            self.counters[value] = self.counters.get(value, 0) + int(count)
+            self.n += int(count)
+        self._prune()
+        return self
+
+    def merge(self, other):
+        """合并另一个草图"""
+        self.n += other.n
+        self.error += other.error
+        for value, count in other.counters.items():
+            self.counters[value] = self.counters.get(value, 0) + count
+        self._prune()
+        return self
+
+    def top(self, limit):
+        """返回估计频数最高的若干项"""
+        return sorted(self.counters.items(), key=lambda item: -item[1])[:limit]
+
+    def _prune(self):
+        """计数器超过k个时整体减去第k+1大的计数"""
+        if len(self.counters) <= self.k:
+            return
+        ordered = sorted(self.counters.items(), key=lambda item: -item[1])
+        cut = ordered[self.k][1]
+        self.error += cut
+        self.counters = {value: count - cut for value, count in ordered[:self.k] if count > cut}
+
+
+class ColumnSketch:
+    """单列的草图集合：计数、唯一值、数值列的矩和分位数、分类列的高频项"""
+
+    def __init__(self, kind):
+        self.kind = kind  # 'numeric' 或 'categorical'
+        self.count = 0
+        self.null_count = 0
+        self.distinct = HyperLogLog()
+        if kind == 'numeric':
+            self.quantiles = KLLSketch()
+            self.mean = 0.0
+            self.m2 = 0.0
+            self.min = np.inf
+            self.max = -np.inf
+        else:
+            self.heavy_hitters = MisraGries()
+
+    def update(self, series):
+        """用一批数据更新草图"""
+        values = series.dropna()
+        self.null_count += len(series) - len(values)
+        if len(values) == 0:
+            return self
+        if self.kind == 'numeric':
+            array = values.to_numpy(dtype=np.float64)
+            self.quantiles.update(array)
+            self._merge_moments(len(array), array.mean(), ((array - array.mean()) ** 2).sum(),
+                                array.min(), array.max())
+            # 统一按float64取哈希，整数列追加后升级类型也不会重复计数
+            self.distinct.update(array)
+        else:
+            counts = values.value_counts(sort=False)
+            self.heavy_hitters.update_counts(counts[counts > 0])
+            self.distinct.update_hashes(pd.util.hash_pandas_object(values, index=False).to_numpy())
+        self.count += len(values)
+        return self
+
+    def merge(self, other):
+        """合并另一个同类型的列草图"""
+        self.null_count += other.null_count
+        self.distinct.merge(other.distinct)
+        if self.kind == 'numeric':
+            self.quantiles.merge(other.quantiles)
+            if other.count:
+                self._merge_moments(other.count, other.mean, other.m2, other.min, other.max)
+        else:
+            self.heavy_hitters.merge(other.heavy_hitters)
+        self.count += other.count
+        return self
+
+    def _merge_moments(self, n_new, new_mean, new_m2, new_min, new_max):
+        """合并均值和二阶中心矩"""
+        total = self.count + n_new
+        delta = new_mean - self.mean
+        self.m2 += new_m2 + delta * delta * self.count * n_new / total
+        self.mean += delta * n_new / total
+        self.min = min(self.min, float(new_min))
+        self.max = max(self.max, float(new_max))
+
+
+class DatasetSketches:
+    """整个数据集的列草图，在数据上传时构建，追加数据时增量更新"""
+
+    def __init__(self):
+        self.columns = {}
+        self.dtypes = {}
+
+    @classmethod
+    def from_frame(cls, data, chunk_rows=100000):
+        """分块扫描数据框构建草图"""
+        return cls().update_frame(data, chunk_rows=chunk_rows)
+
+    def update_frame(self, data, chunk_rows=100000):
+        """用新的数据行更新草图"""
+        for col in data.columns:
+            series = data[col]
+            kind = _column_kind(series)
+            sketch = self.columns.get(col)
+            if sketch is None:
+                sketch = self.columns[col] = ColumnSketch(kind)
+            elif sketch.kind != kind:
+                raise ValueError(f"列 {col} 的类型已变化，无法增量更新草图")
+            self.dtypes[col] = str(series.dtype)
+            for start in range(0, len(series), chunk_rows):
+                sketch.update(series.iloc[start:start + chunk_rows])
+        return self
+
+    def compatible(self, data):
+        """判断新数据的列和类型是否与草图一致，一致时才能增量更新"""
+        return set(data.columns) == set(self.columns) and \
+            all(self.columns[col].kind == _column_kind(data[col]) for col in data.columns)
+
+    def copy(self):
+        """深拷贝草图，避免修改旧快照持有的对象"""
+        return copy.deepcopy(self)
+
+    def summary(self, col):
+        """返回单列的近似描述性统计和误差范围"""
+        sketch = self.columns[col]
+        result = {
+            '非空值数量': int(sketch.count),
+            '空值数量': int(sketch.null_count),
+            '唯一值数量': min(sketch.distinct.count(), int(sketch.count)),
+            '数据类型': self.dtypes[col]
+        }
+        errors = {'唯一值数量相对误差': float(sketch.distinct.relative_error())}
+
+        if sketch.kind == 'numeric' and sketch.count:
+            q1, q2, q3 = sketch.quantiles.quantile([0.25, 0.5, 0.75])
+            result.update({
+                '平均值': float(sketch.mean),
+                '中位数': float(q2),
+                '标准差': float(np.sqrt(sketch.m2 / (sketch.count - 1))) if sketch.count > 1 else float('nan'),
+                '最小值': float(sketch.min),
+                '最大值': float(sketch.max),
+                '四分位数': {'Q1': float(q1), 'Q2': float(q2), 'Q3': float(q3)}
+            })
+            errors['分位数秩误差'] = sketch.quantiles.rank_error()
+        elif sketch.kind == 'categorical' and sketch.heavy_hitters.counters:
+            top = sketch.heavy_hitters.top(5)
+            result.update({
+                '最常见值': {'值': str(top[0][0]), '计数': int(top[0][1])},
+                '类别分布': {str(value): int(count) for value, count in top}
+            })
+            # 估计频数不高于真实值，且最多低估该数量
+            errors['频数低估上限'] = int(sketch.heavy_hitters.error)
+
+        result['误差范围'] = errors
+        return result
+
+
+def _column_kind(series):
+    """草图按数值列和分类列两种方式统计"""
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return 'numeric'
+    return 'categorical'
@@ -1,8 +1,15 @@
 from flask_login import UserMixin
-import sqlite3
+import time
+import threading
 from werkzeug.security import generate_password_hash, check_password_hash
+from models.db import get_pool
 
 class User(UserMixin):
+    CACHE_TTL = 60  # 按ID加载的用户对象缓存时间（秒）
+    CACHE_MAX = 1024  # 缓存的用户数上限
+    _cache = {}  # user_id -> (过期时间, User)
+    _cache_lock = threading.Lock()
+
     def __init__(self, id, username, password_hash):
         self.id = id
         self.username = username
@@ -10,42 +17,55 @@ class User(UserMixin):
 
     @staticmethod
     def get(user_id):
-        conn = sqlite3.connect('data/database.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-        user_data = cursor.fetchone()
-        conn.close()
-        
+        key = str(user_id)
+        now = time.monotonic()
+        with User._cache_lock:
+            cached = User._cache.get(key)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+
+        with get_pool().connection() as conn:
+            user_data = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
+
         if user_data:
-            return User(user_data[0], user_data[1], user_data[2])
+            user = User(user_data[0], user_data[1], user_data[2])
+            with User._cache_lock:
+                User._cache.pop(key, None)
+                User._cache[key] = (now + User.CACHE_TTL, user)
+                # 超出上限时删除最早写入的条目
+                while len(User._cache) > User.CACHE_MAX:
+                    del User._cache[next(iter(User._cache))]
+            return user
         return None
 
     @staticmethod
     def get_by_username(username):
-        conn = sqlite3.connect('data/database.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE username = ?', (username,))
-        user_data = cursor.fetchone()
-        conn.close()
-        
+        with get_pool().connection() as conn:
+            user_data = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
+
         if user_data:
             return User(user_data[0], user_data[1], user_data[2])
         return None
 
     @staticmethod
     def create(username, password):
-        conn = sqlite3.connect('data/database.db')
-        cursor = conn.cursor()
-        
         password_hash = generate_password_hash(password)
-        cursor.execute('INSERT INTO users (username, password_hash) VALUES (?, ?)',
-                      (username, password_hash))
-        
-        user_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        
+        with get_pool().connection() as conn:
+            cursor = conn.execute('INSERT INTO users (username, password_hash) VALUES (?, ?)',
+                                  (username, password_hash))
+            user_id = cursor.lastrowid
+
+        User.invalidate(user_id)
         return User(user_id, username, password_hash)
 
+    @staticmethod
+    def invalidate(user_id=None):
+        """修改用户数据后清除缓存，不传ID时清除全部"""
+        with User._cache_lock:
+            if user_id is None:
+                User._cache.clear()
+            else:
+                User._cache.pop(str(user_id), None)
+
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password) 
\ No newline at end of file
+        return check_password_hash(self.password_hash, password)
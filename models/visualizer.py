@@ -1,26 +1,57 @@
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
 import pandas as pd
 import numpy as np
-import json
+from models.downsampling import lttb, density_grid
+from models.binning import BinningService
+from models.correlation import CorrelationEngine
+from models.result_cache import next_dataset_version
+from models.metrics import stage, observe_size
+
+try:
+    import orjson  # noqa: F401
+    JSON_ENGINE = 'orjson'
+except ImportError:
+    JSON_ENGINE = 'json'
 
 class DataVisualizer:
-    def __init__(self):
+    # 单个图表最多返回的点数
+    MAX_POINTS = 5000
+    # 按视口宽度计算点数预算时每个像素对应的点数
+    POINTS_PER_PIXEL = 2
+    # 数值列柱状图的分箱数
+    BAR_BINS = 10
+    
+    def __init__(self, binning=None, correlation=None):
         self.data = None
+        self.version = None
+        self.binning = binning or BinningService()  # 分箱结果缓存，与分析器共享
+        self.correlation = correlation or CorrelationEngine()  # 相关系数矩阵缓存，与分析器共享
     
     def visualize(self, viz_type, columns, **kwargs):
-        """生成指定类型的可视化"""
+        """生成指定类型的可视化，返回图表的JSON字符串
+        
+        数值数组由plotly编码为base64的typed array，结果可以直接作为响应体返回，
+        不需要再解析和重新序列化。
+        """
+        fig = self.build_figure(viz_type, columns, **kwargs)
+        with stage('viz.serialize'):
+            viz_json = pio.to_json(fig, validate=False, engine=JSON_ENGINE)
+        observe_size('figure', len(viz_json))
+        return viz_json
+    
+    def build_figure(self, viz_type, columns, **kwargs):
+        """生成指定类型的plotly图表对象"""
         if not hasattr(self, f'_viz_{viz_type}'):
             raise ValueError(f"不支持的可视化类型: {viz_type}")
         
         method = getattr(self, f'_viz_{viz_type}')
-        fig = method(columns, **kwargs)
-        
-        # 确保返回的是可序列化的JSON格式
-        return json.loads(fig.to_json())
+        with stage(f'viz.{viz_type}'):
+            return method(columns, **kwargs)
     
-    def _viz_scatter(self, columns):
-        """散点图"""
+    def _viz_scatter(self, columns, viewport_width=None, x_range=None, y_range=None):
+        """散点图，点数超出预算时聚合为密度热力图，缩放后按新范围重新取数"""
         if len(columns) != 2:
             raise ValueError("散点图需要恰好两个列")
         
@@ -28,11 +59,30 @@ class DataVisualizer:
         if not all(pd.api.types.is_numeric_dtype(self.data[col]) for col in columns):
             raise ValueError("散点图需要数值型数据")
         
-        fig = px.scatter(self.data, x=columns[0], y=columns[1],
-                        title=f"{columns[0]} vs {columns[1]}的散点图")
+        x, y = self.data[columns[0]], self.data[columns[1]]
+        mask = self._range_mask(x, x_range) & self._range_mask(y, y_range)
+        if not mask.all():
+            x, y = x[mask], y[mask]
+        
+        budget = self._point_budget(viewport_width)
+        if len(x) <= budget:
+            fig = px.scatter(x=x, y=y, title=f"{columns[0]} vs {columns[1]}的散点图")
+        else:
+            valid = x.notna() & y.notna()
+            counts, x_centers, y_centers = density_grid(x[valid].to_numpy(), y[valid].to_numpy(), budget)
+            fig = go.Figure(data=go.Heatmap(
+                z=np.where(counts > 0, counts, np.nan),
+                x=x_centers,
+                y=y_centers,
+                colorscale='Viridis',
+                colorbar={'title': '点数'}
+            ))
+            fig.update_layout(title=f"{columns[0]} vs {columns[1]}的散点密度图（共{len(x)}个点）")
+        
         fig.update_layout(
             xaxis_title=columns[0],
-            yaxis_title=columns[1]
+            yaxis_title=columns[1],
+            meta=self._downsample_meta(len(x), budget)
         )
         return fig
     
@@ -43,16 +93,25 @@ class DataVisualizer:
         
         column = columns[0]
         if pd.api.types.is_numeric_dtype(self.data[column]):
-            # 数值型数据使用常规直方图
-            fig = px.histogram(self.data, x=column,
-                             title=f"{column}的分布直方图")
+            # 数值型数据使用分箱结果绘制直方图，与分布分析共用同一份分箱
+            histogram = self.binning.histogram(self.version, self.data[column])
+            edges = histogram['edges']
+            fig = go.Figure(data=go.Bar(
+                x=(edges[:-1] + edges[1:]) / 2,
+                y=histogram['counts'],
+                width=np.diff(edges),
+                customdata=self._bin_labels(edges),
+                hovertemplate='%{customdata}<br>频数: %{y}<extra></extra>'
+            ))
             fig.update_layout(
+                title=f"{column}的分布直方图",
                 xaxis_title=column,
-                yaxis_title="频数"
+                yaxis_title="频数",
+                bargap=0
             )
         else:
             # 分类数据使用条形图显示频数
-            value_counts = self.data[column].value_counts()
+            value_counts = self.binning.value_counts(self.version, self.data[column])
             fig = px.bar(x=value_counts.index, y=value_counts.values,
                         title=f"{column}的类别分布")
             fig.update_layout(
@@ -68,22 +127,48 @@ class DataVisualizer:
         if not numeric_cols:
             raise ValueError("箱线图需要至少一个数值型列")
         
-        fig = px.box(self.data, y=numeric_cols,
-                     title="数值分布箱线图")
+        # 使用预先计算的四分位数和须线绘制，离群点单独作为散点
+        fig = go.Figure()
+        colors = px.colors.qualitative.Plotly
+        for i, col in enumerate(numeric_cols):
+            box = self.binning.box_stats(self.version, self.data[col])
+            color = colors[i % len(colors)]
+            fig.add_trace(go.Box(
+                x=[col],
+                q1=[box['q1']],
+                median=[box['median']],
+                q3=[box['q3']],
+                lowerfence=[box['lowerfence']],
+                upperfence=[box['upperfence']],
+                mean=[box['mean']],
+                name=col,
+                marker_color=color
+            ))
+            if len(box['outliers']):
+                fig.add_trace(go.Scatter(
+                    x=[col] * len(box['outliers']),
+                    y=box['outliers'],
+                    mode='markers',
+                    name=f'{col}离群点',
+                    marker={'color': color, 'size': 4}
+                ))
         fig.update_layout(
+            title="数值分布箱线图",
             xaxis_title="变量",
-            yaxis_title="数值"
+            yaxis_title="数值",
+            xaxis={'type': 'category'},
+            showlegend=False
         )
         return fig
     
-    def _viz_correlation_heatmap(self, columns):
-        """相关性热力图"""
+    def _viz_correlation_heatmap(self, columns, method='pearson'):
+        """相关性热力图，与相关性分析共用缓存的相关系数矩阵"""
         # 只处理数值型列
         numeric_cols = [col for col in columns if pd.api.types.is_numeric_dtype(self.data[col])]
         if len(numeric_cols) < 2:
             raise ValueError("相关性热力图需要至少两个数值型列")
         
-        corr_matrix = self.data[numeric_cols].corr()
+        corr_matrix = self.correlation.matrix(self.version, self.data, numeric_cols, method)
         
         fig = go.Figure(data=go.Heatmap(
             z=corr_matrix.values,
@@ -100,32 +185,47 @@ class DataVisualizer:
         )
         return fig
     
-    def _viz_line(self, columns, x_column=None):
-        """折线图"""
+    def _viz_line(self, columns, x_column=None, viewport_width=None, x_range=None):
+        """折线图，点数超出预算时用LTTB降采样，缩放后按新范围重新取数"""
         # 如果指定了x轴，检查是否为时间序列
         if x_column and pd.api.types.is_datetime64_any_dtype(self.data[x_column]):
             x_data = self.data[x_column]
         else:
-            x_data = self.data.index
+            x_data = self.data.index.to_series()
         
         # 只处理数值型列
         numeric_cols = [col for col in columns if pd.api.types.is_numeric_dtype(self.data[col])]
         if not numeric_cols:
             raise ValueError("折线图需要至少一个数值型列")
         
+        mask = self._range_mask(x_data, x_range)
+        budget = self._point_budget(viewport_width)
+        total = int(mask.sum())
         fig = go.Figure()
         for col in numeric_cols:
+            valid = mask & self.data[col].notna()
+            x_values, y_values = x_data[valid], self.data[col][valid]
+            if len(x_values) > budget:
+                # LTTB要求x单调，按x排序后再选点
+                order = np.argsort(x_values.to_numpy(), kind='stable')
+                x_values, y_values = x_values.iloc[order], y_values.iloc[order]
+                x_numeric = x_values.to_numpy()
+                if pd.api.types.is_datetime64_any_dtype(x_values):
+                    x_numeric = x_numeric.view(np.int64)
+                selected = lttb(x_numeric, y_values.to_numpy(dtype=np.float64), budget)
+                x_values, y_values = x_values.iloc[selected], y_values.iloc[selected]
             fig.add_trace(go.Scatter(
-                x=x_data,
-                y=self.data[col],
+                x=x_values,
+                y=y_values,
                 name=col,
-                mode='lines+markers'
+                mode='lines+markers' if len(x_values) <= budget // 10 else 'lines'
             ))
         
         fig.update_layout(
             title="时间序列分析" if pd.api.types.is_datetime64_any_dtype(x_data) else "趋势分析",
             xaxis_title=x_column if x_column else "索引",
-            yaxis_title="数值"
+            yaxis_title="数值",
+            meta=self._downsample_meta(total, budget)
         )
         return fig
     
@@ -135,15 +235,14 @@ class DataVisualizer:
             column = columns[0]
             if pd.api.types.is_numeric_dtype(self.data[column]):
                 # 数值型数据，显示分布
-                bins = pd.cut(self.data[column], bins=10)
-                value_counts = bins.value_counts().sort_index()
-                fig = px.bar(x=[str(x) for x in value_counts.index], 
-                            y=value_counts.values,
+                histogram = self.binning.histogram(self.version, self.data[column], self.BAR_BINS)
+                fig = px.bar(x=self._bin_labels(histogram['edges']),
+                            y=histogram['counts'],
                             title=f"{column}的分布柱状图")
             else:
                 # 分类数据，显示频数
                 # 确保使用原始数据进行计数
-                value_counts = pd.DataFrame(self.data[column].value_counts()).reset_index()
+                value_counts = pd.DataFrame(self.binning.value_counts(self.version, self.data[column])).reset_index()
                 value_counts.columns = ['category', 'count']
                 
                 # 创建柱状图
@@ -214,29 +313,67 @@ class DataVisualizer:
             raise ValueError("饼图需要恰好一个列")
         
         column = columns[0]
-        value_counts = self.data[column].value_counts()
+        value_counts = self.binning.value_counts(self.version, self.data[column])
         
         if len(value_counts) > 10:
-            # 如果类别太多，只显示前10个
+            # 如果类别太多，只显示前10个（缓存的频数是共享的，合并为新的Series）
             other_count = value_counts[10:].sum()
-            value_counts = value_counts[:10]
-            value_counts['其他'] = other_count
+            value_counts = pd.concat([value_counts[:10], pd.Series({'其他': other_count})])
         
         fig = px.pie(values=value_counts.values, 
                     names=value_counts.index,
                     title=f"{column}的占比分布")
         return fig
     
-    def set_data(self, data):
-        """设置要可视化的数据"""
+    def _point_budget(self, viewport_width=None):
+        """计算单个图表的点数预算，随视口宽度缩放，不超过 MAX_POINTS"""
+        if viewport_width:
+            return max(min(self.MAX_POINTS, int(viewport_width) * self.POINTS_PER_PIXEL), 100)
+        return self.MAX_POINTS
+    
+    @staticmethod
+    def _range_mask(values, value_range):
+        """选出落在缩放范围内的行，未指定范围时全部保留"""
+        if not value_range:
+            return pd.Series(True, index=values.index)
+        low, high = value_range
+        if pd.api.types.is_datetime64_any_dtype(values):
+            low, high = pd.Timestamp(low), pd.Timestamp(high)
+        return (values >= low) & (values <= high)
+    
+    @staticmethod
+    def _bin_labels(edges):
+        """分箱区间的文字标签，区间左闭右开，最后一个区间为闭区间"""
+        labels = [f'[{low:.6g}, {high:.6g})' for low, high in zip(edges[:-1], edges[1:])]
+        if labels:
+            labels[-1] = labels[-1][:-1] + ']'
+        return labels
+    
+    @staticmethod
+    def _downsample_meta(total_points, budget):
+        """图表元信息，前端据此决定缩放时是否重新请求原始数据"""
+        return {
+            'total_points': int(total_points),
+            'point_budget': int(budget),
+            'downsampled': bool(total_points > budget)
+        }
+    
+    def set_data(self, data, version=None):
+        """设置要可视化的数据，version 为数据集版本，用作分箱缓存的键"""
         if data is None or data.empty:
             raise ValueError("数据为空，无法设置")
-        self.data = data.copy(deep=True)
-        # 将日期列转换为datetime类型
-        for col in self.data.columns:
-            if col == '日期':  # 只处理日期列
-                try:
-                    self.data[col] = pd.to_datetime(self.data[col], format='%Y-%m-%d')
-                except Exception as e:
-                    raise ValueError(f"日期列转换失败: {str(e)}")
+        if self.version is not None and self.version != version:
+            self.binning.invalidate(self.version)
+            self.correlation.invalidate(self.version)
+        # 直接引用共享的数据集，不复制
+        self.data = data
+        self.version = version if version is not None else next_dataset_version()
+        # 日期列不是datetime类型时转换，转换结果叠加在浅拷贝上，其余列仍与原数据共享
+        if '日期' in data.columns and not pd.api.types.is_datetime64_any_dtype(data['日期']):
+            try:
+                converted = pd.to_datetime(data['日期'], format='%Y-%m-%d')
+            except Exception as e:
+                raise ValueError(f"日期列转换失败: {str(e)}")
+            self.data = data.copy(deep=False)
+            self.data['日期'] = converted
         return self
\ No newline at end of file
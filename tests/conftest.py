@@ -0,0 +1,131 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from models.ai_explainer import AIExplainer
+from models.explanation_cache import ExplanationCache
+
+
+class OpenAIStub:
+    """本地的OpenAI兼容接口，记录上游调用次数
+
+    流式回复逐段发送 chunks；pause_after 不为None时发送该段后暂停，调用 release() 后继续，
+    暂停期间定期发送SSE注释以便发现客户端断开。empty 为True时回复没有内容。
+    """
+
+    def __init__(self, chunks=('数据', '分布', '均匀'), delay=0.0, pause_after=None, empty=False):
+        self.chunks = [] if empty else list(chunks)
+        self.empty = empty
+        self.delay = delay
+        self.pause_after = pause_after
+        self.calls = []
+        self.completed = 0
+        self.disconnected = threading.Event()
+        self._released = threading.Event()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self._server.server_address[1]}/v1'
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._released.set()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def release(self):
+        self._released.set()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with stub._lock:
+                    stub.calls.append(body)
+                    number = len(stub.calls)
+                time.sleep(stub.delay)
+                if body.get('stream'):
+                    self._stream(body)
+                else:
+                    self._complete(body, None if stub.empty else f'解释#{number}')
+
+            def _complete(self, body, content):
+                data = json.dumps({
+                    'id': 'stub', 'object': 'chat.completion', 'created': 0, 'model': body['model'],
+                    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                                 'finish_reason': 'stop'}],
+                    'usage': {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2}
+                }).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, body):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                try:
+                    for i, text in enumerate(stub.chunks):
+                        chunk = {'id': 'stub', 'object': 'chat.completion.chunk', 'created': 0,
+                                 'model': body['model'],
+                                 'choices': [{'index': 0, 'delta': {'content': text}, 'finish_reason': None}]}
+                        self._send(f'data: {json.dumps(chunk)}\n\n')
+                        if i == stub.pause_after:
+                            while not stub._released.wait(0.05):
+                                self._send(': ping\n\n')
+                    self._send('data: [DONE]\n\n')
+                    with stub._lock:
+                        stub.completed += 1
+                except (BrokenPipeError, ConnectionResetError):
+                    stub.disconnected.set()
+                self.close_connection = True
+
+            def _send(self, text):
+                self.wfile.write(text.encode('utf-8'))
+                self.wfile.flush()
+
+        return Handler
+
+
+@pytest.fixture
+def openai_stub(monkeypatch):
+    """返回启动本地接口的函数，并把 DASHSCOPE_BASE_URL 指向它"""
+    stubs = []
+
+    def start(**options):
+        stub = OpenAIStub(**options).start()
+        monkeypatch.setenv('DASHSCOPE_BASE_URL', stub.url)
+        stubs.append(stub)
+        return stub
+
+    yield start
+    for stub in stubs:
+        stub.stop()
+
+
+@pytest.fixture
+def make_explainer(tmp_path):
+    """创建使用临时数据库缓存的AI解释器"""
+
+    def make(**cache_options):
+        cache = ExplanationCache(db_path=str(tmp_path / 'cache.db'), **cache_options)
+        return AIExplainer(api_key='test', cache=cache)
+
+    return make
@@ -0,0 +1,82 @@
+import threading
+import time
+
+RESULT = {'a': {'mean': 1.0, 'std': 0.5}}
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('等待超时')
+        time.sleep(0.01)
+
+
+def _subscribers(explainer):
+    return sum(shared.subscribers for shared in list(explainer.cache._streams.values()))
+
+
+def test_stream_is_incremental_and_cached_after_completion(openai_stub, make_explainer):
+    stub = openai_stub(pause_after=0)
+    explainer = make_explainer()
+
+    stream = explainer.stream_explanation('distribution', RESULT, ['a'])
+    # 上游暂停时已经能收到第一段
+    assert next(stream) == '数据'
+    assert explainer.cache.stats()['entries'] == 0
+
+    stub.release()
+    assert ''.join(stream) == '分布均匀'
+    assert explainer.cache.stats()['entries'] == 1
+
+    # 第二次请求直接从缓存一次返回完整内容
+    assert list(explainer.stream_explanation('distribution', RESULT, ['a'])) == ['数据分布均匀']
+    assert len(stub.calls) == 1
+
+
+def test_closing_stream_closes_upstream_and_skips_cache(openai_stub, make_explainer):
+    stub = openai_stub(pause_after=0)
+    explainer = make_explainer()
+
+    stream = explainer.stream_explanation('distribution', RESULT, ['a'])
+    assert next(stream) == '数据'
+    stream.close()
+
+    assert stub.disconnected.wait(5)
+    assert stub.completed == 0
+    assert explainer.cache.stats() == {'entries': 0, 'hits': 0, 'misses': 1, 'inflight': 0}
+
+    # 中断的解释没有写入缓存，再次请求会重新调用模型
+    stub.release()
+    assert ''.join(explainer.stream_explanation('distribution', RESULT, ['a'])) == '数据分布均匀'
+    assert len(stub.calls) == 2
+
+
+def test_concurrent_streams_share_one_upstream_call(openai_stub, make_explainer):
+    stub = openai_stub(pause_after=0)
+    explainer = make_explainer()
+
+    leader = explainer.stream_explanation('distribution', RESULT, ['a'])
+    assert next(leader) == '数据'
+
+    results = []
+
+    def follow():
+        results.append(''.join(explainer.stream_explanation('distribution', RESULT, ['a'])))
+
+    followers = [threading.Thread(target=follow) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    _wait_for(lambda: _subscribers(explainer) == 4)
+
+    # 发起请求的客户端断开后，其余请求继续接收同一个上游流
+    leader.close()
+    stub.release()
+    for thread in followers:
+        thread.join(5)
+
+    assert results == ['数据分布均匀'] * 3
+    assert len(stub.calls) == 1
+    assert stub.completed == 1
+    assert not stub.disconnected.is_set()
+    assert explainer.cache.stats()['entries'] == 1
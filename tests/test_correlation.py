@@ -0,0 +1,19 @@
+import numpy as np
+import pandas as pd
+import pytest
+from models.correlation import strongest_pairs
+
+
+def _matrix():
+    values = np.array([[1.0, 0.9, -0.2], [0.9, 1.0, 0.5], [-0.2, 0.5, 1.0]])
+    return pd.DataFrame(values, index=list('abc'), columns=list('abc'))
+
+
+def test_top_k_returns_strongest_pairs():
+    assert strongest_pairs(_matrix(), top_k='2') == [('a', 'b', 0.9), ('b', 'c', 0.5)]
+
+
+@pytest.mark.parametrize('top_k', [0, -1, '-2', 1.5, 'x'])
+def test_top_k_below_one_is_rejected(top_k):
+    with pytest.raises(ValueError, match='top_k'):
+        strongest_pairs(_matrix(), top_k=top_k)
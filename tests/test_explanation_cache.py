@@ -0,0 +1,89 @@
+import threading
+import time
+import pytest
+from models import explanation_cache
+
+RESULT = {'a': {'mean': 1.0, 'std': 0.5}}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = time.time()
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(explanation_cache, 'time', fake)
+    return fake
+
+
+def test_concurrent_identical_prompts_call_model_once(openai_stub, make_explainer):
+    stub = openai_stub(delay=0.3)
+    explainer = make_explainer()
+
+    results = []
+
+    def explain():
+        results.append(explainer.generate_explanation('distribution', RESULT, ['a']))
+
+    threads = [threading.Thread(target=explain) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert results == ['解释#1'] * 5
+    assert len(stub.calls) == 1
+    assert explainer.cache.stats() == {'entries': 1, 'hits': 4, 'misses': 1, 'inflight': 0}
+
+
+def test_expired_entries_call_model_again(openai_stub, make_explainer, clock):
+    stub = openai_stub()
+    explainer = make_explainer(ttl=60)
+
+    assert explainer.generate_explanation('distribution', RESULT, ['a']) == '解释#1'
+    clock.now += 59
+    assert explainer.generate_explanation('distribution', RESULT, ['a']) == '解释#1'
+    assert len(stub.calls) == 1
+
+    clock.now += 2
+    assert explainer.generate_explanation('distribution', RESULT, ['a']) == '解释#2'
+    assert len(stub.calls) == 2
+
+
+def test_least_recently_used_entries_are_evicted(openai_stub, make_explainer, clock):
+    stub = openai_stub()
+    explainer = make_explainer(max_entries=2)
+
+    def explain(column):
+        clock.now += 1
+        return explainer.generate_explanation('distribution', RESULT, [column])
+
+    assert explain('a') == '解释#1'
+    assert explain('b') == '解释#2'
+    # 读取a后b成为最久未使用的条目
+    assert explain('a') == '解释#1'
+    assert explain('c') == '解释#3'
+    assert explainer.cache.stats()['entries'] == 2
+    assert len(stub.calls) == 3
+
+    assert explain('a') == '解释#1'
+    assert explain('b') == '解释#4'
+    assert len(stub.calls) == 4
+
+
+def test_empty_completions_return_error_and_are_not_cached(openai_stub, make_explainer):
+    stub = openai_stub(empty=True)
+    explainer = make_explainer()
+
+    assert explainer.generate_explanation('distribution', RESULT, ['a']) == '生成解释时出错: 模型没有返回内容'
+    with pytest.raises(ValueError, match='模型没有返回内容'):
+        list(explainer.stream_explanation('distribution', RESULT, ['a']))
+
+    assert explainer.cache.stats()['entries'] == 0
+    assert explainer.generate_explanation('distribution', RESULT, ['a']) == '生成解释时出错: 模型没有返回内容'
+    assert len(stub.calls) == 3
@@ -0,0 +1,33 @@
+import threading
+import time
+from models.job_manager import Job, JobManager, JobStore
+
+
+def test_job_of_dead_process_is_marked_failed(tmp_path):
+    store = JobStore(db_path=str(tmp_path / 'jobs.db'), stale_after=0.2)
+    # 模拟在另一个已退出的进程中运行的任务：状态停在running，之后不再有心跳
+    job = Job('1', store=store)
+    job.update(status='running', stage='running')
+
+    other = JobManager(store=store)
+    latest = other.wait_for_update(other.get(job.id, '1'), job.seq, timeout=2)
+
+    assert latest.status == 'failed'
+    assert latest.error == '执行任务的进程已退出'
+    assert latest.seq > job.seq
+
+
+def test_running_job_keeps_heartbeat(tmp_path, monkeypatch):
+    monkeypatch.setattr(JobManager, 'HEARTBEAT_INTERVAL', 0.05)
+    store = JobStore(db_path=str(tmp_path / 'jobs.db'), stale_after=0.3)
+    release = threading.Event()
+    manager = JobManager(store=store)
+    job = manager.submit('1', lambda job: release.wait(5))
+
+    # 其他进程读取时任务仍在运行，不会因为长时间没有进度更新被标记为失败
+    time.sleep(1)
+    assert JobManager(store=store).get(job.id, '1').status == 'running'
+
+    release.set()
+    job.future.result(5)
+    assert JobManager(store=store).get(job.id, '1').status == 'completed'
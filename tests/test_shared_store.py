@@ -0,0 +1,69 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from models.dataset_registry import DatasetRegistry
+from models.shared_store import SharedDatasetStore
+
+
+def _frame(rows=1000):
+    return pd.DataFrame({'a': np.arange(rows, dtype=np.float64), 'b': np.arange(rows, dtype=np.int64)})
+
+
+@pytest.fixture
+def make_store(tmp_path):
+    def make(**options):
+        return SharedDatasetStore(str(tmp_path / 'shm'), db_path=str(tmp_path / 'index.db'), **options)
+    return make
+
+
+def test_least_recently_used_datasets_move_to_disk_over_budget(make_store, tmp_path):
+    size = int(_frame().memory_usage(index=True, deep=True).sum())
+    store = make_store(budget=2 * size, overflow_dir=str(tmp_path / 'disk'))
+    registry = DatasetRegistry(spill_dir=str(tmp_path / 'spill'), store=store)
+
+    for dataset_id in ('a', 'b', 'c'):
+        registry.put('1', _frame(), dataset_id=dataset_id)
+
+    assert store.memory_usage() == 2 * size
+    assert len(os.listdir(tmp_path / 'shm')) == 2
+    version, path = store.lookup('1', 'a')
+    assert os.path.dirname(path) == str(tmp_path / 'disk')
+    # 移到磁盘后仍能读取，版本不变
+    snapshot = registry.get('1', 'a')
+    assert snapshot.version == version and snapshot.path == path
+    assert snapshot.data.equals(_frame())
+
+
+def test_without_overflow_dir_datasets_over_budget_are_removed(make_store):
+    size = int(_frame().memory_usage(index=True, deep=True).sum())
+    store = make_store(budget=size)
+    store.publish('1', 'a', _frame(), 'v1')
+    store.publish('2', 'a', _frame(), 'v2')
+
+    assert store.lookup('1', 'a') is None
+    assert store.lookup('2', 'a')[0] == 'v2'
+    assert store.memory_usage() == size
+
+
+def test_cleanup_removes_expired_datasets_and_leftovers(make_store, tmp_path):
+    store = make_store(ttl=3600)
+    path = store.publish('1', 'a', _frame(), 'v1')
+    store.publish('1', 'b', _frame(), 'v2')
+    leftover = tmp_path / 'shm' / '.v3.0123'
+    leftover.mkdir()
+    recent = tmp_path / 'shm' / 'v4'
+    recent.mkdir()
+    old = time.time() - 2 * store.ORPHAN_GRACE
+    os.utime(leftover, (old, old))
+
+    with store._connection() as conn:
+        conn.execute("UPDATE shared_datasets SET last_used = ? WHERE dataset_id = 'a'", (old,))
+    store.cleanup()
+
+    assert store.lookup('1', 'a') is None and not os.path.exists(path)
+    assert store.lookup('1', 'b') is not None
+    assert not leftover.exists()
+    # 刚创建的目录可能正在发布，不会被当作遗留目录删除
+    assert recent.exists()